@@ -1,9 +1,13 @@
 # app/api/v1/commands.py
-from fastapi import APIRouter, Depends, HTTPException, status
-from pydantic import BaseModel
-from typing import Dict
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from datetime import datetime, timedelta, timezone
+from pydantic import BaseModel, field_validator, model_validator
+from typing import Dict, List, Optional
 from app.domain.services_async import TaskServiceAsync
 from app.infra.db.repo_async import AsyncTaskRepository
+from app.infra.event_bus.lanes import lane_weights
+from app.infra.redis.idempotency import get_idempotency_store
+from app.settings import settings
 
 router = APIRouter(prefix="/v1/tasks", tags=["tasks"])
 
@@ -11,20 +15,99 @@ router = APIRouter(prefix="/v1/tasks", tags=["tasks"])
 class CreateTaskRequest(BaseModel):
     name: str
     payload: Dict = {}
+    priority: Optional[str] = None  # a lane of PRIORITY_LANES; default lane if omitted
+    run_at: Optional[datetime] = None  # deliver at this time ...
+    delay_seconds: Optional[float] = None  # ... or after this delay
+
+    @field_validator("priority")
+    @classmethod
+    def known_lane(cls, v):
+        if v is not None and v not in lane_weights():
+            raise ValueError(f"priority must be one of {list(lane_weights())}")
+        return v
+
+    @field_validator("delay_seconds")
+    @classmethod
+    def non_negative(cls, v):
+        if v is not None and v < 0:
+            raise ValueError("delay_seconds must be >= 0")
+        return v
+
+    @model_validator(mode="after")
+    def one_schedule(self):
+        if self.run_at is not None and self.delay_seconds is not None:
+            raise ValueError("give either run_at or delay_seconds, not both")
+        return self
+
+    def due_at(self) -> Optional[datetime]:
+        """absolute due time; None = run now"""
+        if self.delay_seconds:
+            return datetime.now(timezone.utc) + timedelta(seconds=self.delay_seconds)
+        if self.run_at is not None and self.run_at.tzinfo is None:
+            # naive timestamps are taken as UTC
+            return self.run_at.replace(tzinfo=timezone.utc)
+        return self.run_at
+
+
+class CreateTasksBatchRequest(BaseModel):
+    tasks: List[CreateTaskRequest]
 
 
 # dependency factory
 def get_task_service() -> TaskServiceAsync:
     repo = AsyncTaskRepository()
-    return TaskServiceAsync(repo)
+    return TaskServiceAsync(repo, idempotency=get_idempotency_store())
+
+
+IdempotencyKey = Header(None, alias="Idempotency-Key", min_length=1, max_length=255)
+REPLAYED_HEADER = "Idempotent-Replayed"
 
 
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def create_task(
-    req: CreateTaskRequest, svc: TaskServiceAsync = Depends(get_task_service)
+    req: CreateTaskRequest,
+    response: Response,
+    idempotency_key: Optional[str] = IdempotencyKey,
+    svc: TaskServiceAsync = Depends(get_task_service),
 ):
     try:
-        task = await svc.create_task(req.name, req.payload)
+        if idempotency_key is not None:
+            # keys are scoped per endpoint
+            ids, replayed = await svc.create_tasks_once(
+                f"task:{idempotency_key}",
+                [(req.name, req.payload, req.priority, req.due_at())],
+            )
+            if replayed:
+                response.headers[REPLAYED_HEADER] = "true"
+            return {"id": str(ids[0]), "status": "created"}
+        task = await svc.create_task(req.name, req.payload, req.priority, req.due_at())
         return {"id": str(task.id), "status": "created"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post(":batch", status_code=status.HTTP_201_CREATED)
+async def create_tasks_batch(
+    req: CreateTasksBatchRequest,
+    response: Response,
+    idempotency_key: Optional[str] = IdempotencyKey,
+    svc: TaskServiceAsync = Depends(get_task_service),
+):
+    if len(req.tasks) > settings.task_batch_max_size:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"at most {settings.task_batch_max_size} tasks per batch",
+        )
+    items = [(t.name, t.payload, t.priority, t.due_at()) for t in req.tasks]
+    try:
+        if idempotency_key is not None:
+            ids, replayed = await svc.create_tasks_once(
+                f"batch:{idempotency_key}", items
+            )
+            if replayed:
+                response.headers[REPLAYED_HEADER] = "true"
+            return {"ids": [str(i) for i in ids], "status": "created"}
+        tasks = await svc.create_tasks(items)
+        return {"ids": [str(t.id) for t in tasks], "status": "created"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
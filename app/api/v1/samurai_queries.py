@@ -1,9 +1,14 @@
 # app/api/v1/queries.py
-from fastapi import APIRouter, Depends, HTTPException
-from typing import Optional
+import base64
+import uuid
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
 from pydantic import BaseModel
 from app.domain.services_async import TaskServiceAsync
 from app.infra.db.repo_async import AsyncTaskRepository
+from app.infra.redis.task_cache import get_task_cache
+from app.settings import settings
 
 router = APIRouter(prefix="/v1/tasks", tags=["tasks"])
 
@@ -17,22 +22,73 @@ class TaskRead(BaseModel):
     last_error: Optional[str] = None
 
 
+class TaskPage(BaseModel):
+    items: List[TaskRead]
+    next_cursor: Optional[str] = None
+
+
 def get_task_service() -> TaskServiceAsync:
     repo = AsyncTaskRepository()
-    return TaskServiceAsync(repo)
+    return TaskServiceAsync(repo, cache=get_task_cache())
+
+
+def _to_read(t) -> TaskRead:
+    return TaskRead(
+        id=str(t.id),
+        name=t.name,
+        payload=t.payload,
+        state=t.state,
+        attempts=t.attempts,
+        last_error=t.last_error,
+    )
+
+
+def encode_cursor(created_at: datetime, task_id) -> str:
+    raw = f"{created_at.isoformat()}|{task_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    created_at, task_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(created_at), uuid.UUID(task_id)
+
+
+@router.get("", response_model=TaskPage)
+async def list_tasks(
+    state: Optional[str] = None,
+    name: Optional[str] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1),
+    svc: TaskServiceAsync = Depends(get_task_service),
+):
+    limit = min(limit, settings.task_list_max_limit)
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+    # one extra row tells whether there is a next page
+    tasks = await svc.list_tasks(
+        state=state,
+        name=name,
+        created_from=created_from,
+        created_to=created_to,
+        after=after,
+        limit=limit + 1,
+    )
+    next_cursor = None
+    if len(tasks) > limit:
+        tasks = tasks[:limit]
+        next_cursor = encode_cursor(tasks[-1].created_at, tasks[-1].id)
+    return TaskPage(items=[_to_read(t) for t in tasks], next_cursor=next_cursor)
 
 
 @router.get("/{task_id}", response_model=TaskRead)
 async def get_task(task_id: str, svc: TaskServiceAsync = Depends(get_task_service)):
     try:
         t = await svc.get_task(task_id)
-        return TaskRead(
-            id=str(t.id),
-            name=t.name,
-            payload=t.payload,
-            state=t.state,
-            attempts=t.attempts,
-            last_error=t.last_error,
-        )
+        return _to_read(t)
     except Exception as e:
         raise HTTPException(status_code=404, detail="task not found")
@@ -5,3 +5,11 @@ class DomainError(Exception):
 
 class TaskNotFoundError(DomainError):
     pass
+
+
+class TaskStateConflictError(DomainError):
+    """the task is no longer in the state / version the transition expected"""
+
+
+class StaleFencingTokenError(TaskStateConflictError):
+    """a newer lock holder already wrote the task"""
@@ -5,6 +5,23 @@ from typing import Dict, Optional
 import uuid
 
 
+class TaskState:
+    """
+    pending -> running -> processed | failed
+    a failed attempt below the retry limit goes running -> retrying -> running
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    RETRYING = "retrying"
+    PROCESSED = "processed"
+    FAILED = "failed"
+
+    # a worker may start a task in these states
+    CLAIMABLE = (PENDING, RETRYING)
+    TERMINAL = (PROCESSED, FAILED)
+
+
 @dataclass
 class Task:
     """
@@ -14,9 +31,10 @@ class Task:
     id: uuid.UUID
     name: str
     payload: Dict
-    state: str = "pending"
+    state: str = TaskState.PENDING
     attempts: int = 0
     last_error: Optional[str] = None
+    version: int = 0
     created_at: datetime = field(default_factory=datetime.utcnow)
     updated_at: datetime = field(default_factory=datetime.utcnow)
 
@@ -1,7 +1,13 @@
 # app/domain/services_async.py
 
 from app.domain.models import Task as DomainTask
+from app.domain.exceptions import TaskNotFoundError
 from app.infra.db.repo_async import AsyncTaskRepository
+from app.infra.event_bus.lanes import lane_base
+from app.infra.redis.idempotency import IDEMPOTENCY_REPLAYS, IdempotencyStore
+from app.infra.redis.task_cache import TaskCache, MISSING
+from datetime import datetime
+from typing import List, Optional, Tuple
 import uuid
 
 
@@ -10,18 +16,111 @@ class TaskServiceAsync:
     سرویس بیزینسی async — وابسته به رابط repository async
     """
 
-    def __init__(self, repo: AsyncTaskRepository):
+    def __init__(
+        self,
+        repo: AsyncTaskRepository,
+        cache: Optional[TaskCache] = None,
+        idempotency: Optional[IdempotencyStore] = None,
+    ):
         self.repo = repo
+        self.cache = cache
+        self.idempotency = idempotency
 
-    async def create_task(self, name: str, payload: dict) -> DomainTask:
-        task = DomainTask(id=uuid.uuid4(), name=name, payload=payload)
-        outbox_event = {
-            "stream": "tasks:events",
+    @staticmethod
+    def _created_event(
+        name: str,
+        payload: dict,
+        priority: Optional[str] = None,
+        run_at: Optional[datetime] = None,
+    ) -> dict:
+        return {
+            # one stream per priority lane; the flusher picks the partition
+            "stream": lane_base(priority),
             "event_type": "task.created",
             "payload": {"name": name, "payload": payload},
+            # delivered through the scheduler when in the future
+            "run_at": run_at,
         }
-        await self.repo.add_task_with_outbox(task, outbox_event)
+
+    async def create_task(
+        self,
+        name: str,
+        payload: dict,
+        priority: Optional[str] = None,
+        run_at: Optional[datetime] = None,
+    ) -> DomainTask:
+        task = DomainTask(id=uuid.uuid4(), name=name, payload=payload)
+        await self.repo.add_task_with_outbox(
+            task, self._created_event(name, payload, priority, run_at)
+        )
         return task
 
+    async def create_tasks(
+        self, items: List[Tuple[str, dict, Optional[str], Optional[datetime]]]
+    ) -> List[DomainTask]:
+        """
+        create many tasks in one transaction; result keeps the order of `items`
+        items are (name, payload, priority, run_at) tuples
+        """
+        tasks, events = self._build(items)
+        await self.repo.add_tasks_with_outbox(tasks, events)
+        return tasks
+
+    def _build(self, items) -> Tuple[List[DomainTask], List[dict]]:
+        tasks = [
+            DomainTask(id=uuid.uuid4(), name=name, payload=payload)
+            for name, payload, _, _ in items
+        ]
+        events = [
+            self._created_event(t.name, t.payload, priority, run_at)
+            for t, (_, _, priority, run_at) in zip(tasks, items)
+        ]
+        return tasks, events
+
+    async def create_tasks_once(
+        self, idempotency_key: str, items
+    ) -> Tuple[List[uuid.UUID], bool]:
+        """
+        create_tasks under an Idempotency-Key: returns (task ids, replayed).
+        a repeated key gets the ids of the first request, from Redis when
+        possible, otherwise from the idempotency_keys row; nothing new is created
+        """
+        if self.idempotency is not None:
+            known = await self.idempotency.reserve(idempotency_key)
+            if known is not None:
+                return known, True
+        tasks, events = self._build(items)
+        try:
+            existing = await self.repo.add_tasks_with_outbox(
+                tasks, events, idempotency_key=idempotency_key
+            )
+        except Exception:
+            if self.idempotency is not None:
+                await self.idempotency.release(idempotency_key)
+            raise
+        ids = existing if existing is not None else [t.id for t in tasks]
+        if self.idempotency is not None:
+            await self.idempotency.remember(idempotency_key, ids)
+        if existing is not None:
+            IDEMPOTENCY_REPLAYS.labels("postgres").inc()
+        return ids, existing is not None
+
     async def get_task(self, task_id):
-        return await self.repo.get_task(task_id)
+        if self.cache is None:
+            return await self.repo.get_task(task_id)
+
+        cached = await self.cache.get(task_id)
+        if cached is MISSING:
+            raise TaskNotFoundError(task_id)
+        if cached is not None:
+            return cached
+        try:
+            task = await self.repo.get_task(task_id)
+        except TaskNotFoundError:
+            await self.cache.set_missing(task_id)
+            raise
+        await self.cache.set(task)
+        return task
+
+    async def list_tasks(self, **filters) -> List[DomainTask]:
+        return await self.repo.list_tasks(**filters)
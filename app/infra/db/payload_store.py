@@ -0,0 +1,119 @@
+# app/infra/db/payload_store.py
+"""
+Out-of-line storage for large task payloads.
+a payload whose JSON is bigger than `payload_offload_threshold` is compressed
+(zstd, zlib when zstandard is not installed) and stored once in payload_blobs,
+keyed by its sha256; tasks, outbox rows and stream entries carry only a
+reference {"$blob": digest, "size": n}, which readers resolve when they need it.
+a client payload that has the exact shape of a reference is always stored
+out-of-line as well, so every stored value of that shape is a real reference.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import zlib
+from collections import OrderedDict
+
+from prometheus_client import Counter, Histogram
+from app.settings import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zlib fallback
+    zstandard = None
+
+logger = logging.getLogger("payload.store")
+
+REF_KEY = "$blob"
+_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+PAYLOAD_OFFLOADED = Counter(
+    "samurai_payload_offloaded_total", "Task payloads stored out-of-line"
+)
+PAYLOAD_BYTES_SAVED = Counter(
+    "samurai_payload_bytes_saved_total", "Bytes saved by payload compression"
+)
+PAYLOAD_COMPRESSION_RATIO = Histogram(
+    "samurai_payload_compression_ratio",
+    "Uncompressed / compressed size of offloaded payloads",
+    buckets=(1, 1.5, 2, 3, 5, 10, 20, 50, 100),
+)
+
+
+def is_ref(value) -> bool:
+    """exactly {"$blob": <sha256 hex>, "size": <int>}"""
+    return (
+        isinstance(value, dict)
+        and value.keys() == {REF_KEY, "size"}
+        and isinstance(value[REF_KEY], str)
+        and _DIGEST.fullmatch(value[REF_KEY]) is not None
+        and isinstance(value["size"], int)
+    )
+
+
+def compress(raw: bytes) -> tuple[str, bytes]:
+    if zstandard is not None:
+        cctx = zstandard.ZstdCompressor(level=settings.payload_compression_level)
+        return "zstd", cctx.compress(raw)
+    return "zlib", zlib.compress(raw, settings.payload_compression_level)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"unknown payload codec {codec!r}")
+
+
+def offload(payload) -> tuple[object, dict | None]:
+    """
+    (value to store inline, blob row to insert or None).
+    small payloads are returned unchanged, unless they look like a reference.
+    """
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    if len(raw) < settings.payload_offload_threshold and not is_ref(payload):
+        return payload, None
+    digest = hashlib.sha256(raw).hexdigest()
+    codec, data = compress(raw)
+    PAYLOAD_OFFLOADED.inc()
+    PAYLOAD_BYTES_SAVED.inc(max(len(raw) - len(data), 0))
+    PAYLOAD_COMPRESSION_RATIO.observe(len(raw) / max(len(data), 1))
+    ref = {REF_KEY: digest, "size": len(raw)}
+    blob = {"digest": digest, "codec": codec, "data": data, "size": len(raw)}
+    return ref, blob
+
+
+def inflate(codec: str, data: bytes):
+    return json.loads(decompress(codec, data))
+
+
+class PayloadResolver:
+    """
+    consumer side: turns a payload reference back into the payload,
+    on demand, with a small LRU so hot blobs are fetched once per process.
+    `repo` is anything with `load_payload_blobs(digests) -> {digest: payload}`.
+    """
+
+    def __init__(self, repo, cache_size: int = 128):
+        self.repo = repo
+        self.cache_size = cache_size
+        self._cache: OrderedDict = OrderedDict()
+
+    async def resolve(self, value):
+        if not is_ref(value):
+            return value
+        digest = value[REF_KEY]
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            return self._cache[digest]
+        payload = (await self.repo.load_payload_blobs([digest])).get(digest)
+        if payload is None:
+            logger.warning("payload blob %s not found, keeping the reference", digest)
+            return value
+        self._cache[digest] = payload
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return payload
@@ -1,12 +1,39 @@
 # app/infra/db/repo_async.py
-from typing import List
+import uuid
+from typing import List, NamedTuple, Optional, Sequence, Tuple
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import select, update
-from datetime import datetime
+from sqlalchemy import (
+    case,
+    cast,
+    delete,
+    insert,
+    select,
+    text,
+    update,
+    values,
+    column,
+    func,
+    or_,
+    tuple_,
+    BigInteger,
+    Integer,
+    String,
+)
+from sqlalchemy.dialects.postgresql import UUID, insert as pg_insert
+from datetime import datetime, timedelta, timezone
 from app.settings import settings
-from .sqlalchemy_models import Base, TaskORM, EventOutboxORM
-from app.domain.models import Task as DomainTask
+from .payload_store import REF_KEY, inflate, is_ref, offload
+from .schema import upgrade_schema
+from .sqlalchemy_models import (
+    Base,
+    TaskORM,
+    EventOutboxORM,
+    EventOutboxArchiveORM,
+    IdempotencyKeyORM,
+    PayloadBlobORM,
+)
+from app.domain.models import Task as DomainTask, TaskState
 from app.domain.exceptions import TaskNotFoundError
 
 DATABASE_URL = settings.database_url
@@ -15,49 +42,226 @@ DATABASE_URL = settings.database_url
 engine = create_async_engine(DATABASE_URL, future=True, echo=False)
 AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
+# rows per multi-row INSERT: keeps the bind parameters far below the
+# protocol's 32767 per statement
+INSERT_CHUNK_ROWS = 1000
+
+
+def chunked(rows: Sequence[dict], size: Optional[int] = None):
+    size = size or INSERT_CHUNK_ROWS
+    for i in range(0, len(rows), size):
+        yield rows[i : i + size]
+
 
 async def create_tables():
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        # columns / indexes added to tables that already existed
+        await upgrade_schema(conn)
+
+
+class TaskClaim(NamedTuple):
+    """outcome of claim_task: `version` is None when the task was not claimed"""
+
+    version: Optional[int]
+    # the task's state after the attempt; None for an unknown task
+    state: Optional[str]
+
+
+class StateTransition(NamedTuple):
+    task_id: object
+    state: str
+    fence: Optional[int] = None  # fencing token of the writer's lock
+    expected_state: Optional[str] = None  # apply only from this state ...
+    version: Optional[int] = None  # ... and this version
 
 
 class AsyncTaskRepository:
     def __init__(self):
         self._session_factory = AsyncSessionLocal
 
+    @staticmethod
+    async def _notify_outbox(session: AsyncSession) -> None:
+        """
+        NOTIFY is transactional: listeners are woken only after commit,
+        and duplicate notifications in one transaction are collapsed.
+        """
+        if settings.outbox_notify:
+            await session.execute(
+                text("SELECT pg_notify(:channel, '')"),
+                {"channel": settings.outbox_notify_channel},
+            )
+
+    @staticmethod
+    async def _store_blobs(session: AsyncSession, blobs: Sequence[dict]) -> None:
+        """content-addressed: a payload already stored is not written again"""
+        for chunk in chunked(list(blobs)):
+            stmt = (
+                pg_insert(PayloadBlobORM)
+                .values(chunk)
+                .on_conflict_do_nothing(index_elements=["digest"])
+            )
+            await session.execute(stmt)
+
+    @staticmethod
+    async def _claim_idempotency_key(
+        session: AsyncSession, key: str, task_ids: Sequence
+    ) -> Optional[List[uuid.UUID]]:
+        """
+        bind `key` to `task_ids`; returns the ids of an earlier, unexpired
+        request with the same key instead. a concurrent transaction holding
+        the key makes this wait for its outcome (unique index).
+        """
+        expires_at = datetime.now(timezone.utc) + timedelta(
+            seconds=settings.idempotency_ttl
+        )
+        stmt = pg_insert(IdempotencyKeyORM).values(
+            key=key, task_ids=[str(i) for i in task_ids], expires_at=expires_at
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["key"],
+            set_={
+                "task_ids": stmt.excluded.task_ids,
+                "expires_at": stmt.excluded.expires_at,
+                "created_at": func.now(),
+            },
+            where=IdempotencyKeyORM.expires_at < func.now(),
+        ).returning(IdempotencyKeyORM.key)
+        if (await session.execute(stmt)).first() is not None:
+            return None
+        q = select(IdempotencyKeyORM.task_ids).where(IdempotencyKeyORM.key == key)
+        existing = (await session.execute(q)).scalar_one()
+        return [uuid.UUID(i) for i in existing]
+
+    @staticmethod
+    def _outbox_values(
+        domain_task: DomainTask, outbox_event: dict, payload=None
+    ) -> dict:
+        task_payload = {
+            "task_id": str(domain_task.id),  # <--- تبدیل UUID به str
+            "name": domain_task.name,
+            "payload": domain_task.payload if payload is None else payload,
+        }
+        return {
+            "stream": outbox_event["stream"],
+            "event_type": outbox_event["event_type"],
+            "payload": task_payload,
+            "run_at": outbox_event.get("run_at"),
+        }
+
     async def add_task_with_outbox(
         self, domain_task: DomainTask, outbox_event: dict
     ) -> None:
         """
         insert task and outbox record as a atomic transaction
         """
+        # large payloads are stored once, out-of-line; rows keep a reference
+        payload, blob = offload(domain_task.payload)
         async with self._session_factory() as session:
             async with session.begin():
+                await self._store_blobs(session, [blob] if blob else [])
                 task = TaskORM(
                     id=domain_task.id,
                     name=domain_task.name,
-                    payload=domain_task.payload,
+                    payload=payload,
                     state=domain_task.state,
                     attempts=domain_task.attempts,
                     last_error=domain_task.last_error,
                 )
                 session.add(task)
 
-                task_payload = {
-                    "task_id": str(domain_task.id),  # <--- تبدیل UUID به str
-                    "name": domain_task.name,
-                    "payload": domain_task.payload,
-                }
-
                 ev = EventOutboxORM(
-                    stream=outbox_event["stream"],
-                    event_type=outbox_event["event_type"],
-                    payload=task_payload,
+                    **self._outbox_values(domain_task, outbox_event, payload)
                 )
 
                 session.add(ev)
+                await self._notify_outbox(session)
             # commit happens at exit
 
+    async def add_tasks_with_outbox(
+        self,
+        domain_tasks: Sequence[DomainTask],
+        outbox_events: Sequence[dict],
+        idempotency_key: Optional[str] = None,
+    ) -> Optional[List[uuid.UUID]]:
+        """
+        insert many tasks and their outbox records in one transaction, with
+        multi-row INSERT ... VALUES statements of up to INSERT_CHUNK_ROWS rows
+        (a list of parameter sets would run as executemany, one per row).
+        outbox rows are inserted in the order of `domain_tasks`.
+        with `idempotency_key`, a key already used returns the task ids of
+        that request and nothing is inserted.
+        """
+        if not domain_tasks:
+            return None
+        task_rows, outbox_rows, blobs = [], [], {}
+        for t, ev in zip(domain_tasks, outbox_events):
+            payload, blob = offload(t.payload)
+            if blob:
+                blobs[blob["digest"]] = blob
+            task_rows.append(
+                {
+                    "id": t.id,
+                    "name": t.name,
+                    "payload": payload,
+                    "state": t.state,
+                    "attempts": t.attempts,
+                    "last_error": t.last_error,
+                }
+            )
+            outbox_rows.append(self._outbox_values(t, ev, payload))
+        async with self._session_factory() as session:
+            async with session.begin():
+                if idempotency_key is not None:
+                    existing = await self._claim_idempotency_key(
+                        session, idempotency_key, [t.id for t in domain_tasks]
+                    )
+                    if existing is not None:
+                        return existing
+                await self._store_blobs(session, list(blobs.values()))
+                for chunk in chunked(task_rows):
+                    await session.execute(insert(TaskORM).values(chunk))
+                for chunk in chunked(outbox_rows):
+                    await session.execute(insert(EventOutboxORM).values(chunk))
+                await self._notify_outbox(session)
+        return None
+
+    @staticmethod
+    async def _fetch_blobs(session: AsyncSession, digests) -> dict:
+        digests = list(set(digests))
+        if not digests:
+            return {}
+        q = select(PayloadBlobORM).where(PayloadBlobORM.digest.in_(digests))
+        res = await session.execute(q)
+        return {b.digest: inflate(b.codec, b.data) for b in res.scalars().all()}
+
+    async def _resolve_payloads(self, session: AsyncSession, rows) -> dict:
+        """payloads of the rows that hold a blob reference, in one query"""
+        digests = [r.payload[REF_KEY] for r in rows if is_ref(r.payload)]
+        return await self._fetch_blobs(session, digests)
+
+    async def load_payload_blobs(self, digests: Sequence[str]) -> dict:
+        async with self._session_factory() as session:
+            return await self._fetch_blobs(session, digests)
+
+    @staticmethod
+    def _to_domain(row: TaskORM, blobs: Optional[dict] = None) -> DomainTask:
+        payload = row.payload
+        if blobs and is_ref(payload):
+            # a reference whose blob is gone is returned as stored
+            payload = blobs.get(payload[REF_KEY], payload)
+        return DomainTask(
+            id=row.id,
+            name=row.name,
+            payload=payload,
+            state=row.state,
+            attempts=row.attempts,
+            last_error=row.last_error,
+            version=row.version,
+            created_at=row.created_at,
+            updated_at=row.updated_at,
+        )
+
     async def get_task(self, task_id) -> DomainTask:
         async with self._session_factory() as session:
             q = select(TaskORM).where(TaskORM.id == task_id)
@@ -65,32 +269,225 @@ class AsyncTaskRepository:
             row = res.scalar_one_or_none()
             if row is None:
                 raise TaskNotFoundError(task_id)
-            return DomainTask(
-                id=row.id,
-                name=row.name,
-                payload=row.payload,
-                state=row.state,
-                attempts=row.attempts,
-                last_error=row.last_error,
-                created_at=row.created_at,
-                updated_at=row.updated_at,
-            )
+            return self._to_domain(row, await self._resolve_payloads(session, [row]))
 
-    async def fetch_pending_outbox(self, limit: int = 50) -> List[EventOutboxORM]:
+    async def list_tasks(
+        self,
+        state: Optional[str] = None,
+        name: Optional[str] = None,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        after: Optional[Tuple[datetime, object]] = None,
+        limit: int = 50,
+    ) -> List[DomainTask]:
         """
-        خواندن pending outbox با FOR UPDATE SKIP LOCKED برای جلوگیری از رقابت بین چند flusher
+        newest first, keyset paginated on (created_at, id):
+        `after` is the (created_at, id) of the last row of the previous page,
+        so every page is an index range scan instead of an OFFSET.
+        offloaded payloads stay references here; get_task inflates them.
         """
+        q = select(TaskORM)
+        if state is not None:
+            q = q.where(TaskORM.state == state)
+        if name is not None:
+            q = q.where(TaskORM.name == name)
+        if created_from is not None:
+            q = q.where(TaskORM.created_at >= created_from)
+        if created_to is not None:
+            q = q.where(TaskORM.created_at < created_to)
+        if after is not None:
+            q = q.where(tuple_(TaskORM.created_at, TaskORM.id) < tuple_(*after))
+        q = q.order_by(TaskORM.created_at.desc(), TaskORM.id.desc()).limit(limit)
         async with self._session_factory() as session:
-            q = (
-                select(EventOutboxORM)
-                .where(EventOutboxORM.published == False)
-                .order_by(EventOutboxORM.created_at)
-                .limit(limit)
-                .with_for_update(skip_locked=True)
-            )
             res = await session.execute(q)
             rows = res.scalars().all()
-            return rows
+        return [self._to_domain(row) for row in rows]
+
+    async def update_task_states(self, transitions: Sequence[tuple]) -> list:
+        """
+        apply many transitions, (task_id, state) tuples or StateTransition,
+        with one UPDATE tasks ... FROM (VALUES ...) statement.
+        a conditional transition is skipped when the row is no longer in
+        `expected_state` / `version`, or was written with a newer fencing token;
+        returns the ids of the transitions skipped that way
+        """
+        if not transitions:
+            return []
+        data = [StateTransition(*t) for t in transitions]
+        rows = values(
+            column("id", UUID(as_uuid=True)),
+            column("state", String),
+            column("fence", BigInteger),
+            column("expected_state", String),
+            column("version", Integer),
+            name="transitions",
+        ).data(data)
+        # an all-NULL VALUES column is typed text by postgres: cast explicitly
+        fence = cast(rows.c.fence, BigInteger)
+        version = cast(rows.c.version, Integer)
+        async with self._session_factory() as session:
+            async with session.begin():
+                stmt = (
+                    update(TaskORM)
+                    .where(TaskORM.id == rows.c.id)
+                    .where(
+                        or_(
+                            fence.is_(None),
+                            TaskORM.fence_token.is_(None),
+                            TaskORM.fence_token <= fence,
+                        )
+                    )
+                    .where(
+                        or_(
+                            rows.c.expected_state.is_(None),
+                            TaskORM.state == rows.c.expected_state,
+                        )
+                    )
+                    .where(or_(version.is_(None), TaskORM.version == version))
+                    .values(
+                        state=rows.c.state,
+                        version=TaskORM.version + 1,
+                        fence_token=func.coalesce(fence, TaskORM.fence_token),
+                        updated_at=func.now(),
+                    )
+                    .returning(TaskORM.id)
+                )
+                applied = set((await session.execute(stmt)).scalars().all())
+        return [
+            t.task_id
+            for t in data
+            if (t.fence, t.expected_state, t.version) != (None, None, None)
+            and t.task_id not in applied
+        ]
+
+    async def claim_task(self, task_id, stale_after: float) -> TaskClaim:
+        """
+        pending / retrying -> running in one conditional UPDATE; a task left
+        `running` for `stale_after` seconds (its worker died) can be claimed
+        again. on success the claim carries the new version, to be passed to
+        the completing transition; otherwise it tells why not: the task is
+        finished, still running elsewhere, or unknown (state None)
+        """
+        if not isinstance(task_id, uuid.UUID):
+            task_id = uuid.UUID(str(task_id))
+        stale = func.now() - timedelta(seconds=stale_after)
+        async with self._session_factory() as session:
+            async with session.begin():
+                stmt = (
+                    update(TaskORM)
+                    .where(TaskORM.id == task_id)
+                    .where(
+                        or_(
+                            TaskORM.state.in_(TaskState.CLAIMABLE),
+                            (TaskORM.state == TaskState.RUNNING)
+                            & (TaskORM.updated_at < stale),
+                        )
+                    )
+                    .values(
+                        state=TaskState.RUNNING,
+                        version=TaskORM.version + 1,
+                        updated_at=func.now(),
+                    )
+                    .returning(TaskORM.version)
+                )
+                version = (await session.execute(stmt)).scalar_one_or_none()
+                if version is not None:
+                    return TaskClaim(version, TaskState.RUNNING)
+                state = (
+                    await session.execute(
+                        select(TaskORM.state).where(TaskORM.id == task_id)
+                    )
+                ).scalar_one_or_none()
+                return TaskClaim(None, state)
+
+    async def record_task_failure(
+        self, task_id, error: str, max_attempts: int
+    ) -> Optional[Tuple[int, str]]:
+        """
+        count one failed attempt atomically; the task becomes `failed` when it
+        reaches `max_attempts`, `retrying` otherwise.
+        returns (attempts, state), or None for an unknown or finished task
+        """
+        if not isinstance(task_id, uuid.UUID):
+            task_id = uuid.UUID(str(task_id))
+        async with self._session_factory() as session:
+            async with session.begin():
+                # right-hand sides see the old row: attempts + 1 is the new count
+                stmt = (
+                    update(TaskORM)
+                    .where(TaskORM.id == task_id)
+                    .where(TaskORM.state.notin_(TaskState.TERMINAL))
+                    .values(
+                        attempts=TaskORM.attempts + 1,
+                        last_error=error,
+                        state=case(
+                            (TaskORM.attempts + 1 >= max_attempts, TaskState.FAILED),
+                            else_=TaskState.RETRYING,
+                        ),
+                        version=TaskORM.version + 1,
+                        updated_at=func.now(),
+                    )
+                    .returning(TaskORM.attempts, TaskORM.state)
+                )
+                row = (await session.execute(stmt)).first()
+        return (row.attempts, row.state) if row else None
+
+    async def claim_pending_outbox(
+        self, owner: str, limit: int = 50, lease_seconds: float = 30.0
+    ) -> List[EventOutboxORM]:
+        """
+        atomically claim up to `limit` unpublished rows for `owner` with
+        UPDATE ... RETURNING. rows whose lease expired (crashed flusher)
+        are claimable again, so several flushers split the backlog.
+        """
+        now = func.now()
+        claimable = (
+            select(EventOutboxORM.id)
+            .where(EventOutboxORM.published == False)
+            .where(
+                or_(
+                    EventOutboxORM.locked_until.is_(None),
+                    EventOutboxORM.locked_until < now,
+                )
+            )
+            .order_by(EventOutboxORM.created_at, EventOutboxORM.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(EventOutboxORM)
+            .where(EventOutboxORM.id.in_(claimable.scalar_subquery()))
+            .values(
+                locked_by=owner,
+                locked_until=now + timedelta(seconds=lease_seconds),
+            )
+            .returning(EventOutboxORM)
+            .execution_options(synchronize_session=False)
+        )
+        async with self._session_factory() as session:
+            async with session.begin():
+                res = await session.execute(stmt)
+                rows = res.scalars().all()
+        # RETURNING does not keep the subquery order
+        return sorted(rows, key=lambda ev: (ev.created_at, ev.id))
+
+    async def release_outbox_claims(self, outbox_ids: Sequence[int], owner: str):
+        """
+        give back leases of rows that could not be published,
+        so another flusher can pick them up without waiting for expiry
+        """
+        if not outbox_ids:
+            return
+        async with self._session_factory() as session:
+            async with session.begin():
+                stmt = (
+                    update(EventOutboxORM)
+                    .where(EventOutboxORM.id.in_(outbox_ids))
+                    .where(EventOutboxORM.locked_by == owner)
+                    .where(EventOutboxORM.published == False)
+                    .values(locked_by=None, locked_until=None)
+                )
+                await session.execute(stmt)
 
     async def mark_outbox_published(self, outbox_id: int, stream_id: str | None = None):
         async with self._session_factory() as session:
@@ -101,7 +498,117 @@ class AsyncTaskRepository:
                     .values(
                         published=True,
                         published_at=datetime.utcnow(),
+                        locked_until=None,
                         stream_id=stream_id,
                     )
                 )
                 await session.execute(stmt)
+
+    async def mark_outbox_published_bulk(
+        self, published: Sequence[Tuple[int, str]]
+    ) -> None:
+        """
+        mark many outbox rows as published in a single UPDATE ... FROM (VALUES ...)
+        `published` is a sequence of (outbox_id, stream_id) pairs
+        """
+        if not published:
+            return
+        rows = values(
+            column("id", Integer), column("stream_id", String), name="published_rows"
+        ).data([(outbox_id, stream_id) for outbox_id, stream_id in published])
+        async with self._session_factory() as session:
+            async with session.begin():
+                stmt = (
+                    update(EventOutboxORM)
+                    .where(EventOutboxORM.id == rows.c.id)
+                    .values(
+                        published=True,
+                        published_at=datetime.utcnow(),
+                        locked_until=None,
+                        stream_id=rows.c.stream_id,
+                    )
+                )
+                await session.execute(stmt)
+
+    async def archive_published_outbox(
+        self, older_than: datetime, limit: int = 5000, archive: bool = False
+    ) -> int:
+        """
+        remove up to `limit` rows published before `older_than` from the hot
+        outbox table; with `archive` they are moved to outbox_events_archive
+        in the same statement (DELETE ... RETURNING feeding an INSERT).
+        returns the number of rows removed.
+        """
+        batch = (
+            select(EventOutboxORM.id)
+            .where(EventOutboxORM.published == True)
+            .where(EventOutboxORM.published_at < older_than)
+            .order_by(EventOutboxORM.published_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        removed = delete(EventOutboxORM).where(
+            EventOutboxORM.id.in_(batch.scalar_subquery())
+        )
+        async with self._session_factory() as session:
+            async with session.begin():
+                if not archive:
+                    res = await session.execute(removed)
+                    return res.rowcount
+                cols = [
+                    "id",
+                    "stream",
+                    "event_type",
+                    "payload",
+                    "created_at",
+                    "published_at",
+                    "stream_id",
+                ]
+                moved = removed.returning(
+                    *[EventOutboxORM.__table__.c[c] for c in cols]
+                ).cte("moved")
+                stmt = insert(EventOutboxArchiveORM).from_select(
+                    cols, select(*[moved.c[c] for c in cols])
+                )
+                res = await session.execute(stmt)
+                return res.rowcount
+
+    async def outbox_backlog(self) -> Tuple[int, Optional[float]]:
+        """
+        unpublished outbox rows and the age (seconds) of the oldest one;
+        both come from the partial index on unpublished rows
+        """
+        q = select(
+            func.count(),
+            func.extract("epoch", func.now() - func.min(EventOutboxORM.created_at)),
+        ).where(EventOutboxORM.published == False)
+        async with self._session_factory() as session:
+            count, age = (await session.execute(q)).one()
+        return count, float(age) if age is not None else None
+
+    async def count_tasks_by_state(
+        self, states: Optional[Sequence[str]] = None
+    ) -> dict:
+        """{state: count}, limited to `states` if given (served by the state index)"""
+        q = select(TaskORM.state, func.count()).group_by(TaskORM.state)
+        if states is not None:
+            q = q.where(TaskORM.state.in_(states))
+        async with self._session_factory() as session:
+            rows = (await session.execute(q)).all()
+        return {state: count for state, count in rows}
+
+    async def purge_expired_idempotency_keys(self, limit: int = 5000) -> int:
+        batch = (
+            select(IdempotencyKeyORM.key)
+            .where(IdempotencyKeyORM.expires_at < func.now())
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        async with self._session_factory() as session:
+            async with session.begin():
+                res = await session.execute(
+                    delete(IdempotencyKeyORM).where(
+                        IdempotencyKeyORM.key.in_(batch.scalar_subquery())
+                    )
+                )
+                return res.rowcount
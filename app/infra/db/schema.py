@@ -0,0 +1,49 @@
+# app/infra/db/schema.py
+"""
+In-place upgrade of databases created by earlier versions.
+`create_all` only creates missing tables, it never alters existing ones, so
+the columns and indexes added to `tasks` and `outbox_events` since are
+applied here, idempotently (ADD COLUMN / CREATE INDEX IF NOT EXISTS), right
+after create_all on every startup. the DDL is compiled from the models, so
+it cannot drift from them.
+"""
+
+from typing import List
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.schema import CreateColumn, CreateIndex
+
+from .sqlalchemy_models import EventOutboxORM, TaskORM
+
+# columns that did not exist in the first schema
+ADDED_COLUMNS = {
+    TaskORM.__table__: ["version", "fence_token"],
+    EventOutboxORM.__table__: ["locked_by", "locked_until", "run_at"],
+}
+# every index of those tables was added later
+UPGRADED_TABLES = [TaskORM.__table__, EventOutboxORM.__table__]
+
+
+def upgrade_statements() -> List[str]:
+    """columns first: the partial indexes refer to them"""
+    dialect = postgresql.dialect()
+    statements = []
+    for table, names in ADDED_COLUMNS.items():
+        for name in names:
+            column = CreateColumn(table.c[name]).compile(dialect=dialect)
+            statements.append(
+                f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS {column}"
+            )
+    for table in UPGRADED_TABLES:
+        for index in sorted(table.indexes, key=lambda ix: ix.name):
+            statements.append(
+                str(CreateIndex(index, if_not_exists=True).compile(dialect=dialect))
+            )
+    return statements
+
+
+async def upgrade_schema(conn: AsyncConnection) -> None:
+    for statement in upgrade_statements():
+        await conn.execute(text(statement))
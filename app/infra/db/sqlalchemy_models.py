@@ -1,5 +1,17 @@
 # app/infra/db/sqlalchemy_models.py
-from sqlalchemy import Column, String, Integer, DateTime, JSON, Boolean, func
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    String,
+    Integer,
+    DateTime,
+    JSON,
+    Boolean,
+    Index,
+    LargeBinary,
+    func,
+    text,
+)
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import declarative_base
 import uuid
@@ -10,12 +22,22 @@ Base = declarative_base()
 
 class TaskORM(Base):
     __tablename__ = "tasks"
+    # keyset pagination of GET /v1/tasks: (created_at, id), optionally per filter
+    __table_args__ = (
+        Index("ix_tasks_created_at_id", "created_at", "id"),
+        Index("ix_tasks_state_created_at_id", "state", "created_at", "id"),
+        Index("ix_tasks_name_created_at_id", "name", "created_at", "id"),
+    )
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     name = Column(String, nullable=False)
     payload = Column(JSON, nullable=False, default={})
     state = Column(String, default="pending", nullable=False)
     attempts = Column(Integer, default=0, nullable=False)
     last_error = Column(String, nullable=True)
+    # bumped by every state transition; conditional UPDATEs compare it
+    version = Column(Integer, default=0, nullable=False, server_default="0")
+    # fencing token of the last lock holder that wrote the row
+    fence_token = Column(BigInteger, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
@@ -32,3 +54,62 @@ class EventOutboxORM(Base):
     published = Column(Boolean, nullable=False, default=False)
     published_at = Column(DateTime(timezone=True), nullable=True)
     stream_id = Column(String, nullable=True)
+    # lease: which flusher claimed the row and until when
+    locked_by = Column(String, nullable=True)
+    locked_until = Column(DateTime(timezone=True), nullable=True)
+    # delayed delivery: the flusher hands the entry to the scheduler until then
+    run_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # hot set for the flusher: only unpublished rows, in claim order
+        Index(
+            "ix_outbox_unpublished_created_at_id",
+            "created_at",
+            "id",
+            postgresql_where=text("published = false"),
+        ),
+        # archiver: published rows by age
+        Index(
+            "ix_outbox_published_at",
+            "published_at",
+            postgresql_where=text("published = true"),
+        ),
+    )
+
+
+class EventOutboxArchiveORM(Base):
+    """published outbox rows past retention, moved out of the hot table"""
+
+    __tablename__ = "outbox_events_archive"
+    id = Column(Integer, primary_key=True)
+    stream = Column(String, nullable=False)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    published_at = Column(DateTime(timezone=True), nullable=True)
+    stream_id = Column(String, nullable=True)
+
+
+class PayloadBlobORM(Base):
+    """
+    large task payloads, stored once and compressed; tasks, outbox rows and
+    stream entries only carry a {"$blob": digest} reference
+    """
+
+    __tablename__ = "payload_blobs"
+    digest = Column(String(64), primary_key=True)  # sha256 of the raw json
+    codec = Column(String, nullable=False)  # zstd | zlib
+    data = Column(LargeBinary, nullable=False)
+    size = Column(Integer, nullable=False)  # uncompressed bytes
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class IdempotencyKeyORM(Base):
+    """Idempotency-Key of a create request -> the tasks it created"""
+
+    __tablename__ = "idempotency_keys"
+    key = Column(String, primary_key=True)
+    task_ids = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # an expired key may be used again; the archiver purges expired rows
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
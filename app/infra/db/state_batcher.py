@@ -0,0 +1,115 @@
+# app/infra/db/state_batcher.py
+import asyncio
+import logging
+import uuid
+
+from app.domain.exceptions import StaleFencingTokenError, TaskStateConflictError
+from app.infra.db.repo_async import AsyncTaskRepository, StateTransition
+from app.infra.redis.task_cache import TaskCache
+from app.settings import settings
+
+logger = logging.getLogger("db.state_batcher")
+
+
+class TaskStateBatcher:
+    """
+    Write-behind batcher for task state transitions.
+    callers await `submit`, which resolves only after the batch holding their
+    transition is committed; so a stream message handled this way is acked
+    only once its state change is durable.
+    a batch is written when it reaches `max_rows` or after `max_delay` seconds.
+    cached snapshots of the batch's tasks are invalidated after the commit.
+    a conditional transition (expected state / version) that no longer
+    matches fails with TaskStateConflictError, one carrying only a lock's
+    fencing token with StaleFencingTokenError.
+    """
+
+    def __init__(
+        self,
+        repo: AsyncTaskRepository,
+        max_rows: int | None = None,
+        max_delay: float | None = None,
+        cache: TaskCache | None = None,
+    ):
+        self.repo = repo
+        self.cache = cache
+        self.max_rows = max_rows or settings.state_batch_max_rows
+        self.max_delay = (
+            max_delay if max_delay is not None else settings.state_batch_max_delay
+        )
+        self._pending: list[tuple[StateTransition, asyncio.Future]] = []
+        self._has_items = asyncio.Event()
+        self._full = asyncio.Event()
+        self._runner: asyncio.Task | None = None
+        self._stopping = False
+
+    async def submit(
+        self,
+        task_id,
+        state: str,
+        fence: int | None = None,
+        expected_state: str | None = None,
+        version: int | None = None,
+    ) -> None:
+        if not isinstance(task_id, uuid.UUID):
+            task_id = uuid.UUID(str(task_id))
+        fut = asyncio.get_running_loop().create_future()
+        transition = StateTransition(task_id, state, fence, expected_state, version)
+        self._pending.append((transition, fut))
+        self._has_items.set()
+        if len(self._pending) >= self.max_rows:
+            self._full.set()
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+        await fut
+
+    async def _flush(self, batch) -> None:
+        # the same task twice in one batch: the latest transition wins
+        latest = {t.task_id: t for t, _ in batch}
+        transitions = [
+            t if t[2:] != (None, None, None) else t[:2] for t in latest.values()
+        ]
+        try:
+            rejected = set(await self.repo.update_task_states(transitions) or [])
+        except Exception as e:
+            logger.exception("state batch of %s rows failed: %s", len(batch), e)
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        if self.cache is not None:
+            await self.cache.invalidate(latest.keys())
+        for t, fut in batch:
+            if fut.done():
+                continue
+            if t.task_id not in rejected or t[2:] == (None, None, None):
+                fut.set_result(None)
+            elif t.expected_state is None and t.version is None:
+                fut.set_exception(StaleFencingTokenError(t.task_id))
+            else:
+                fut.set_exception(TaskStateConflictError(t.task_id))
+
+    async def _run(self) -> None:
+        while not (self._stopping and not self._pending):
+            await self._has_items.wait()
+            if not self._stopping:
+                try:
+                    await asyncio.wait_for(self._full.wait(), timeout=self.max_delay)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self._pending[: self.max_rows]
+            self._pending = self._pending[self.max_rows :]
+            if len(self._pending) < self.max_rows:
+                self._full.clear()
+            if not self._pending and not self._stopping:
+                self._has_items.clear()
+            if batch:
+                await self._flush(batch)
+
+    async def stop(self) -> None:
+        """write whatever is still buffered and stop the background task"""
+        self._stopping = True
+        self._has_items.set()
+        if self._runner is not None:
+            await self._runner
+            self._runner = None
@@ -0,0 +1,122 @@
+# app/infra/event_bus/codec.py
+"""
+Stream entry codecs.
+every entry carries the envelope version (`v`) and the codec (`codec`) its
+payload was written with; readers pick the decoder from the entry itself,
+so workers of different versions interoperate during a rollout.
+entries without a `codec` field were written by the legacy json path.
+
+orjson output is plain JSON, so older consumers can still read it;
+switch to msgpack only once every consumer understands the envelope.
+"""
+
+import abc
+import datetime
+import json
+import uuid
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional speedup
+    msgpack = None
+
+ENVELOPE_VERSION = "1"
+
+
+def as_text(value) -> str | None:
+    """str of a redis reply value (bytes when decode_responses is off); None stays None"""
+    if value is None or isinstance(value, str):
+        return value
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _default(obj):
+    """UUID / datetime support shared by the json and msgpack codecs"""
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"Type is not serializable: {type(obj)!r}")
+
+
+class Codec(abc.ABC):
+    name: str = ""
+
+    @abc.abstractmethod
+    def dumps(self, obj) -> bytes: ...
+
+    @abc.abstractmethod
+    def loads(self, raw: bytes): ...
+
+
+class JsonCodec(Codec):
+    name = "json"
+
+    def dumps(self, obj) -> bytes:
+        return json.dumps(obj, default=_default).encode()
+
+    def loads(self, raw: bytes):
+        return json.loads(raw)
+
+
+class OrjsonCodec(Codec):
+    """UUID and datetime are serialized natively by orjson"""
+
+    name = "orjson"
+
+    def dumps(self, obj) -> bytes:
+        return orjson.dumps(obj, default=_default)
+
+    def loads(self, raw: bytes):
+        return orjson.loads(raw)
+
+
+class MsgpackCodec(Codec):
+    name = "msgpack"
+
+    def dumps(self, obj) -> bytes:
+        return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+    def loads(self, raw: bytes):
+        return msgpack.unpackb(raw, raw=False)
+
+
+_CODECS: dict[str, Codec] = {"json": JsonCodec()}
+if orjson is not None:
+    _CODECS["orjson"] = OrjsonCodec()
+if msgpack is not None:
+    _CODECS["msgpack"] = MsgpackCodec()
+
+
+def get_codec(name: str | None) -> Codec:
+    """codec by name; unknown or unavailable names raise ValueError"""
+    codec = _CODECS.get(name or "json")
+    if codec is None:
+        raise ValueError(f"stream codec {name!r} is not available")
+    return codec
+
+
+def encode_entry(event_type: str, payload: dict, codec: Codec, **extra) -> dict:
+    entry = {
+        "v": ENVELOPE_VERSION,
+        "codec": codec.name,
+        "type": event_type,
+        "payload": codec.dumps(payload),
+    }
+    entry.update(extra)
+    return entry
+
+
+def decode_entry(raw: dict) -> tuple[str, str, dict]:
+    """(event_type, task_id, data) of a raw stream entry of any version"""
+    event_type = as_text(raw.get(b"type"))
+    task_id = as_text(raw.get(b"task_id") or b"")
+    codec = get_codec(as_text(raw.get(b"codec")))
+    raw_payload = raw.get(b"payload")
+    data = codec.loads(raw_payload) if raw_payload else {}
+    return event_type, task_id, data
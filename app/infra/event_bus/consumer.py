@@ -1,27 +1,190 @@
 # app/infra/event_bus/consumer.py
 import asyncio
-import json
+import time
 from typing import Callable, Awaitable
+from prometheus_client import Gauge, Histogram
 from redis.asyncio import from_url, Redis
 from app.settings import settings
 import logging
 
+from app.infra.event_bus.codec import as_text, decode_entry
+from app.infra.event_bus.handlers import (
+    HANDLER_DEFERRED,
+    EventHandler,
+    RedisTokenBucket,
+    TokenBucket,
+    parse_handler_limits,
+)
+from app.infra.event_bus.reclaimer import PendingReclaimer
+from app.infra.event_bus.scheduler import schedule
+from app.infra.redis.dedupe import ProcessedEventSet
+
 logger = logging.getLogger("event.consumer")
 
+LANE_DEPTH = Gauge(
+    "samurai_lane_depth", "Entries not yet delivered to the group, per lane", ["lane"]
+)
+LANE_WAIT = Histogram(
+    "samurai_lane_wait_seconds",
+    "Time from XADD to the first read, per lane",
+    ["lane"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300),
+)
+
+DEFAULT_LANE = "default"
+
+# set on entries deferred through the scheduler: their stream id is the
+# time they came back, not the time they were first published
+DEFERRED_FIELD = b"deferred"
+
+
+class LeavePending(Exception):
+    """
+    raised by a handler to leave its message pending: no ack and no retry,
+    the reclaimer delivers it again after the idle time
+    """
+
+
+async def _unhandled(event_type, task_id, data):
+    raise LookupError(f"no handler registered for event type {event_type!r}")
+
 
 class RedisStreamConsumer:
+    """
+    Reads one or more streams (e.g. the partitions assigned to this worker)
+    through a consumer group and runs up to `max_in_flight`
+    handlers concurrently. With `ordered=True` messages of the same task_id
+    are handled one after another, in stream order.
+    Successful messages are XACKed in batches.
+    Reads block on the server while the stream is empty; the read size grows
+    while there is backlog and never exceeds the free in-flight capacity.
+    Entries left pending by dead workers are reclaimed by a PendingReclaimer,
+    one per stream.
+    Streams can be grouped into priority lanes ({stream: lane}); lanes are
+    read with weighted fair scheduling, see `_read_weighted`.
+    With a `retry` engine a failed message is rescheduled (or its task marked
+    failed) and acked; without one it stays pending for the reclaimer.
+    With `dedupe` an event already handled by the group (same outbox id and
+    attempt, or same stream id) is acked without running the handler; a read
+    batch is checked against the group's processed ids in one round trip.
+    Handlers can be registered per event type (`register`), each with its own
+    concurrency cap and rate limit; the handler given to `run` handles the
+    other types. Messages buffered for their type's limits have their idle
+    time reset (XCLAIM JUSTID) so no reclaimer takes them; when the buffer
+    is full the message is deferred through the scheduler instead of
+    blocking the reads of every other type.
+    """
+
     def __init__(
         self,
-        stream: str,
+        stream: str | list[str] | dict[str, str],
         group: str = "samurai-workers",
         consumer_name: str = "consumer-1",
+        max_in_flight: int | None = None,
+        ordered: bool | None = None,
+        ack_batch_size: int | None = None,
+        ack_interval: float | None = None,
+        block_ms: int | None = None,
+        read_count_max: int | None = None,
+        lane_weights: dict[str, int] | None = None,
+        retry=None,
+        dedupe: bool | None = None,
     ):
-        self.stream = stream
+        self.streams: list[str] = []
+        self.stream_lanes: dict[str, str] = {}
+        self._assign_streams(stream)
+        self.lane_weights = lane_weights or {}
+        self.retry = retry
         self.group = group
         self.consumer_name = consumer_name
         self.redis_url = settings.redis_url
+        self.max_in_flight = max_in_flight or settings.consumer_max_in_flight
+        self.ordered = settings.consumer_ordered if ordered is None else ordered
+        self.ack_batch_size = ack_batch_size or settings.consumer_ack_batch_size
+        self.ack_interval = ack_interval or settings.consumer_ack_interval
+        self.block_ms = block_ms or settings.consumer_block_ms
+        self.read_count_max = read_count_max or settings.consumer_read_count_max
         self._client: Redis | None = None
         self._stopped = False
+        # set by run(): reclaimers exist only while the read loop runs
+        self._running = False
+        self._slots: asyncio.Semaphore | None = None
+        self._in_flight: set[asyncio.Task] = set()
+        # task_id -> [lock, number of messages holding or waiting for it]
+        self._key_locks: dict[str, list] = {}
+        self._ack_buffer: list[tuple[str, bytes]] = []
+        self._ack_lock = asyncio.Lock()
+        dedupe = settings.consumer_dedupe if dedupe is None else dedupe
+        self.dedupe = ProcessedEventSet(group) if dedupe else None
+        # ids to mark processed, written with the next XACK flush
+        self._mark_buffer: list[str] = []
+        # last failure per (stream, message id), attached to dead-lettered entries
+        self._errors: dict = {}
+        self._errors_max = 10000
+        self._handler = None
+        self._handlers: dict[str, EventHandler] = {}
+        # messages waiting for their event type's limits (no global slot yet)
+        self._waiting: set[asyncio.Task] = set()
+        # (stream, msg_id) of those messages, kept out of other reclaimers
+        self._buffered: set[tuple[str, bytes]] = set()
+        self.touch_interval = settings.consumer_reclaim_idle_ms / 3000
+        self.defer_delay = settings.handler_defer_delay
+        self._reclaimers: dict[str, tuple[PendingReclaimer, asyncio.Task]] = {}
+
+    def register(
+        self,
+        event_type: str,
+        handler: Callable[[str, str, dict], Awaitable[None]],
+        max_concurrency: int | None = None,
+        rate: float | None = None,
+        burst: float | None = None,
+        shared_rate: bool | None = None,
+        max_waiting: int | None = None,
+    ) -> None:
+        """
+        route `event_type` to `handler`. limits not given here are taken from
+        HANDLER_LIMITS; a shared rate limit is enforced across all workers of
+        the group through Redis.
+        """
+        defaults = parse_handler_limits(settings.handler_limits).get(event_type, {})
+        max_concurrency = max_concurrency or defaults.get("max_concurrency")
+        rate = rate or defaults.get("rate")
+        burst = burst or defaults.get("burst")
+        if shared_rate is None:
+            shared_rate = settings.handler_rate_shared
+        limiter = None
+        if rate and shared_rate:
+            limiter = RedisTokenBucket(
+                self._get_client, f"ratelimit:{self.group}:{event_type}", rate, burst
+            )
+        elif rate:
+            limiter = TokenBucket(rate, burst)
+        self._handlers[event_type] = EventHandler(
+            event_type, handler, max_concurrency, limiter, max_waiting
+        )
+
+    def _assign_streams(self, streams) -> None:
+        if isinstance(streams, str):
+            streams = [streams]
+        if isinstance(streams, dict):
+            self.stream_lanes = dict(streams)
+        else:
+            self.stream_lanes = {s: DEFAULT_LANE for s in streams}
+        self.streams = list(self.stream_lanes)
+
+    def _lanes(self) -> dict[str, list[str]]:
+        """lane -> streams, heaviest lane first"""
+        lanes: dict[str, list[str]] = {}
+        for stream, lane in self.stream_lanes.items():
+            lanes.setdefault(lane, []).append(stream)
+        return dict(
+            sorted(lanes.items(), key=lambda kv: -self.lane_weights.get(kv[0], 1))
+        )
+
+    @property
+    def stream(self) -> str:
+        """first (or only) stream, kept for single-stream callers"""
+        return self.streams[0] if self.streams else ""
 
     async def _get_client(self):
         if not self._client:
@@ -31,57 +194,450 @@ class RedisStreamConsumer:
     async def get_client(self):
         return await self._get_client()
 
-    async def ensure_group(self):
+    async def ensure_group(self, streams: list[str] | None = None):
         r = await self._get_client()
+        for stream in streams or self.streams:
+            try:
+                await r.xgroup_create(stream, self.group, id="0", mkstream=True)
+            except Exception as e:
+                logger.debug("group create: %s", e)
+
+    def last_error(self, msg_id, stream: str | None = None) -> str | None:
+        return self._errors.get((stream or self.stream, msg_id))
+
+    def forget_error(self, msg_id, stream: str | None = None) -> None:
+        self._errors.pop((stream or self.stream, msg_id), None)
+
+    def _remember_error(self, stream: str, msg_id, error: Exception) -> None:
+        self._errors.pop((stream, msg_id), None)
+        if len(self._errors) >= self._errors_max:
+            # dicts keep insertion order: drop the oldest
+            self._errors.pop(next(iter(self._errors)))
+        self._errors[(stream, msg_id)] = repr(error)
+
+    def _start_reclaimer(self, stream: str) -> None:
+        reclaimer = PendingReclaimer(self, self._handler, stream=stream)
+        self._reclaimers[stream] = (reclaimer, asyncio.create_task(reclaimer.run()))
+
+    def _stop_reclaimer(self, stream: str) -> None:
+        reclaimer, task = self._reclaimers.pop(stream)
+        reclaimer.stop()
+        task.cancel()
+
+    async def set_streams(self, streams: list[str] | dict[str, str]) -> None:
+        """
+        switch to another set of streams (partition rebalancing); reads pick
+        it up on the next XREADGROUP, in-flight messages still get acked.
+        a dict maps every stream to its priority lane.
+        """
+        streams_lanes = streams
+        streams = list(streams)
+        await self.ensure_group(streams)
+        if self._running:
+            for stream in set(self._reclaimers) - set(streams):
+                self._stop_reclaimer(stream)
+            for stream in set(streams) - set(self._reclaimers):
+                self._start_reclaimer(stream)
+        self._assign_streams(streams_lanes)
+
+    async def _flush_acks(self) -> None:
+        async with self._ack_lock:
+            if not self._ack_buffer:
+                return
+            acks, self._ack_buffer = self._ack_buffer, []
+            marks, self._mark_buffer = self._mark_buffer, []
+            by_stream: dict[str, list] = {}
+            for stream, msg_id in acks:
+                by_stream.setdefault(stream, []).append(msg_id)
+            r = await self._get_client()
+            try:
+                if len(by_stream) == 1 and not marks:
+                    ((stream, ids),) = by_stream.items()
+                    await r.xack(stream, self.group, *ids)
+                else:
+                    async with r.pipeline(transaction=False) as pipe:
+                        # marked before acked: an acked event is always marked
+                        if marks:
+                            self.dedupe.queue_marks(pipe, marks)
+                        for stream, ids in by_stream.items():
+                            pipe.xack(stream, self.group, *ids)
+                        await pipe.execute()
+            except Exception as e:
+                # un-acked entries stay in the PEL and are delivered again
+                logger.exception("xack of %s messages failed: %s", len(acks), e)
+
+    async def _ack_loop(self) -> None:
+        while not self._stopped:
+            await asyncio.sleep(self.ack_interval)
+            await self._flush_acks()
+
+    async def _handle(self, handler, event_id, event_type, task_id, data) -> bool:
+        """runs the handler; False when the event was handled before"""
+        # the group's ids were checked for the whole batch in dispatch_many;
+        # here only copies handled by this process since then are caught
+        if self.dedupe is not None and event_id:
+            if self.dedupe.seen_local(event_id):
+                return False
+        await handler(event_type, task_id, data)
+        if self.dedupe is not None and event_id:
+            # before the key lock is released, so a waiting duplicate sees it
+            self.dedupe.remember_local(event_id)
+        return True
+
+    async def _process(
+        self,
+        handler,
+        stream,
+        msg_id,
+        event_type,
+        task_id,
+        data,
+        event_id=None,
+        outbox_id=None,
+    ) -> None:
+        key = (task_id or data.get("task_id") or "") if self.ordered else ""
+        entry = None
         try:
-            await r.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            if key:
+                entry = self._key_locks.setdefault(key, [asyncio.Lock(), 0])
+                entry[1] += 1
+                # checked under the key lock: a duplicate delivered while the
+                # first copy runs waits for it and is then dropped
+                async with entry[0]:
+                    handled = await self._handle(
+                        handler, event_id, event_type, task_id, data
+                    )
+            else:
+                handled = await self._handle(
+                    handler, event_id, event_type, task_id, data
+                )
+            await self._ack(stream, msg_id, event_id if handled else None)
+        except LeavePending as e:
+            logger.info("message %s left pending: %s", msg_id, e)
+            self._remember_error(stream, msg_id, e)
         except Exception as e:
-            logger.debug("group create: %s", e)
+            logger.exception("processing message %s failed: %s", msg_id, e)
+            if await self._retry(stream, event_type, task_id, data, e, outbox_id):
+                await self._ack(stream, msg_id, event_id)
+            else:
+                self._remember_error(stream, msg_id, e)
+        finally:
+            if entry is not None:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    self._key_locks.pop(key, None)
+            self._slots.release()
 
-    async def run(
-        self, handler: Callable[[str, str, dict], Awaitable[None]], read_count: int = 1
-    ):
+    async def _ack(self, stream, msg_id, event_id=None) -> None:
+        self.forget_error(msg_id, stream)
+        if event_id and self.dedupe is not None:
+            self.dedupe.remember_local(event_id)
+            self._mark_buffer.append(event_id)
+        self._ack_buffer.append((stream, msg_id))
+        if len(self._ack_buffer) >= self.ack_batch_size:
+            await self._flush_acks()
+
+    async def _retry(
+        self, stream, event_type, task_id, data, exc, outbox_id=None
+    ) -> bool:
+        """True when the retry engine took over the failed message"""
+        if self.retry is None:
+            return False
+        try:
+            r = await self._get_client()
+            await self.retry.on_failure(
+                r,
+                stream,
+                event_type,
+                task_id or data.get("task_id"),
+                data,
+                exc,
+                outbox_id=outbox_id,
+            )
+            return True
+        except Exception as e:
+            # e.g. the database is down: the reclaimer delivers it again later
+            logger.exception("scheduling retry of %s failed: %s", task_id, e)
+            return False
+
+    def _observe_wait(self, stream: str, msg_id, raw) -> None:
+        """
+        stream ids start with the XADD time in ms. only for fresh (`>`) reads:
+        reclaimed entries add their idle time, deferred ones hide their wait
+        """
+        if raw.get(DEFERRED_FIELD):
+            return
+        if isinstance(msg_id, bytes):
+            msg_id = msg_id.decode()
+        try:
+            added_ms = int(msg_id.split("-")[0])
+        except ValueError:
+            return
+        lane = self.stream_lanes.get(stream, DEFAULT_LANE)
+        LANE_WAIT.labels(lane).observe(max(time.time() - added_ms / 1000, 0))
+
+    @staticmethod
+    def event_id(stream: str, msg_id, raw) -> tuple[str, str | None]:
+        """
+        (dedupe id, outbox id) of an entry: entries published from the outbox
+        are identified by outbox id (and retry attempt), so a row published
+        twice is still one event; other entries by their stream id
+        """
+        outbox_id = as_text(raw.get(b"outbox_id"))
+        if not outbox_id:
+            return f"{stream}:{as_text(msg_id)}", None
+        attempt = as_text(raw.get(b"attempt"))
+        return (f"{outbox_id}:{attempt}" if attempt else outbox_id), outbox_id
+
+    async def dispatch_many(self, handler, messages, stream: str | None = None) -> None:
+        """dispatch a read batch; entries the group already handled are only acked"""
+        stream = stream or self.stream
+        if self.dedupe is not None and messages:
+            ids = [self.event_id(stream, msg_id, raw)[0] for msg_id, raw in messages]
+            seen = await self.dedupe.seen_many(await self._get_client(), ids)
+            if seen:
+                fresh = []
+                for event_id, (msg_id, raw) in zip(ids, messages):
+                    if event_id in seen:
+                        await self._ack(stream, msg_id)
+                    else:
+                        fresh.append((msg_id, raw))
+                messages = fresh
+        for msg_id, raw in messages:
+            await self.dispatch(handler, msg_id, raw, stream=stream)
+
+    async def dispatch(self, handler, msg_id, raw, stream: str | None = None) -> None:
+        stream = stream or self.stream
+        try:
+            event_type, task_id, data = decode_entry(raw)
+        except Exception as e:
+            logger.exception("decoding message %s failed: %s", msg_id, e)
+            return
+        event_id, outbox_id = self.event_id(stream, msg_id, raw)
+        route = self._handlers.get(event_type)
+        if route is not None:
+            handler = route.handler
+        handler = handler or _unhandled
+        args = (handler, stream, msg_id, event_type, task_id, data, event_id, outbox_id)
+
+        if route is not None and route.limited:
+            # never waits here: a full type buffer must not stop the reads of
+            # other types. the global slot is taken once the type's
+            # concurrency and rate limits let the message run
+            if not route.try_admit():
+                await self._defer(stream, msg_id, raw, event_type)
+                return
+            held = (stream, msg_id)
+            self._buffered.add(held)
+            t = asyncio.create_task(route.run_limited(lambda: self._start(*args)))
+            self._waiting.add(t)
+            t.add_done_callback(self._waiting.discard)
+            t.add_done_callback(self._in_flight.discard)
+            t.add_done_callback(lambda _: self._buffered.discard(held))
+            return
+
+        # back-pressure: wait for a free slot before taking the next message
+        await self._slots.acquire()
+        t = asyncio.create_task(self._process(*args))
+        self._in_flight.add(t)
+        t.add_done_callback(self._in_flight.discard)
+
+    async def _start(self, *args) -> None:
+        """take a global slot, then process (which releases it)"""
+        await self._slots.acquire()
+        self._buffered.discard((args[1], args[2]))
+        self._in_flight.add(asyncio.current_task())
+        await self._process(*args)
+
+    async def _defer(self, stream: str, msg_id, raw, event_type: str) -> None:
+        """
+        the type's buffer is full: hand the entry to the delayed scheduler and
+        ack it, in one MULTI (its scheduler keys share the stream's slot).
+        it comes back as a new entry after `defer_delay`, without counting as
+        a delivery (no dead-lettering). its fields are kept, so outbox events
+        keep their dedupe id; DEFERRED_FIELD keeps it out of the wait histogram.
+        """
+        try:
+            r = await self._get_client()
+            async with r.pipeline(transaction=True) as pipe:
+                schedule(
+                    pipe,
+                    stream,
+                    {**raw, DEFERRED_FIELD: b"1"},
+                    time.time() + self.defer_delay,
+                    f"defer:{stream}:{as_text(msg_id)}",
+                )
+                pipe.xack(stream, self.group, msg_id)
+                await pipe.execute()
+        except Exception as e:
+            # still pending: the reclaimer delivers it again later
+            logger.warning("deferring message %s failed: %s", msg_id, e)
+            return
+        HANDLER_DEFERRED.labels(event_type).inc()
+
+    async def _touch_buffered(self) -> None:
+        """
+        reset the idle time of buffered messages so other workers'
+        XAUTOCLAIM leaves them alone; JUSTID keeps their delivery count
+        """
+        by_stream: dict[str, list] = {}
+        for stream, msg_id in list(self._buffered):
+            by_stream.setdefault(stream, []).append(msg_id)
+        if not by_stream:
+            return
         r = await self._get_client()
-        await self.ensure_group()
-        while not self._stopped:
-            try:
-                resp = await r.xreadgroup(
+        async with r.pipeline(transaction=False) as pipe:
+            for stream, ids in by_stream.items():
+                pipe.xclaim(
+                    stream,
                     self.group,
                     self.consumer_name,
-                    streams={self.stream: ">"},
-                    count=read_count,
+                    min_idle_time=0,
+                    message_ids=ids,
+                    justid=True,
                 )
-                if not resp:
-                    await asyncio.sleep(0.2)
-                    continue
-                for _, messages in resp:
-                    for msg_id, raw in messages:
-                        try:
-                            event_type = raw.get(b"type").decode()
-                            task_id = (
-                                raw.get(b"task_id").decode()
-                                if raw.get(b"task_id")
-                                else ""
-                            )
-                            data = {}
-                            raw_payload = raw.get(b"payload")
-                            if raw_payload:
-                                try:
-                                    data = json.loads(raw_payload.decode())
-                                except Exception:
-                                    data = {}
-                            await handler(event_type, task_id, data)
-                            await r.xack(self.stream, self.group, msg_id)
-                        except Exception as e:
-                            logger.exception(
-                                "processing message %s failed: %s", msg_id, e
-                            )
+            await pipe.execute()
+
+    async def _touch_loop(self) -> None:
+        while not self._stopped:
+            await asyncio.sleep(self.touch_interval)
+            try:
+                await self._touch_buffered()
+            except Exception as e:
+                logger.warning("touching buffered messages failed: %s", e)
+
+    def _next_count(self, count: int, full: bool, min_count: int) -> int:
+        """double the read size while reads come back full, halve it otherwise"""
+        if full:
+            return min(count * 2, self.read_count_max)
+        return max(count // 2, min_count)
+
+    async def _free_capacity(self) -> int:
+        """number of free in-flight slots; waits until at least one is free"""
+        while len(self._in_flight) >= self.max_in_flight:
+            await asyncio.wait(self._in_flight, return_when=asyncio.FIRST_COMPLETED)
+        return self.max_in_flight - len(self._in_flight)
+
+    async def _read_weighted(self, r: Redis, budget: int):
+        """
+        weighted fair read across priority lanes: every lane gets a share of
+        `budget` proportional to its weight, and at least one entry so low
+        lanes always make progress; what a lane leaves unused passes on to
+        the next (lighter) lanes. only when all lanes are empty does it block,
+        on every lane at once.
+        """
+        lanes = self._lanes()
+        total = sum(self.lane_weights.get(lane, 1) for lane in lanes)
+        resp, spare = [], 0
+        for lane, streams in lanes.items():
+            quota = max(1, budget * self.lane_weights.get(lane, 1) // total) + spare
+            got = await r.xreadgroup(
+                self.group,
+                self.consumer_name,
+                streams={s: ">" for s in streams},
+                count=quota,
+            )
+            received = sum(len(messages) for _, messages in got or [])
+            spare = max(quota - received, 0)
+            resp.extend(got or [])
+        if resp:
+            return resp
+        return await r.xreadgroup(
+            self.group,
+            self.consumer_name,
+            streams={s: ">" for s in self.streams},
+            count=budget,
+            block=self.block_ms,
+        )
+
+    async def _read(self, r: Redis, count: int):
+        if len(self._lanes()) > 1:
+            return await self._read_weighted(r, count)
+        return await r.xreadgroup(
+            self.group,
+            self.consumer_name,
+            streams={s: ">" for s in self.streams},
+            count=count,
+            block=self.block_ms,
+        )
+
+    async def _lane_metrics_loop(self) -> None:
+        """per-lane backlog: the group's lag (redis 7+) summed over lane streams"""
+        while not self._stopped:
+            try:
+                r = await self._get_client()
+                for lane, streams in self._lanes().items():
+                    depth = 0
+                    for stream in streams:
+                        for g in await r.xinfo_groups(stream):
+                            name = g["name"]
+                            name = name.decode() if isinstance(name, bytes) else name
+                            if name == self.group and g.get("lag") is not None:
+                                depth += int(g["lag"])
+                    LANE_DEPTH.labels(lane).set(depth)
             except Exception as e:
-                logger.exception("consumer loop error: %s", e)
-                await asyncio.sleep(1.0)
+                logger.debug("lane metrics: %s", e)
+            await asyncio.sleep(settings.lane_metrics_interval)
+
+    async def run(
+        self,
+        handler: Callable[[str, str, dict], Awaitable[None]] | None = None,
+        read_count: int = 1,
+    ):
+        r = await self._get_client()
+        await self.ensure_group()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        acker = asyncio.create_task(self._ack_loop())
+        toucher = asyncio.create_task(self._touch_loop())
+        self._handler = handler
+        self._running = True
+        for stream in self.streams:
+            self._start_reclaimer(stream)
+        lane_metrics = asyncio.create_task(self._lane_metrics_loop())
+        count = read_count
+        try:
+            while not self._stopped:
+                try:
+                    request = min(count, await self._free_capacity())
+                    if not self.streams:
+                        # no partition assigned right now
+                        await asyncio.sleep(self.block_ms / 1000)
+                        continue
+                    resp = await self._read(r, request)
+                    received = sum(len(messages) for _, messages in resp or [])
+                    count = self._next_count(count, received >= request, read_count)
+                    if not resp:
+                        continue
+                    for stream, messages in resp:
+                        stream = (
+                            stream.decode() if isinstance(stream, bytes) else stream
+                        )
+                        for msg_id, raw in messages:
+                            self._observe_wait(stream, msg_id, raw)
+                        await self.dispatch_many(handler, messages, stream=stream)
+                except Exception as e:
+                    logger.exception("consumer loop error: %s", e)
+                    await asyncio.sleep(1.0)
+        finally:
+            self._running = False
+            for stream in list(self._reclaimers):
+                self._stop_reclaimer(stream)
+            lane_metrics.cancel()
+            toucher.cancel()
+            await self.drain()
+            acker.cancel()
+
+    async def drain(self) -> None:
+        """wait for in-flight (and type-limited waiting) handlers, flush their acks"""
+        pending = self._in_flight | self._waiting
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+        if self._client:
+            await self._flush_acks()
 
     async def stop(self):
         self._stopped = True
+        await self.drain()
         if self._client:
             await self._client.close()
             self._client = None
@@ -0,0 +1,212 @@
+# app/infra/event_bus/handlers.py
+"""
+Per event type handling limits.
+every registered event type gets:
+  - its own concurrency cap (handlers of the type running at once)
+  - an optional token-bucket rate limit, local to the process or shared by
+    every worker through one Redis hash per type
+  - a bounded buffer of messages waiting for the two above
+messages waiting on their type hold no slot of the consumer's global
+`max_in_flight`, and a full buffer never blocks the reader: the consumer
+defers the overflow through the delayed scheduler (see
+RedisStreamConsumer._defer), so a burst of one slow type cannot hold up the
+others.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict
+
+from prometheus_client import Counter, Gauge
+from app.settings import settings
+
+logger = logging.getLogger("event.handlers")
+
+HANDLER_RUNNING = Gauge(
+    "samurai_handler_running", "Handlers running, per event type", ["event_type"]
+)
+HANDLER_WAITING = Gauge(
+    "samurai_handler_waiting",
+    "Messages waiting for their type's concurrency or rate limit",
+    ["event_type"],
+)
+HANDLER_DEFERRED = Counter(
+    "samurai_handler_deferred_total",
+    "Messages deferred because their type's buffer was full",
+    ["event_type"],
+)
+HANDLER_THROTTLED = Counter(
+    "samurai_handler_throttled_seconds_total",
+    "Time spent waiting for rate-limit tokens, per event type",
+    ["event_type"],
+)
+
+# KEYS[1] = bucket hash; ARGV = rate (tokens/s), burst
+# returns "0" when a token was taken, else the seconds until one is available.
+# TIME inside a writing script needs effects replication (default since 5.0)
+TAKE_TOKEN = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(b[1]) or burst
+local ts = tonumber(b[2]) or now
+tokens = math.min(burst, tokens + math.max(now - ts, 0) * rate)
+local wait = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+else
+  wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return tostring(wait)
+"""
+
+
+def parse_handler_limits(spec: str) -> Dict[str, dict]:
+    """
+    'task.created:16:200,report.build:2:5:10' ->
+    {'task.created': {'max_concurrency': 16, 'rate': 200.0, 'burst': None}, ...}
+    (event_type:max_concurrency[:rate per second[:burst]]; 0 = unlimited)
+    """
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        event_type, *params = [p.strip() for p in item.split(":")]
+        params += ["0"] * (3 - len(params))
+        limits[event_type] = {
+            "max_concurrency": int(params[0]) or None,
+            "rate": float(params[1]) or None,
+            "burst": float(params[2]) or None,
+        }
+    return limits
+
+
+class TokenBucket:
+    """in-process token bucket; waiters are served in arrival order"""
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self._tokens = self.burst
+        self._ts = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """take one token; returns the seconds waited for it"""
+        waited = 0.0
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(
+                    self.burst, self._tokens + (now - self._ts) * self.rate
+                )
+                self._ts = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+
+class RedisTokenBucket:
+    """
+    token bucket shared by every worker, one Lua call per token.
+    on Redis errors it falls back to a local bucket with the same limits.
+    """
+
+    def __init__(self, get_client, key: str, rate: float, burst: float | None = None):
+        self._get_client = get_client
+        self.key = key
+        self.rate = rate
+        self.burst = burst or max(rate, 1.0)
+        self._script = None
+        self._fallback = TokenBucket(rate, burst)
+
+    async def acquire(self) -> float:
+        waited = 0.0
+        while True:
+            try:
+                if self._script is None:
+                    self._script = (await self._get_client()).register_script(
+                        TAKE_TOKEN
+                    )
+                wait = float(
+                    await self._script(keys=[self.key], args=[self.rate, self.burst])
+                )
+            except Exception as e:
+                logger.warning("shared rate limit %s unavailable: %s", self.key, e)
+                return waited + await self._fallback.acquire()
+            if wait <= 0:
+                return waited
+            waited += wait
+            await asyncio.sleep(wait)
+
+
+class EventHandler:
+    """a registered handler with the limits of its event type"""
+
+    def __init__(
+        self,
+        event_type: str,
+        handler: Callable[[str, str, dict], Awaitable[None]],
+        max_concurrency: int | None = None,
+        limiter: TokenBucket | RedisTokenBucket | None = None,
+        max_waiting: int | None = None,
+    ):
+        self.event_type = event_type
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.limiter = limiter
+        self._slots = asyncio.Semaphore(max_concurrency) if max_concurrency else None
+        waiting = max_waiting or settings.handler_max_waiting
+        # running + waiting messages of this type held by the process
+        self.capacity = (max_concurrency or 0) + waiting
+        self._admitted = 0
+        self._waiting = 0
+
+    @property
+    def limited(self) -> bool:
+        return self._slots is not None or self.limiter is not None
+
+    def try_admit(self) -> bool:
+        """take a place in this type's buffer; False (never waits) when it is full"""
+        if self._admitted >= self.capacity:
+            return False
+        self._admitted += 1
+        self._set_waiting(1)
+        return True
+
+    def _set_waiting(self, delta: int) -> None:
+        self._waiting += delta
+        HANDLER_WAITING.labels(self.event_type).set(self._waiting)
+
+    async def run_limited(self, start: Callable[[], Awaitable[None]]) -> None:
+        """wait for the type's limits, then `start()` (which runs the handler)"""
+        slot = started = False
+        try:
+            if self._slots is not None:
+                await self._slots.acquire()
+                slot = True
+            if self.limiter is not None:
+                waited = await self.limiter.acquire()
+                if waited:
+                    HANDLER_THROTTLED.labels(self.event_type).inc(waited)
+            started = True
+            self._set_waiting(-1)
+            HANDLER_RUNNING.labels(self.event_type).inc()
+            try:
+                await start()
+            finally:
+                HANDLER_RUNNING.labels(self.event_type).dec()
+        finally:
+            if not started:
+                # cancelled while waiting
+                self._set_waiting(-1)
+            if slot:
+                self._slots.release()
+            self._admitted -= 1
@@ -0,0 +1,53 @@
+# app/infra/event_bus/lanes.py
+"""
+Priority lanes.
+each priority has its own stream (and partitions): the default lane keeps
+`stream_name`, other lanes use `{stream_name}:{lane}`. consumers read the
+lanes with weighted fair scheduling (see RedisStreamConsumer).
+"""
+
+from typing import Dict, List
+
+from app.infra.event_bus.partitioning import all_streams, stream_for_partition
+from app.settings import settings
+
+
+def parse_lanes(spec: str) -> Dict[str, int]:
+    """'high:8,normal:4,low:1' -> {'high': 8, 'normal': 4, 'low': 1}, heaviest first"""
+    lanes = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, weight = item.partition(":")
+        lanes[name.strip()] = max(int(weight or 1), 1)
+    return dict(sorted(lanes.items(), key=lambda kv: -kv[1]))
+
+
+def lane_weights() -> Dict[str, int]:
+    lanes = parse_lanes(settings.priority_lanes)
+    lanes.setdefault(settings.default_priority, 1)
+    return lanes
+
+
+def lane_base(lane: str | None = None) -> str:
+    lane = lane or settings.default_priority
+    if lane == settings.default_priority:
+        return settings.stream_name
+    return f"{settings.stream_name}:{lane}"
+
+
+def lane_bases() -> List[str]:
+    return [lane_base(lane) for lane in lane_weights()]
+
+
+def lane_streams(partitions: List[int]) -> Dict[str, str]:
+    """stream -> lane for the given partitions of every lane"""
+    return {
+        stream_for_partition(p, lane_base(lane)): lane
+        for lane in lane_weights()
+        for p in partitions
+    }
+
+
+def all_lane_streams() -> List[str]:
+    return [s for lane in lane_weights() for s in all_streams(lane_base(lane))]
@@ -0,0 +1,121 @@
+# app/infra/event_bus/partitioning.py
+"""
+Hash-partitioned streams.
+with `stream_partitions = N > 1` every task goes to `{stream_name}:{p}` where
+p = crc32(task_id) % N, so all events of one task land in the same partition
+and keep their order there; with N = 1 the plain `stream_name` is used.
+
+rebalancing: workers heartbeat into a sorted set `{stream_name}:members`;
+live members are sorted by name and partition p belongs to member p % M.
+when a worker joins or leaves (its heartbeat expires) every worker recomputes
+its share on the next tick; entries a leaving worker did not ack are picked
+up by the new owner's PendingReclaimer.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+import zlib
+from typing import Awaitable, Callable, List
+
+from redis.asyncio import Redis
+from app.settings import settings
+
+logger = logging.getLogger("event.partitioning")
+
+
+def partition_for(task_id, partitions: int | None = None) -> int:
+    partitions = partitions or settings.stream_partitions
+    try:
+        key = str(uuid.UUID(str(task_id)))
+    except ValueError:
+        key = str(task_id)
+    return zlib.crc32(key.encode()) % partitions
+
+
+def stream_for_partition(partition: int, base: str | None = None) -> str:
+    base = base or settings.stream_name
+    if settings.stream_partitions <= 1:
+        return base
+    return f"{base}:{partition}"
+
+
+def stream_for(task_id, base: str | None = None) -> str:
+    if settings.stream_partitions <= 1:
+        return base or settings.stream_name
+    return stream_for_partition(partition_for(task_id), base)
+
+
+def all_streams(base: str | None = None) -> List[str]:
+    return [
+        stream_for_partition(p, base) for p in range(max(settings.stream_partitions, 1))
+    ]
+
+
+def parse_partitions(spec: str) -> List[int]:
+    """'0,2,5' -> [0, 2, 5]"""
+    return [int(p) for p in spec.split(",") if p.strip()]
+
+
+def assign(member: str, members: List[str], partitions: int) -> List[int]:
+    """partitions of `member`, spread round-robin over the sorted live members"""
+    members = sorted(members)
+    if member not in members:
+        return []
+    idx = members.index(member)
+    return [p for p in range(partitions) if p % len(members) == idx]
+
+
+class PartitionCoordinator:
+    def __init__(
+        self,
+        redis: Redis,
+        member: str,
+        base: str | None = None,
+        partitions: int | None = None,
+        ttl: float | None = None,
+    ):
+        self.redis = redis
+        self.member = member
+        self.base = base or settings.stream_name
+        self.partitions = partitions or settings.stream_partitions
+        self.ttl = ttl or settings.partition_member_ttl
+        self.key = f"{self.base}:members"
+        self._assigned: List[int] | None = None
+        self._stopped = False
+
+    async def heartbeat(self) -> List[str]:
+        """refresh our membership and return the live members"""
+        now = time.time()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.zadd(self.key, {self.member: now})
+            pipe.zremrangebyscore(self.key, "-inf", now - self.ttl)
+            pipe.zrange(self.key, 0, -1)
+            *_, members = await pipe.execute()
+        return [m.decode() if isinstance(m, bytes) else m for m in members]
+
+    async def current_partitions(self) -> List[int]:
+        members = await self.heartbeat()
+        self._assigned = assign(self.member, members, self.partitions)
+        return self._assigned
+
+    async def run(self, on_change: Callable[[List[int]], Awaitable[None]]):
+        """heartbeat every ttl/3 and call `on_change` when our share changes"""
+        while not self._stopped:
+            try:
+                before = self._assigned
+                partitions = await self.current_partitions()
+                if partitions != before:
+                    logger.info("%s now owns partitions %s", self.member, partitions)
+                    await on_change(partitions)
+            except Exception as e:
+                logger.exception("partition heartbeat failed: %s", e)
+            await asyncio.sleep(self.ttl / 3)
+
+    async def leave(self):
+        self._stopped = True
+        try:
+            await self.redis.zrem(self.key, self.member)
+        except Exception as e:
+            logger.debug("leaving partition group: %s", e)
@@ -3,14 +3,16 @@
 Redis Stream producer wrapper.
 (در این پروژه از Flusher برای انتشار outbox استفاده کردم؛ ولی producer جدا مفید است برای تست و reuse)
 """
-import json
+
 from redis.asyncio import from_url
+from app.infra.event_bus.codec import encode_entry, get_codec
 from app.settings import settings
 
 
 class RedisStreamProducer:
-    def __init__(self, redis_url: str = None):
+    def __init__(self, redis_url: str = None, codec: str = None):
         self._redis_url = redis_url or settings.redis_url
+        self._codec = get_codec(codec or settings.stream_codec)
         self._client = None
 
     async def client(self):
@@ -20,7 +22,7 @@ class RedisStreamProducer:
 
     async def publish(self, stream: str, event_type: str, payload: dict) -> str:
         r = await self.client()
-        entry = {"type": event_type, "payload": json.dumps(payload)}
+        entry = encode_entry(event_type, payload, self._codec)
         stream_id = await r.xadd(stream, entry)
         return str(stream_id)
 
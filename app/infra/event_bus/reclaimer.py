@@ -0,0 +1,151 @@
+# app/infra/event_bus/reclaimer.py
+"""
+Pending entries reclaimer.
+entries of a dead worker stay in the group's PEL forever, because consumers
+only read '>'. the reclaimer XAUTOCLAIMs entries idle for too long into its
+own consumer and hands them to the handler again; entries delivered more
+than `max_deliveries` times are moved to a dead-letter stream.
+"""
+
+import asyncio
+import logging
+from typing import Callable, Awaitable
+
+from prometheus_client import Counter, Gauge
+from redis.asyncio import Redis
+from app.settings import settings
+
+logger = logging.getLogger("event.reclaimer")
+
+STREAM_PEL_SIZE = Gauge(
+    "samurai_stream_pel_size",
+    "Pending entries of a consumer group",
+    ["stream", "group"],
+)
+STREAM_RECLAIMED = Counter(
+    "samurai_stream_reclaimed_total", "Pending entries reclaimed", ["stream"]
+)
+STREAM_DEAD_LETTERED = Counter(
+    "samurai_stream_dead_lettered_total", "Entries moved to dead-letter", ["stream"]
+)
+
+
+class PendingReclaimer:
+    def __init__(
+        self,
+        consumer,
+        handler: Callable[[str, str, dict], Awaitable[None]],
+        interval: float | None = None,
+        min_idle_ms: int | None = None,
+        count: int | None = None,
+        max_deliveries: int | None = None,
+        dead_letter_stream: str | None = None,
+        stream: str | None = None,
+    ):
+        self.consumer = consumer
+        self.stream = stream or consumer.stream
+        self.handler = handler
+        self.interval = interval or settings.consumer_reclaim_interval
+        self.min_idle_ms = min_idle_ms or settings.consumer_reclaim_idle_ms
+        self.count = count or settings.consumer_reclaim_count
+        self.max_deliveries = max_deliveries or settings.consumer_max_deliveries
+        self.dead_letter_stream = dead_letter_stream or settings.dead_letter_stream
+        self._cursor = "0-0"
+        self._stopped = False
+
+    async def _delivery_counts(self, r: Redis, messages) -> dict:
+        """
+        times_delivered of the claimed entries, one pipelined XPENDING per id:
+        a single id range would also hold entries XAUTOCLAIM skipped (not idle
+        yet, or owned elsewhere) and crowd claimed ids out of its count
+        """
+        async with r.pipeline(transaction=False) as pipe:
+            for msg_id, _ in messages:
+                pipe.xpending_range(
+                    self.stream, self.consumer.group, min=msg_id, max=msg_id, count=1
+                )
+            results = await pipe.execute()
+        return {
+            row["message_id"]: row["times_delivered"]
+            for rows in results
+            for row in rows
+        }
+
+    async def _dead_letter(self, r: Redis, msg_id, raw: dict, deliveries: int):
+        entry = dict(raw or {})
+        entry.update(
+            {
+                "source_stream": self.stream,
+                "source_id": msg_id,
+                "deliveries": deliveries,
+                "error": self.consumer.last_error(msg_id, self.stream)
+                or "max deliveries exceeded",
+            }
+        )
+        async with r.pipeline(transaction=True) as pipe:
+            pipe.xadd(self.dead_letter_stream, entry)
+            pipe.xack(self.stream, self.consumer.group, msg_id)
+            await pipe.execute()
+        self.consumer.forget_error(msg_id, self.stream)
+        STREAM_DEAD_LETTERED.labels(self.stream).inc()
+        logger.warning(
+            "moved %s to %s after %s deliveries",
+            msg_id,
+            self.dead_letter_stream,
+            deliveries,
+        )
+
+    async def reclaim_once(self) -> int:
+        """one XAUTOCLAIM sweep step; returns the number of reclaimed entries"""
+        r = await self.consumer.get_client()
+        stream, group = self.stream, self.consumer.group
+
+        summary = await r.xpending(stream, group)
+        STREAM_PEL_SIZE.labels(stream, group).set(summary["pending"])
+        if not summary["pending"]:
+            return 0
+
+        resp = await r.xautoclaim(
+            stream,
+            group,
+            self.consumer.consumer_name,
+            min_idle_time=self.min_idle_ms,
+            start_id=self._cursor,
+            count=self.count,
+        )
+        self._cursor, messages = resp[0], resp[1]
+        # entries deleted from the stream (redis 7+) can only be acked
+        deleted = list(resp[2] or []) if len(resp) > 2 else []
+        if deleted:
+            await r.xack(stream, group, *deleted)
+        messages = [m for m in messages if m[0] is not None and m[1] is not None]
+        if not messages:
+            return 0
+
+        STREAM_RECLAIMED.labels(stream).inc(len(messages))
+        deliveries = await self._delivery_counts(r, messages)
+        live = []
+        for msg_id, raw in messages:
+            n = deliveries.get(msg_id, 0)
+            if n > self.max_deliveries:
+                await self._dead_letter(r, msg_id, raw, n)
+            else:
+                live.append((msg_id, raw))
+        await self.consumer.dispatch_many(self.handler, live, stream=stream)
+        return len(messages)
+
+    async def run(self):
+        while not self._stopped:
+            try:
+                reclaimed = await self.reclaim_once()
+                # a full step means the sweep is not finished yet
+                if reclaimed < self.count or self._cursor in ("0-0", b"0-0"):
+                    await asyncio.sleep(self.interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception("reclaim loop error: %s", e)
+                await asyncio.sleep(self.interval)
+
+    def stop(self):
+        self._stopped = True
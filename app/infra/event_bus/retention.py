@@ -0,0 +1,117 @@
+# app/infra/event_bus/retention.py
+"""
+Stream retention.
+entries are trimmed with XTRIM MINID only once every consumer group has
+delivered *and* acknowledged them: the boundary is, per group, the oldest
+pending id (XPENDING) or, when nothing is pending, the last delivered id
+(XINFO GROUPS); the stream is trimmed up to the lowest boundary of all groups.
+"""
+
+import asyncio
+import logging
+from typing import Iterable
+
+from prometheus_client import Counter, Gauge
+from redis.asyncio import from_url, Redis
+from app.infra.event_bus.codec import as_text
+from app.settings import settings
+
+logger = logging.getLogger("event.retention")
+
+STREAM_LENGTH = Gauge("samurai_stream_length", "Entries in a stream", ["stream"])
+STREAM_TRIMMED = Counter(
+    "samurai_stream_trimmed_entries_total", "Entries trimmed from a stream", ["stream"]
+)
+STREAM_BYTES_RECLAIMED = Counter(
+    "samurai_stream_trimmed_bytes_total",
+    "Memory reclaimed by stream trimming (MEMORY USAGE delta)",
+    ["stream"],
+)
+
+
+def parse_id(stream_id) -> tuple[int, int]:
+    ms, _, seq = as_text(stream_id).partition("-")
+    return int(ms), int(seq or 0)
+
+
+class StreamTrimmer:
+    def __init__(
+        self,
+        streams: Iterable[str],
+        redis_url: str | None = None,
+        interval: float | None = None,
+        max_len: int | None = None,
+    ):
+        self.streams = list(streams)
+        self.redis_url = redis_url or settings.redis_url
+        self.interval = interval or settings.stream_trim_interval
+        self.max_len = settings.stream_max_len if max_len is None else max_len
+        self._client: Redis | None = None
+        self._running = False
+
+    async def _get_client(self) -> Redis:
+        if not self._client:
+            self._client = from_url(self.redis_url)
+        return self._client
+
+    async def safe_min_id(self, r: Redis, stream: str) -> str | None:
+        """lowest id still needed by some group; None when nothing may be trimmed"""
+        groups = await r.xinfo_groups(stream)
+        if not groups:
+            # nobody consumes the stream yet: keep everything
+            return None
+        boundaries = []
+        for g in groups:
+            if int(g["pending"]):
+                summary = await r.xpending(stream, g["name"])
+                boundaries.append(as_text(summary["min"]))
+            else:
+                boundaries.append(as_text(g["last-delivered-id"]))
+        return min(boundaries, key=parse_id)
+
+    async def trim_stream(self, r: Redis, stream: str) -> int:
+        if not await r.exists(stream):
+            return 0
+        before_bytes = await r.memory_usage(stream) or 0
+        trimmed = 0
+
+        min_id = await self.safe_min_id(r, stream)
+        if min_id is not None and min_id != "0-0":
+            # approximate (~) trims whole radix-tree nodes only: cheap
+            trimmed += await r.xtrim(stream, minid=min_id, approximate=True)
+        if self.max_len:
+            # memory guard: may drop entries not yet acknowledged
+            trimmed += await r.xtrim(stream, maxlen=self.max_len, approximate=True)
+
+        STREAM_LENGTH.labels(stream).set(await r.xlen(stream))
+        if trimmed:
+            after_bytes = await r.memory_usage(stream) or 0
+            STREAM_TRIMMED.labels(stream).inc(trimmed)
+            STREAM_BYTES_RECLAIMED.labels(stream).inc(
+                max(before_bytes - after_bytes, 0)
+            )
+            logger.info("Trimmed %s entries from %s", trimmed, stream)
+        return trimmed
+
+    async def run_once(self) -> int:
+        r = await self._get_client()
+        total = 0
+        for stream in self.streams:
+            try:
+                total += await self.trim_stream(r, stream)
+            except Exception as e:
+                logger.exception("trimming %s failed: %s", stream, e)
+        return total
+
+    async def run_loop(self):
+        self._running = True
+        logger.info("Stream trimmer started for %s", self.streams)
+        while self._running:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        self._running = False
+        if self._client:
+            await self._client.aclose()
+            self._client = None
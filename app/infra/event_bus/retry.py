@@ -0,0 +1,134 @@
+# app/infra/event_bus/retry.py
+"""
+Retries of failed handlers.
+a failure bumps tasks.attempts and stores last_error in one UPDATE; below the
+task name's limit the event is handed to the delayed scheduler with an
+exponential, jittered backoff and the original message is acked, so the
+consumer never sleeps on a retry and a failing task holds no in-flight slot
+while it waits. at the limit the task is marked `failed`.
+"""
+
+import logging
+import random
+import time
+from typing import Dict
+
+from prometheus_client import Counter
+from redis.asyncio import Redis
+from app.infra.db.repo_async import AsyncTaskRepository
+from app.infra.event_bus.codec import encode_entry, get_codec
+from app.infra.event_bus.scheduler import schedule
+from app.infra.redis.task_cache import TaskCache, get_task_cache
+from app.settings import settings
+
+logger = logging.getLogger("event.retry")
+
+TASKS_RETRIED = Counter(
+    "samurai_task_retries_total", "Failed tasks scheduled for another attempt", ["name"]
+)
+TASKS_FAILED = Counter(
+    "samurai_tasks_failed_total", "Tasks that ran out of attempts", ["name"]
+)
+
+ERROR_MAX_LEN = 2000
+
+
+def parse_limits(spec: str) -> Dict[str, int]:
+    """'email:10,report:2' -> {'email': 10, 'report': 2}"""
+    limits = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, _, limit = item.partition(":")
+        limits[name.strip()] = max(int(limit or 1), 1)
+    return limits
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_attempts: int | None = None,
+        base: float | None = None,
+        cap: float | None = None,
+        limits: Dict[str, int] | None = None,
+    ):
+        self.max_attempts = max_attempts or settings.retry_max_attempts
+        self.base = base or settings.retry_backoff_base
+        self.cap = cap or settings.retry_backoff_max
+        self.limits = parse_limits(settings.retry_limits) if limits is None else limits
+
+    def attempts_for(self, name: str | None) -> int:
+        return self.limits.get(name or "", self.max_attempts)
+
+    def backoff(self, attempt: int) -> float:
+        """
+        base * 2^(attempt-1), capped, with "equal jitter": half of the delay
+        is kept as a floor, the other half is random so retries spread out
+        """
+        delay = min(self.cap, self.base * 2 ** max(attempt - 1, 0))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetryEngine:
+    def __init__(
+        self,
+        repo: AsyncTaskRepository,
+        policy: RetryPolicy | None = None,
+        scheduler_key: str | None = None,
+        cache: TaskCache | None = None,
+    ):
+        self.repo = repo
+        self.cache = cache if cache is not None else get_task_cache()
+        self.policy = policy or RetryPolicy()
+        self.scheduler_key = scheduler_key or settings.scheduler_key
+        self.codec = get_codec(settings.stream_codec)
+
+    async def on_failure(
+        self,
+        r: Redis,
+        stream: str,
+        event_type: str,
+        task_id: str,
+        data: dict,
+        exc,
+        outbox_id: str | None = None,
+    ) -> None:
+        """record the failure and schedule the next attempt, or give up"""
+        name = data.get("name")
+        error = f"{type(exc).__name__}: {exc}"[:ERROR_MAX_LEN]
+        result = await self.repo.record_task_failure(
+            task_id, error, self.policy.attempts_for(name)
+        )
+        if result is None:
+            logger.warning("Failed event for unknown task %s dropped", task_id)
+            return
+        attempts, state = result
+        if self.cache is not None:
+            # running -> retrying / failed, with attempts and last_error
+            await self.cache.invalidate([task_id])
+        if state == "failed":
+            TASKS_FAILED.labels(name or "").inc()
+            logger.warning("Task %s failed after %s attempts", task_id, attempts)
+            return
+
+        delay = self.policy.backoff(attempts)
+        extra = {"attempt": attempts}
+        if outbox_id:
+            # keeps the event's identity for consumer-side dedupe
+            extra["outbox_id"] = outbox_id
+        entry = encode_entry(event_type, data, self.codec, **extra)
+        async with r.pipeline(transaction=False) as pipe:
+            # one item per attempt: a redelivered failure cannot double-schedule
+            schedule(
+                pipe,
+                stream,
+                entry,
+                time.time() + delay,
+                f"retry:{task_id}:{attempts}",
+                key=self.scheduler_key,
+            )
+            await pipe.execute()
+        TASKS_RETRIED.labels(name or "").inc()
+        logger.info(
+            "Task %s attempt %s failed, retry in %.2fs", task_id, attempts, delay
+        )
@@ -0,0 +1,204 @@
+# app/infra/event_bus/scheduler.py
+"""
+Delayed delivery.
+a scheduled entry is kept in Redis until it is due, per target stream:
+  - `<key>:{<stream>}` ZSET: member = item id, score = due time (epoch seconds)
+  - `<key>:{<stream>}:item:<id>` HASH: the fields of the stream entry
+the hash tag puts both in the cluster slot of the stream itself, so the Lua
+script that moves due items (XADD, then DEL + ZREM) gets every key it
+touches in KEYS and runs on one node. ids are read first with
+ZRANGEBYSCORE ... LIMIT; the script moves only those still due, so any number
+of schedulers can run side by side without an item being delivered twice.
+stream names must not contain braces.
+"""
+
+import asyncio
+import logging
+import time
+from typing import List
+
+from prometheus_client import Counter, Gauge
+from redis.asyncio import from_url, Redis
+from app.infra.event_bus.codec import as_text
+from app.infra.event_bus.lanes import all_lane_streams
+from app.settings import settings
+
+logger = logging.getLogger("event.scheduler")
+
+SCHEDULED_MOVED = Counter(
+    "samurai_scheduled_moved_total", "Scheduled entries moved to their stream"
+)
+SCHEDULED_SIZE = Gauge("samurai_scheduled_size", "Entries waiting in the scheduler")
+
+# target stream field of items in the single, untagged ZSET of older versions
+STREAM_FIELD = "__stream"
+
+# KEYS = zset, stream, item hashes; ARGV = now, then the item ids of KEYS[3..]
+MOVE_DUE = """
+local moved = 0
+for i = 2, #ARGV do
+  local score = redis.call('ZSCORE', KEYS[1], ARGV[i])
+  if score and tonumber(score) <= tonumber(ARGV[1]) then
+    local fields = redis.call('HGETALL', KEYS[i + 1])
+    if #fields > 0 then
+      redis.call('XADD', KEYS[2], '*', unpack(fields))
+    end
+    redis.call('DEL', KEYS[i + 1])
+    redis.call('ZREM', KEYS[1], ARGV[i])
+    moved = moved + 1
+  end
+end
+return moved
+"""
+
+
+def schedule_key(stream: str, key: str | None = None) -> str:
+    """the ZSET of entries due for `stream`, in the stream's cluster slot"""
+    return f"{key or settings.scheduler_key}:{{{stream}}}"
+
+
+def item_key(zset: str, item_id) -> str:
+    return f"{zset}:item:{item_id}"
+
+
+def schedule(
+    pipe, stream: str, entry: dict, due: float, item_id, key: str | None = None
+):
+    """
+    queue HSET + ZADD of one entry on pipeline `pipe`.
+    HSET goes first: an id in the ZSET always has its fields.
+    re-scheduling the same id overwrites it, so retried publishes are idempotent.
+    both keys share the slot of `stream`, so a MULTI may also touch the stream.
+    """
+    zset = schedule_key(stream, key)
+    pipe.hset(item_key(zset, item_id), mapping=entry)
+    pipe.zadd(zset, {str(item_id): due})
+
+
+class DelayedScheduler:
+    def __init__(
+        self,
+        redis_url: str | None = None,
+        key: str | None = None,
+        batch_size: int | None = None,
+        tick: float | None = None,
+        streams: List[str] | None = None,
+    ):
+        self.redis_url = redis_url or settings.redis_url
+        self.key = key or settings.scheduler_key
+        self.batch_size = batch_size or settings.scheduler_batch_size
+        self.tick = tick or settings.scheduler_tick
+        # every stream entries are scheduled for: the lanes and their partitions
+        self.streams = streams if streams is not None else all_lane_streams()
+        self._client: Redis | None = None
+        self._script = None
+        self._running = False
+
+    async def _get_client(self) -> Redis:
+        if not self._client:
+            self._client = from_url(self.redis_url)
+            # Script runs through EVALSHA and reloads itself on NOSCRIPT
+            self._script = self._client.register_script(MOVE_DUE)
+        return self._client
+
+    async def move_due(self, now: float | None = None) -> int:
+        """move up to batch_size due entries per stream; returns how many moved"""
+        r = await self._get_client()
+        now = time.time() if now is None else now
+        zsets = [schedule_key(stream, self.key) for stream in self.streams]
+        async with r.pipeline(transaction=False) as pipe:
+            for zset in zsets:
+                pipe.zrangebyscore(zset, "-inf", now, start=0, num=self.batch_size)
+            due = await pipe.execute()
+        moved = 0
+        for stream, zset, ids in zip(self.streams, zsets, due):
+            if not ids:
+                continue
+            ids = [as_text(i) for i in ids]
+            moved += int(
+                await self._script(
+                    keys=[zset, stream, *[item_key(zset, i) for i in ids]],
+                    args=[now, *ids],
+                )
+            )
+        if moved:
+            SCHEDULED_MOVED.inc(moved)
+        return moved
+
+    async def migrate_legacy(self) -> int:
+        """
+        move items of the single, untagged ZSET older versions used into the
+        per-stream ZSETs. written before deleted and keyed by the same id,
+        so an interrupted run is simply done again
+        """
+        r = await self._get_client()
+        legacy = self.key
+        moved = 0
+        while True:
+            batch = await r.zrange(legacy, 0, 99, withscores=True)
+            if not batch:
+                return moved
+            for item_id, due in batch:
+                item_id = as_text(item_id)
+                fields = {
+                    as_text(k): v
+                    for k, v in (await r.hgetall(item_key(legacy, item_id))).items()
+                }
+                stream = as_text(fields.pop(STREAM_FIELD, b""))
+                async with r.pipeline(transaction=False) as pipe:
+                    if stream and fields:
+                        schedule(pipe, stream, fields, due, item_id, key=self.key)
+                    pipe.delete(item_key(legacy, item_id))
+                    pipe.zrem(legacy, item_id)
+                    await pipe.execute()
+                moved += 1
+
+    async def _backlog(self, r: Redis) -> tuple[int, float | None]:
+        """entries waiting over all streams, and the earliest due time"""
+        async with r.pipeline(transaction=False) as pipe:
+            for stream in self.streams:
+                zset = schedule_key(stream, self.key)
+                pipe.zcard(zset)
+                pipe.zrange(zset, 0, 0, withscores=True)
+            results = await pipe.execute()
+        size = sum(results[0::2])
+        heads = [head[0][1] for head in results[1::2] if head]
+        return size, min(heads) if heads else None
+
+    async def run_loop(self) -> None:
+        self._running = True
+        logger.info(
+            "Scheduler started (key=%s, streams=%s, batch_size=%s)",
+            self.key,
+            len(self.streams),
+            self.batch_size,
+        )
+        try:
+            migrated = await self.migrate_legacy()
+            if migrated:
+                logger.info("Moved %s entries of the old scheduler key", migrated)
+        except Exception as e:
+            logger.warning("Moving entries of the old scheduler key failed: %s", e)
+        while self._running:
+            try:
+                r = await self._get_client()
+                moved = await self.move_due()
+                size, earliest = await self._backlog(r)
+                SCHEDULED_SIZE.set(size)
+                # a full batch means more is due: go again right away
+                if moved >= self.batch_size:
+                    continue
+                # until the earliest due entry, at most one tick
+                sleep = self.tick
+                if earliest is not None:
+                    sleep = min(max(earliest - time.time(), 0.0), self.tick)
+                await asyncio.sleep(sleep)
+            except Exception as e:
+                logger.exception("Scheduler loop error: %s", e)
+                await asyncio.sleep(1.0)
+
+    async def stop(self) -> None:
+        self._running = False
+        if self._client:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,131 @@
+# app/infra/monitoring/collector.py
+"""
+Pipeline backlog metrics.
+sampled on an interval rather than taken from whatever batch a component
+happened to see, so they keep growing with the backlog:
+  - outbox: unpublished rows and the age of the oldest one (partial index)
+  - streams: length, and per consumer group lag and PEL size, for every lane
+    and partition stream plus the dead-letter stream (one pipelined round trip)
+  - tasks: rows per state. active states are counted every interval; finished
+    states grow with history, so they are counted every `terminal_interval`
+"""
+
+import asyncio
+import logging
+import time
+from typing import List
+
+from prometheus_client import Gauge
+from redis.asyncio import from_url, Redis
+from app.domain.models import TaskState
+from app.infra.db.repo_async import AsyncTaskRepository
+from app.infra.event_bus.codec import as_text
+from app.infra.event_bus.lanes import all_lane_streams
+from app.infra.event_bus.reclaimer import STREAM_PEL_SIZE
+from app.infra.event_bus.retention import STREAM_LENGTH
+from app.settings import settings
+
+logger = logging.getLogger("metrics.collector")
+
+OUTBOX_PENDING = Gauge("samurai_outbox_pending", "Unpublished outbox events")
+OUTBOX_OLDEST_AGE = Gauge(
+    "samurai_outbox_oldest_unpublished_seconds",
+    "Age of the oldest unpublished outbox event (0 when there is none)",
+)
+STREAM_LAG = Gauge(
+    "samurai_stream_lag",
+    "Entries not yet delivered to a consumer group",
+    ["stream", "group"],
+)
+TASKS_BY_STATE = Gauge("samurai_tasks_by_state", "Tasks per state", ["state"])
+
+ACTIVE_STATES = (TaskState.PENDING, TaskState.RUNNING, TaskState.RETRYING)
+
+
+class MetricsCollector:
+    def __init__(
+        self,
+        repo: AsyncTaskRepository,
+        streams: List[str] | None = None,
+        redis_url: str | None = None,
+        interval: float | None = None,
+        terminal_interval: float | None = None,
+    ):
+        self.repo = repo
+        self.streams = (
+            streams
+            if streams is not None
+            else [*all_lane_streams(), settings.dead_letter_stream]
+        )
+        self.redis_url = redis_url or settings.redis_url
+        self.interval = interval or settings.metrics_interval
+        self.terminal_interval = terminal_interval or settings.metrics_terminal_interval
+        self._terminal_at = 0.0
+        self._client: Redis | None = None
+        self._running = False
+
+    async def _get_client(self) -> Redis:
+        if not self._client:
+            self._client = from_url(self.redis_url)
+        return self._client
+
+    async def collect_outbox(self) -> None:
+        count, age = await self.repo.outbox_backlog()
+        OUTBOX_PENDING.set(count)
+        OUTBOX_OLDEST_AGE.set(age or 0)
+
+    async def collect_streams(self) -> None:
+        r = await self._get_client()
+        async with r.pipeline(transaction=False) as pipe:
+            for stream in self.streams:
+                pipe.xlen(stream)
+                pipe.xinfo_groups(stream)
+            # a stream that does not exist yet fails XINFO only
+            results = await pipe.execute(raise_on_error=False)
+        for i, stream in enumerate(self.streams):
+            length, groups = results[2 * i], results[2 * i + 1]
+            STREAM_LENGTH.labels(stream).set(length)
+            if isinstance(groups, Exception):
+                continue
+            for g in groups:
+                group = as_text(g["name"])
+                STREAM_PEL_SIZE.labels(stream, group).set(int(g.get("pending") or 0))
+                # lag is unknown (None) after deletions in the group's range
+                if g.get("lag") is not None:
+                    STREAM_LAG.labels(stream, group).set(int(g["lag"]))
+
+    async def collect_tasks(self, now: float) -> None:
+        if now >= self._terminal_at:
+            counts = await self.repo.count_tasks_by_state()
+            states = set(ACTIVE_STATES) | set(TaskState.TERMINAL) | set(counts)
+            self._terminal_at = now + self.terminal_interval
+        else:
+            counts = await self.repo.count_tasks_by_state(ACTIVE_STATES)
+            states = ACTIVE_STATES
+        for state in states:
+            TASKS_BY_STATE.labels(state).set(counts.get(state, 0))
+
+    async def collect_once(self, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        # independent sources: one failing does not stop the others
+        for name, collect in (
+            ("outbox", self.collect_outbox),
+            ("streams", self.collect_streams),
+            ("tasks", lambda: self.collect_tasks(now)),
+        ):
+            try:
+                await collect()
+            except Exception as e:
+                logger.warning("Collecting %s metrics failed: %s", name, e)
+
+    async def run_loop(self) -> None:
+        self._running = True
+        while self._running:
+            await self.collect_once()
+            await asyncio.sleep(self.interval)
+
+    async def stop(self) -> None:
+        self._running = False
+        if self._client:
+            await self._client.close()
+            self._client = None
@@ -0,0 +1,89 @@
+# app/infra/outbox/archiver.py
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from prometheus_client import Counter
+from app.infra.db.repo_async import AsyncTaskRepository
+from app.settings import settings
+
+
+logger = logging.getLogger("outbox.archiver")
+
+OUTBOX_ARCHIVED = Counter(
+    "samurai_outbox_archived_total", "Published outbox rows archived or purged"
+)
+
+
+class OutboxArchiver:
+    """
+    Keeps outbox_events small: published rows older than the retention are
+    deleted (or moved to outbox_events_archive) in bounded batches,
+    so the flusher's hot set does not grow with history.
+    Expired idempotency keys are purged on the same schedule.
+    """
+
+    def __init__(
+        self,
+        repo: AsyncTaskRepository,
+        retention_hours: float | None = None,
+        batch_size: int | None = None,
+        interval: float | None = None,
+        archive: bool | None = None,
+    ):
+        self.repo = repo
+        self.retention = timedelta(
+            hours=retention_hours or settings.outbox_retention_hours
+        )
+        self.batch_size = batch_size or settings.outbox_archive_batch_size
+        self.interval = interval or settings.outbox_archive_interval
+        self.archive = settings.outbox_archive if archive is None else archive
+        self._running = False
+
+    async def run_once(self) -> int:
+        """archive everything past retention, one batch per transaction"""
+        cutoff = datetime.utcnow() - self.retention
+        total = 0
+        while True:
+            n = await self.repo.archive_published_outbox(
+                cutoff, limit=self.batch_size, archive=self.archive
+            )
+            total += n
+            OUTBOX_ARCHIVED.inc(n)
+            if n < self.batch_size:
+                break
+            # yield between batches so vacuum and writers keep up
+            await asyncio.sleep(0)
+        if total:
+            logger.info("Archived %s published outbox rows", total)
+        await self.purge_idempotency_keys()
+        return total
+
+    async def purge_idempotency_keys(self) -> int:
+        total = 0
+        while True:
+            n = await self.repo.purge_expired_idempotency_keys(limit=self.batch_size)
+            total += n
+            if n < self.batch_size:
+                break
+            await asyncio.sleep(0)
+        if total:
+            logger.info("Purged %s expired idempotency keys", total)
+        return total
+
+    async def run_loop(self):
+        self._running = True
+        logger.info(
+            "Outbox archiver started (retention=%s, archive=%s)",
+            self.retention,
+            self.archive,
+        )
+        while self._running:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.exception("Outbox archiver error: %s", e)
+            await asyncio.sleep(self.interval)
+
+    async def stop(self):
+        self._running = False
@@ -1,12 +1,19 @@
 # app/infra/outbox/flusher.py
 import asyncio
-import json
+import os
+import socket
+import time
 import uuid
 import logging
 
+import asyncpg
 from redis.asyncio import from_url, Redis
-from prometheus_client import Counter, Gauge
+from prometheus_client import Counter
 from app.infra.db.repo_async import AsyncTaskRepository
+from app.infra.event_bus.codec import encode_entry, get_codec
+from app.infra.event_bus.lanes import lane_bases
+from app.infra.event_bus.partitioning import stream_for
+from app.infra.event_bus.scheduler import schedule
 from app.settings import settings
 
 
@@ -16,13 +23,13 @@ OUTBOX_PUBLISHED = Counter(
     "samurai_outbox_published_total", "Total outbox events published"
 )
 OUTBOX_ERRORS = Counter("samurai_outbox_publish_errors_total", "Outbox publish errors")
-OUTBOX_PENDING = Gauge("samurai_outbox_pending", "Current pending outbox count")
 
 
 class OutboxFlusher:
     """
     Flusher در فواصل مشخص، event های Outbox را از دیتابیس خوانده
     و به Redis Stream می‌فرستد.
+    Rows are claimed with a lease, so any number of flushers can run side by side.
     """
 
     def __init__(
@@ -30,12 +37,30 @@ class OutboxFlusher:
         repo: AsyncTaskRepository,
         redis_url: str | None = None,
         poll_interval: float | None = None,
+        batch_size: int | None = None,
+        max_linger: float | None = None,
+        lease_seconds: float | None = None,
     ):
         self.repo = repo
         self.redis_url = redis_url or settings.redis_url
         self.poll_interval = poll_interval or settings.outbox_poll_interval
+        self.batch_size = batch_size or settings.outbox_batch_size
+        self.max_linger = (
+            max_linger if max_linger is not None else settings.outbox_max_linger
+        )
+        self.lease_seconds = lease_seconds or settings.outbox_lease_seconds
+        # unique per process, so leases of different flushers never collide
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.notify = settings.outbox_notify
+        self.codec = get_codec(settings.stream_codec)
+        self._lane_bases = set(lane_bases())
         self._redis: Redis | None = None
+        self._listen_conn: asyncpg.Connection | None = None
+        self._wakeup = asyncio.Event()
         self._running = False
+        # rows already in the stream whose marking failed: outbox id -> stream id.
+        # only the marking is retried; this flusher never XADDs them again
+        self._unmarked: dict[int, str] = {}
 
     async def _client(self) -> Redis:
         """Client lazy initializer"""
@@ -43,63 +68,258 @@ class OutboxFlusher:
             self._redis = from_url(self.redis_url)
         return self._redis
 
+    def _on_notify(self, *_args) -> None:
+        self._wakeup.set()
+
+    async def _ensure_listener(self) -> None:
+        """
+        keep a dedicated asyncpg connection LISTENing on the outbox channel.
+        on failure the flusher keeps working in polling mode and retries later.
+        """
+        if self._listen_conn is not None and not self._listen_conn.is_closed():
+            return
+        try:
+            self._listen_conn = await asyncpg.connect(settings.postgres_dsn)
+            await self._listen_conn.add_listener(
+                settings.outbox_notify_channel, self._on_notify
+            )
+            logger.info("Listening on channel %s", settings.outbox_notify_channel)
+            # rows may have been inserted while we were not listening
+            self._wakeup.set()
+        except Exception as exc:
+            logger.warning("LISTEN setup failed, polling instead: %s", exc)
+            self._listen_conn = None
+
+    async def _wait_for_work(self) -> None:
+        """idle wait: until a NOTIFY arrives, or the (safety) poll interval"""
+        if not self.notify:
+            await asyncio.sleep(self.poll_interval)
+            return
+        await self._ensure_listener()
+        timeout = (
+            settings.outbox_safety_poll_interval
+            if self._listen_conn is not None
+            else self.poll_interval
+        )
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _claim_batch(self) -> list:
+        """
+        claim up to batch_size rows. a partial batch is topped up until it is
+        full or max_linger has passed, so a trickle of inserts goes out in one
+        pipeline; a NOTIFY during the linger claims again right away
+        """
+        batch = await self.repo.claim_pending_outbox(
+            self.owner, limit=self.batch_size, lease_seconds=self.lease_seconds
+        )
+        if not batch:
+            return batch
+        deadline = time.monotonic() + self.max_linger
+        while self._running and len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+            batch += await self.repo.claim_pending_outbox(
+                self.owner,
+                limit=self.batch_size - len(batch),
+                lease_seconds=self.lease_seconds,
+            )
+        return batch
+
+    def _target_stream(self, ev) -> str:
+        """outbox rows of a task lane are routed to the task's partition"""
+        task_id = (ev.payload or {}).get("task_id")
+        if ev.stream not in self._lane_bases or not task_id:
+            return ev.stream
+        return stream_for(task_id, ev.stream)
+
+    @staticmethod
+    def _due(ev) -> float | None:
+        """epoch due time of a delayed row, None when it can go out now"""
+        run_at = getattr(ev, "run_at", None)
+        if run_at is None:
+            return None
+        due = run_at.timestamp()
+        return due if due > time.time() else None
+
+    def _enqueue(self, pipe, ev) -> int:
+        """queue the row on the pipeline; returns the number of commands queued"""
+        stream = self._target_stream(ev)
+        due = self._due(ev)
+        if due is None:
+            pipe.xadd(stream, self._build_entry(ev))
+            return 1
+        # the outbox id is the item id: a re-published row replaces itself
+        schedule(pipe, stream, self._build_entry(ev), due, ev.id)
+        return 2
+
+    @staticmethod
+    def _stream_id(ev, res) -> str:
+        if len(res) > 1:
+            return f"scheduled:{ev.id}"
+        stream_id = res[0]
+        return stream_id.decode() if isinstance(stream_id, bytes) else str(stream_id)
+
+    def _build_entry(self, ev) -> dict:
+        # UUID / datetime values are handled by the codec itself
+        return encode_entry(
+            ev.event_type,
+            ev.payload or {},
+            self.codec,
+            created_at=ev.created_at.isoformat(),
+            outbox_id=ev.id,
+        )
+
+    async def _mark_published(self, published) -> None:
+        """
+        mark (outbox id, stream id) pairs published: one bulk UPDATE, per row
+        if that fails. rows that still cannot be marked (e.g. the database is
+        down) keep their claim and wait in `_unmarked` for the next attempt.
+        never raises
+        """
+        if not published:
+            return
+        try:
+            await self.repo.mark_outbox_published_bulk(published)
+            marked = published
+        except Exception as exc:
+            logger.warning("Bulk mark failed (%s), marking per-event", exc)
+            marked = []
+            for outbox_id, stream_id in published:
+                try:
+                    await self.repo.mark_outbox_published(
+                        outbox_id, stream_id=stream_id
+                    )
+                    marked.append((outbox_id, stream_id))
+                except Exception as exc:
+                    logger.warning(
+                        "Marking outbox id=%s failed, retrying later: %s",
+                        outbox_id,
+                        exc,
+                    )
+                    self._unmarked[outbox_id] = stream_id
+        for outbox_id, _ in marked:
+            self._unmarked.pop(outbox_id, None)
+
+    async def _publish_batch(self, r: Redis, events) -> None:
+        """
+        XADD every event of the batch in one pipeline round trip,
+        then mark all of them published with one bulk UPDATE.
+        Delayed events are handed to the scheduler in the same pipeline.
+        Entries rejected by Redis are retried one by one; rows already in the
+        stream (their marking failed earlier) are only marked.
+        """
+        added = [ev for ev in events if ev.id in self._unmarked]
+        events = [ev for ev in events if ev.id not in self._unmarked]
+        await self._mark_published([(ev.id, self._unmarked[ev.id]) for ev in added])
+        if not events:
+            return
+
+        async with r.pipeline(transaction=False) as pipe:
+            sizes = [self._enqueue(pipe, ev) for ev in events]
+            results = await pipe.execute(raise_on_error=False)
+
+        published, failed, pos = [], [], 0
+        for ev, n in zip(events, sizes):
+            res = results[pos : pos + n]
+            pos += n
+            if any(isinstance(x, Exception) for x in res):
+                failed.append(ev)
+            else:
+                published.append((ev.id, self._stream_id(ev, res)))
+
+        # entries are in the stream from here on: only the marking may fail
+        await self._mark_published(published)
+
+        OUTBOX_PUBLISHED.inc(len(published))
+        logger.info("Published batch of %s outbox events", len(published))
+
+        for ev in failed:
+            await self._publish_one(r, ev)
+
+    async def _publish_one(self, r: Redis, ev) -> None:
+        if ev.id in self._unmarked:
+            await self._mark_published([(ev.id, self._unmarked[ev.id])])
+            return
+        try:
+            stream = self._target_stream(ev)
+            async with r.pipeline(transaction=False) as pipe:
+                self._enqueue(pipe, ev)
+                res = await pipe.execute()
+            stream_id = self._stream_id(ev, res)
+        except Exception as exc:
+            OUTBOX_ERRORS.inc()
+            logger.exception("Failed publishing outbox id=%s: %s", ev.id, exc)
+            try:
+                await self.repo.release_outbox_claims([ev.id], self.owner)
+            except Exception:
+                # lease expiry will hand the row to another flusher anyway
+                logger.debug("Could not release claim of outbox id=%s", ev.id)
+            return
+
+        await self._mark_published([(ev.id, stream_id)])
+        OUTBOX_PUBLISHED.inc()
+        logger.info(
+            "Published outbox id=%s to stream=%s id=%s", ev.id, stream, stream_id
+        )
+
     async def run_loop(self):
         """Main flusher loop"""
         self._running = True
-        logger.info("Outbox flusher started (poll_interval=%s)", self.poll_interval)
+        logger.info(
+            "Outbox flusher %s started (poll_interval=%s, batch_size=%s)",
+            self.owner,
+            self.poll_interval,
+            self.batch_size,
+        )
 
         while self._running:
             try:
-                pending = await self.repo.fetch_pending_outbox(limit=50)
-                OUTBOX_PENDING.set(len(pending))
+                if self._unmarked:
+                    await self._mark_published(list(self._unmarked.items()))
+                # cleared before claiming, so a NOTIFY during the claim is not lost
+                self._wakeup.clear()
+                pending = await self._claim_batch()
 
                 if not pending:
-                    await asyncio.sleep(self.poll_interval)
+                    await self._wait_for_work()
                     continue
 
                 r = await self._client()
 
-                for ev in pending:
-                    try:
-                        payload = ev.payload or {}
-                        # تبدیل UUID و هر object غیر JSON به str
-                        for k, v in payload.items():
-                            if isinstance(v, uuid.UUID):
-                                payload[k] = str(v)
-                        entry = {
-                            "type": ev.event_type,
-                            "payload": json.dumps(payload),
-                            "created_at": ev.created_at.isoformat(),
-                        }
-
-                        # publish to redis stream
-                        stream_id = await r.xadd(ev.stream, entry)
-                        await self.repo.mark_outbox_published(
-                            ev.id, stream_id=str(stream_id)
-                        )
-                        OUTBOX_PUBLISHED.inc()
-                        logger.info(
-                            "Published outbox id=%s to stream=%s id=%s",
-                            ev.id,
-                            ev.stream,
-                            stream_id,
-                        )
-
-                    except Exception as exc:
-                        OUTBOX_ERRORS.inc()
-                        logger.exception(
-                            "Failed publishing outbox id=%s: %s", ev.id, exc
-                        )
-
-                await asyncio.sleep(0.01)
+                try:
+                    await self._publish_batch(r, pending)
+                except Exception as exc:
+                    # fall back to per-event publishing so one bad row
+                    # does not block the rest of the batch
+                    logger.warning(
+                        "Batch publish failed (%s), falling back to per-event", exc
+                    )
+                    for ev in pending:
+                        await self._publish_one(r, ev)
 
             except Exception as e:
                 logger.exception("Outbox flusher loop error: %s", e)
                 await asyncio.sleep(1.0)
 
     async def stop(self):
-        """Stop loop and close redis"""
+        """Stop loop and close redis / listen connection"""
         self._running = False
+        self._wakeup.set()
+        if self._listen_conn is not None:
+            try:
+                await self._listen_conn.close()
+            except Exception as exc:
+                logger.debug("closing listen connection: %s", exc)
+            self._listen_conn = None
         if self._redis:
             await self._redis.aclose()
             self._redis = None
@@ -0,0 +1,92 @@
+# app/infra/redis/dedupe.py
+import logging
+import math
+from collections import OrderedDict
+from typing import Iterable, Sequence
+
+from prometheus_client import Counter
+from redis.asyncio import Redis
+from app.settings import settings
+
+logger = logging.getLogger("event.dedupe")
+
+DEDUPE_HITS = Counter(
+    "samurai_dedupe_hits_total",
+    "Duplicate events dropped before the handler",
+    ["source"],
+)
+DEDUPE_MISSES = Counter("samurai_dedupe_misses_total", "Events seen for the first time")
+
+
+def redelivery_horizon() -> int:
+    """
+    seconds a handled event can still come back: redelivered by the reclaimer
+    until it is dead-lettered, re-published by a flusher whose outbox lease
+    expired, or waiting out the longest retry backoff
+    """
+    idle = settings.consumer_reclaim_idle_ms / 1000 + settings.consumer_reclaim_interval
+    return math.ceil(
+        idle * settings.consumer_max_deliveries
+        + settings.retry_backoff_max
+        + settings.outbox_lease_seconds
+    )
+
+
+class ProcessedEventSet:
+    """
+    Ids of events a consumer group has already handled.
+    two levels, both exact and both bounded:
+      - an in-process LRU of the last `local_size` ids (no round trip)
+      - one Redis key per id, `processed:<group>:<id>`, expiring after `ttl`
+        (by default the redelivery horizon), shared by every worker of the group
+    ids are written in the consumer's XACK pipeline and a read batch is looked
+    up with one MGET, so neither costs a round trip per event. lookups fail
+    open: on a Redis error the event is handled.
+    """
+
+    def __init__(
+        self, group: str, ttl: int | None = None, local_size: int | None = None
+    ):
+        self.prefix = f"processed:{group}:"
+        self.ttl = ttl or settings.consumer_dedupe_ttl or redelivery_horizon()
+        self.local_size = local_size or settings.consumer_dedupe_local_size
+        self._local: OrderedDict[str, None] = OrderedDict()
+
+    def key(self, event_id: str) -> str:
+        return self.prefix + event_id
+
+    def remember_local(self, event_id: str) -> None:
+        self._local[event_id] = None
+        self._local.move_to_end(event_id)
+        if len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    def seen_local(self, event_id: str) -> bool:
+        if event_id in self._local:
+            DEDUPE_HITS.labels("local").inc()
+            return True
+        return False
+
+    async def seen_many(self, r: Redis, event_ids: Sequence[str]) -> set[str]:
+        """the ids already handled, in one MGET for those not cached locally"""
+        found = {i for i in event_ids if self.seen_local(i)}
+        remote = [i for i in dict.fromkeys(event_ids) if i not in found]
+        if not remote:
+            return found
+        try:
+            values = await r.mget([self.key(i) for i in remote])
+        except Exception as e:
+            logger.warning("dedupe lookup failed: %s", e)
+            values = [None] * len(remote)
+        for event_id, value in zip(remote, values):
+            if value is not None:
+                DEDUPE_HITS.labels("redis").inc()
+                self.remember_local(event_id)
+                found.add(event_id)
+            else:
+                DEDUPE_MISSES.inc()
+        return found
+
+    def queue_marks(self, pipe, event_ids: Iterable[str]) -> None:
+        for event_id in event_ids:
+            pipe.set(self.key(event_id), 1, ex=self.ttl)
@@ -0,0 +1,93 @@
+# app/infra/redis/idempotency.py
+import json
+import logging
+import uuid
+from typing import List, Optional, Sequence
+
+from prometheus_client import Counter
+from redis.asyncio import from_url, Redis
+from app.settings import settings
+
+logger = logging.getLogger("task.idempotency")
+
+IDEMPOTENCY_REPLAYS = Counter(
+    "samurai_idempotency_replays_total",
+    "Create requests answered from an earlier request with the same key",
+    ["source"],
+)
+
+# marker of a key whose request is still in progress
+_PENDING = b"-"
+
+
+class IdempotencyStore:
+    """
+    Redis fast path of Idempotency-Key handling.
+    `reserve` claims a key with SET NX; for a key that already finished it
+    returns the original task ids, so a repeat is answered without touching
+    Postgres. a key still in progress (or any Redis error) returns None and the
+    caller falls through to the database, whose unique key is the real guard.
+    """
+
+    def __init__(self, redis_url: str | None = None, ttl: int | None = None):
+        self._redis_url = redis_url or settings.redis_url
+        self.ttl = ttl or settings.idempotency_ttl
+        self._client: Redis | None = None
+
+    async def client(self) -> Redis:
+        if not self._client:
+            self._client = from_url(self._redis_url)
+        return self._client
+
+    @staticmethod
+    def key(idempotency_key: str) -> str:
+        return f"idem:{idempotency_key}"
+
+    async def reserve(self, idempotency_key: str) -> Optional[List[uuid.UUID]]:
+        try:
+            r = await self.client()
+            k = self.key(idempotency_key)
+            if await r.set(k, _PENDING, nx=True, ex=self.ttl):
+                return None
+            raw = await r.get(k)
+        except Exception as e:
+            logger.warning("idempotency reserve failed: %s", e)
+            return None
+        if raw is None or raw == _PENDING:
+            return None
+        IDEMPOTENCY_REPLAYS.labels("redis").inc()
+        return [uuid.UUID(i) for i in json.loads(raw)]
+
+    async def remember(self, idempotency_key: str, task_ids: Sequence) -> None:
+        try:
+            await (await self.client()).set(
+                self.key(idempotency_key),
+                json.dumps([str(i) for i in task_ids]),
+                ex=self.ttl,
+            )
+        except Exception as e:
+            logger.warning("idempotency remember failed: %s", e)
+
+    async def release(self, idempotency_key: str) -> None:
+        """after a failed request: let the client's retry run again"""
+        try:
+            await (await self.client()).delete(self.key(idempotency_key))
+        except Exception as e:
+            # the database decides for the retry anyway
+            logger.warning("idempotency release failed: %s", e)
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+
+_shared: IdempotencyStore | None = None
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """process-wide store instance"""
+    global _shared
+    if _shared is None:
+        _shared = IdempotencyStore()
+    return _shared
@@ -1,8 +1,134 @@
 import asyncio
 import uuid
 import logging
+import weakref
+from prometheus_client import Counter, Gauge
 from app.settings import settings
 
+logger = logging.getLogger("RedisLock")
+
+LOCKS_HELD = Gauge("samurai_locks_held", "Redis locks currently held by this process")
+LOCKS_LOST = Counter(
+    "samurai_locks_lost_total", "Held locks that expired or were taken over"
+)
+
+# KEYS = lock, fencing counter; ARGV = value, ttl (ms)
+# the token comes from one counter shared by every lock, so it only ever grows
+ACQUIRE_SCRIPT = """
+if redis.call("set", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+    return redis.call("incr", KEYS[2])
+end
+return false
+"""
+
+# KEYS[1] = lock; ARGV[1] = value
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
+
+# KEYS = locks; ARGV[1] = ttl (ms), ARGV[i + 1] = value of KEYS[i]
+RENEW_SCRIPT = """
+local renewed = {}
+for i, key in ipairs(KEYS) do
+    if redis.call("get", key) == ARGV[i + 1] then
+        redis.call("pexpire", key, ARGV[1])
+        renewed[i] = 1
+    else
+        renewed[i] = 0
+    end
+end
+return renewed
+"""
+
+
+class LockManager:
+    """
+    مدیریت همه‌ی قفل‌های یک process روی یک کلاینت Redis:
+      - یک حلقه‌ی تمدید برای همه‌ی قفل‌ها: هر tick یک EVALSHA برای هر
+        `batch_size` قفل، به جای یک task و یک PEXPIRE برای هر قفل
+      - اسکریپت‌ها یک بار load می‌شوند و با EVALSHA اجرا می‌شوند
+      - fencing token افزایشی برای هر acquire
+    a lock that could not be renewed (expired, taken over) is marked `lost`.
+    """
+
+    def __init__(self, redis, ttl: int | None = None, batch_size: int | None = None):
+        self.redis = redis
+        self.ttl = ttl or settings.lock_ttl
+        self.batch_size = batch_size or settings.lock_renew_batch_size
+        self.fence_key = settings.lock_fence_key
+        # Script objects run through EVALSHA and reload on NOSCRIPT
+        self._acquire = redis.register_script(ACQUIRE_SCRIPT)
+        self._release = redis.register_script(RELEASE_SCRIPT)
+        self._renew = redis.register_script(RENEW_SCRIPT)
+        self._held: dict[str, "RedisLock"] = {}
+        self._renewer: asyncio.Task | None = None
+
+    async def acquire(self, lock: "RedisLock") -> bool:
+        token = await self._acquire(
+            keys=[lock.key, self.fence_key], args=[lock.value, self.ttl]
+        )
+        if token is None:
+            return False
+        lock.token = int(token)
+        lock.lost = False
+        self._held[lock.key] = lock
+        LOCKS_HELD.set(len(self._held))
+        if self._renewer is None or self._renewer.done():
+            self._renewer = asyncio.create_task(self._run())
+        return True
+
+    async def release(self, lock: "RedisLock") -> None:
+        if self._held.get(lock.key) is lock:
+            del self._held[lock.key]
+            LOCKS_HELD.set(len(self._held))
+        await self._release(keys=[lock.key], args=[lock.value])
+
+    async def renew_once(self) -> None:
+        locks = list(self._held.values())
+        for i in range(0, len(locks), self.batch_size):
+            chunk = locks[i : i + self.batch_size]
+            renewed = await self._renew(
+                keys=[lock.key for lock in chunk],
+                args=[self.ttl, *[lock.value for lock in chunk]],
+            )
+            for lock, ok in zip(chunk, renewed):
+                if not ok and self._held.get(lock.key) is lock:
+                    lock.lost = True
+                    del self._held[lock.key]
+                    LOCKS_LOST.inc()
+                    logger.warning(f"Lock {lock.key} lost before release")
+        LOCKS_HELD.set(len(self._held))
+
+    async def _run(self) -> None:
+        """تمدید در 1/3 مدت TTL، تا وقتی قفلی در اختیار است"""
+        while self._held:
+            await asyncio.sleep(self.ttl / 3000)
+            try:
+                await self.renew_once()
+            except Exception as e:
+                # the next tick tries again, still within the TTL
+                logger.warning(f"Lock renewal failed: {e}")
+
+    async def close(self) -> None:
+        if self._renewer is not None:
+            self._renewer.cancel()
+            self._renewer = None
+
+
+_managers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_lock_manager(redis) -> LockManager:
+    """one manager (one renewal loop) per Redis client"""
+    manager = _managers.get(redis)
+    if manager is None:
+        manager = _managers[redis] = LockManager(redis)
+    return manager
+
 
 # Redis Lock class
 class RedisLock:
@@ -10,51 +136,34 @@ class RedisLock:
     قفل توزیع‌شده با استفاده از Redis و الگوریتم SET NX PX
     شامل:
       - TTL ثابت (۵ ثانیه)
-      - تمدید خودکار (auto-renewal)
+      - تمدید خودکار (auto-renewal) توسط LockManager
       - آزادسازی امن با Lua script
+      - fencing token: `token` بعد از acquire؛ writes carrying it are
+        rejected once a newer holder has written (see update_task_states)
     """
 
-    LUA_RELEASE_SCRIPT = """
-    if redis.call("get", KEYS[1]) == ARGV[1] then
-        return redis.call("del", KEYS[1])
-    else
-        return 0
-    end
-    """
-
-    def __init__(self, redis, key: str):
+    def __init__(self, redis, key: str, manager: LockManager | None = None):
         self.redis = redis
         self.key = key
-        self.ttl = settings.lock_ttl
+        self.manager = manager or get_lock_manager(redis)
+        self.ttl = self.manager.ttl
         self.value = str(uuid.uuid4())
-        self._renew_task = None
-        self._logger = logging.getLogger("RedisLock")
+        self.token: int | None = None
+        self.lost = False
+        self._logger = logger
 
     async def acquire(self) -> bool:
         """دریافت قفل با SET NX PX"""
-        result = await self.redis.set(self.key, self.value, px=self.ttl, nx=True)
-        if result:
-            self._logger.debug(f"Lock acquired for {self.key}")
-            self._renew_task = asyncio.create_task(self._auto_renew())
+        if await self.manager.acquire(self):
+            self._logger.debug(f"Lock acquired for {self.key} (token={self.token})")
             return True
         self._logger.debug(f"Lock already held for {self.key}")
         return False
 
     async def release(self):
         """آزادسازی امن قفل با Lua script"""
-        if self._renew_task:
-            self._renew_task.cancel()
         try:
-            await self.redis.eval(self.LUA_RELEASE_SCRIPT, 1, self.key, self.value)
+            await self.manager.release(self)
             self._logger.debug(f"Lock released for {self.key}")
         except Exception as e:
             self._logger.error(f"Failed to release lock {self.key}: {e}")
-
-    async def _auto_renew(self):
-        """تمدید خودکار TTL تا زمان در اختیار بودن قفل"""
-        try:
-            while True:
-                await asyncio.sleep(self.ttl / 3000)  # تمدید در 2/3 مدت TTL
-                await self.redis.pexpire(self.key, self.ttl)
-        except asyncio.CancelledError:
-            pass
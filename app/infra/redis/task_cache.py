@@ -0,0 +1,161 @@
+# app/infra/redis/task_cache.py
+import json
+import logging
+import uuid
+from datetime import datetime
+from typing import Iterable, Optional
+
+from redis.asyncio import from_url, Redis
+from app.domain.models import Task as DomainTask, TaskState
+from app.settings import settings
+
+logger = logging.getLogger("task.cache")
+
+# cached marker for ids that do not exist (negative caching)
+_MISSING = b"-"
+MISSING = object()
+
+# KEYS[1] = snapshot; ARGV = snapshot json, its version, ttl (s)
+# a fill never replaces a newer snapshot: a slow reader's old row loses
+SET_IF_NEWER = """
+local cur = redis.call('GET', KEYS[1])
+if cur and cur ~= '-' then
+  local ok, cached = pcall(cjson.decode, cur)
+  if ok and (tonumber(cached['version']) or -1) > tonumber(ARGV[2]) then
+    return 0
+  end
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+return 1
+"""
+
+
+class TaskCache:
+    """
+    Read-through cache of task snapshots in Redis.
+    `get` returns a Task, MISSING for a known-unknown id, or None on a miss.
+    every state transition invalidates the task's snapshot. fills are
+    version-guarded, and snapshots of unfinished tasks live only
+    `active_ttl`: a reader that loaded the row before a transition and
+    writes it after the invalidation serves it for that long at most.
+    every Redis error is swallowed: the cache fails open to the database.
+    """
+
+    def __init__(
+        self,
+        redis_url: str | None = None,
+        ttl: int | None = None,
+        negative_ttl: int | None = None,
+        active_ttl: int | None = None,
+    ):
+        self._redis_url = redis_url or settings.redis_url
+        self.ttl = ttl or settings.task_cache_ttl
+        self.negative_ttl = negative_ttl or settings.task_cache_negative_ttl
+        self.active_ttl = active_ttl or settings.task_cache_active_ttl
+        self._client: Redis | None = None
+        self._set_if_newer = None
+
+    async def client(self) -> Redis:
+        if not self._client:
+            self._client = from_url(self._redis_url)
+            # Script runs through EVALSHA and reloads itself on NOSCRIPT
+            self._set_if_newer = self._client.register_script(SET_IF_NEWER)
+        return self._client
+
+    def ttl_for(self, task: DomainTask) -> int:
+        # finished tasks do not change any more
+        return self.ttl if task.state in TaskState.TERMINAL else self.active_ttl
+
+    @staticmethod
+    def key(task_id) -> str:
+        # canonical form, so "ABC..." and "abc..." share one entry
+        try:
+            task_id = uuid.UUID(str(task_id))
+        except ValueError:
+            pass
+        return f"task:{task_id}"
+
+    @staticmethod
+    def _dumps(task: DomainTask) -> str:
+        return json.dumps(
+            {
+                "id": str(task.id),
+                "name": task.name,
+                "payload": task.payload,
+                "state": task.state,
+                "attempts": task.attempts,
+                "last_error": task.last_error,
+                "version": task.version,
+                "created_at": task.created_at.isoformat() if task.created_at else None,
+                "updated_at": task.updated_at.isoformat() if task.updated_at else None,
+            }
+        )
+
+    @staticmethod
+    def _loads(raw: bytes) -> DomainTask:
+        d = json.loads(raw)
+        d["id"] = uuid.UUID(d["id"])
+        for k in ("created_at", "updated_at"):
+            d[k] = datetime.fromisoformat(d[k]) if d[k] else None
+        return DomainTask(**d)
+
+    async def get(self, task_id) -> Optional[DomainTask] | object:
+        try:
+            raw = await (await self.client()).get(self.key(task_id))
+        except Exception as e:
+            logger.warning("task cache get failed: %s", e)
+            return None
+        if raw is None:
+            return None
+        if raw == _MISSING:
+            return MISSING
+        return self._loads(raw)
+
+    async def set(self, task: DomainTask) -> None:
+        try:
+            await self.client()
+            await self._set_if_newer(
+                keys=[self.key(task.id)],
+                args=[self._dumps(task), task.version, self.ttl_for(task)],
+            )
+        except Exception as e:
+            logger.warning("task cache set failed: %s", e)
+
+    async def set_missing(self, task_id) -> None:
+        try:
+            await (await self.client()).set(
+                self.key(task_id), _MISSING, ex=self.negative_ttl
+            )
+        except Exception as e:
+            logger.warning("task cache set failed: %s", e)
+
+    async def invalidate(self, task_ids: Iterable) -> None:
+        """drop snapshots of tasks whose state changed, in one DEL"""
+        keys = [self.key(t) for t in task_ids]
+        if not keys:
+            return
+        try:
+            await (await self.client()).delete(*keys)
+        except Exception as e:
+            # entries expire after `ttl` anyway
+            logger.warning(
+                "task cache invalidation of %s keys failed: %s", len(keys), e
+            )
+
+    async def close(self):
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+
+_shared: TaskCache | None = None
+
+
+def get_task_cache() -> TaskCache | None:
+    """process-wide cache instance, or None when caching is disabled"""
+    global _shared
+    if not settings.task_cache_enabled:
+        return None
+    if _shared is None:
+        _shared = TaskCache()
+    return _shared
@@ -9,6 +9,10 @@ from app.api.v1 import samurai_commands, samurai_queries
 from app.infra.db.repo_async import create_tables, AsyncTaskRepository
 from app.infra.outbox.flusher import OutboxFlusher
 from app.workers.flusher_entrypoint import run as run_flusher
+from app.workers.archiver_entrypoint import run as run_archiver
+from app.workers.retention_entrypoint import run as run_retention
+from app.workers.scheduler_entrypoint import run as run_scheduler
+from app.workers.metrics_entrypoint import run as run_metrics
 from app.settings import settings
 
 logging.basicConfig(level=settings.log_level)
@@ -35,6 +39,19 @@ async def lifespan(application: FastAPI()):
     flusher_task = asyncio.create_task(run_flusher())
     application.state._flusher_task = flusher_task
     logger.info("flusher started")
+    # one per deployment: normally in the maintenance process, not per replica
+    background = [
+        asyncio.create_task(loop())
+        for loop, enabled in (
+            (run_scheduler, settings.api_scheduler),
+            (run_archiver, settings.api_archiver),
+            (run_retention, settings.api_stream_trimmer),
+            # backlog gauges served by /metrics
+            (run_metrics, settings.api_metrics_collector),
+        )
+        if enabled
+    ]
+    application.state._background_tasks = background
 
     # yield control to the app runtime
     try:
@@ -42,11 +59,15 @@ async def lifespan(application: FastAPI()):
     finally:
         logger.info("shutdown: stopping flusher")
         await flusher.stop()
-        flusher_task.cancel()
-        try:
-            await flusher_task
-        except asyncio.CancelledError:
-            pass
+        for task in (
+            flusher_task,
+            *background,
+        ):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
         logger.info("shutdown complete")
 
 
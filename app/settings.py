@@ -1,5 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import computed_field
+from pydantic import computed_field, model_validator
 from typing import Optional
 
 
@@ -23,17 +23,108 @@ class Settings(BaseSettings):
     redis_port: int
     redis_db: int
 
+    # API
+    task_batch_max_size: int = 1000  # tasks accepted by POST /v1/tasks:batch
+    task_list_max_limit: int = 500  # page size cap of GET /v1/tasks
+    task_cache_enabled: bool = True  # read-through Redis cache for GET /v1/tasks/{id}
+    task_cache_ttl: int = 30  # seconds, finished tasks
+    task_cache_active_ttl: int = 2  # seconds, tasks that may still change state
+    task_cache_negative_ttl: int = 2  # seconds an unknown id is remembered
+
+    payload_offload_threshold: int = 65536  # bytes; larger payloads go to payload_blobs
+    payload_compression_level: int = 3
+    idempotency_ttl: int = 86400  # seconds an Idempotency-Key is remembered
+
     # Worker
     stream_name: str
     consumer_group: str
     consumer_name: str
     consumer_port: int
     lock_ttl: int = 5000  # ms
+    task_lock_names: str = ""  # task names whose handler also takes a Redis lock
+    task_run_timeout: float = 30.0  # then claimable again; below reclaim idle
+    lock_renew_batch_size: int = 500  # locks renewed per EVALSHA
+    lock_fence_key: str = "lock:fence"  # counter of fencing tokens
+    stream_partitions: int = 1  # >1: tasks are spread over stream_name:0..N-1
+    consumer_partitions: str = ""  # e.g. "0,2"; empty = balanced through Redis
+    partition_member_ttl: float = 15.0  # seconds a silent worker keeps its partitions
+    priority_lanes: str = "high:8,normal:4,low:1"  # lane:weight for fair reading
+    default_priority: str = "normal"  # this lane keeps the plain stream_name
+    lane_metrics_interval: float = 5.0  # seconds between lane depth samples
+    stream_codec: str = "orjson"  # json | orjson | msgpack, see event_bus/codec.py
     outbox_poll_interval: float = 0.5
+    outbox_batch_size: int = 100
+    outbox_max_linger: float = 0.005  # seconds to let a partial batch fill up
+    outbox_lease_seconds: float = 30.0  # claim expiry for crashed flushers
+    outbox_notify: bool = True  # wake the flusher with LISTEN/NOTIFY
+    outbox_notify_channel: str = "outbox_events"
+    outbox_safety_poll_interval: float = 5.0  # polling fallback in notify mode
+    outbox_retention_hours: float = 24.0  # published rows kept in outbox_events
+    outbox_archive: bool = False  # move old rows to outbox_events_archive
+    outbox_archive_batch_size: int = 5000
+    outbox_archive_interval: float = 60.0  # seconds between archiver runs
+    stream_trim_interval: float = 30.0  # seconds between retention runs
+    stream_max_len: int = 0  # approximate MAXLEN cap; 0 = trim acked entries only
+    consumer_max_in_flight: int = 32  # handlers running at once per process
+    consumer_ordered: bool = True  # keep per-task_id ordering
+    consumer_ack_batch_size: int = 64
+    consumer_ack_interval: float = 0.05  # seconds between XACK flushes
+    consumer_block_ms: int = 5000  # XREADGROUP BLOCK timeout
+    consumer_read_count_max: int = 256  # upper bound of adaptive read size
+    consumer_reclaim_interval: float = 5.0  # seconds between XAUTOCLAIM sweeps
+    consumer_reclaim_idle_ms: int = 60000  # pending entries idle longer are reclaimed
+    consumer_reclaim_count: int = 100
+    consumer_max_deliveries: int = 5  # then the entry goes to the dead-letter stream
+    dead_letter_stream: str = "tasks:events:dead"
+    handler_limits: str = ""  # per event type, "type:max_concurrency[:rate/s[:burst]]"
+    handler_rate_shared: bool = False  # rate limits shared by all workers via Redis
+    handler_max_waiting: int = 256  # messages of one type waiting for its limits
+    handler_defer_delay: float = 1.0  # seconds a full type buffer defers a message
+    consumer_dedupe: bool = True  # drop events the group already handled
+    consumer_dedupe_ttl: int = 0  # processed-id lifetime; 0 = redelivery horizon
+    consumer_dedupe_local_size: int = 100000  # ids cached in process (LRU)
+    state_batch_max_rows: int = 500  # task state updates per UPDATE statement
+    state_batch_max_delay: float = 0.005  # seconds to collect a batch
+    scheduler_key: str = "tasks:scheduled"  # ZSET of delayed entries
+    scheduler_batch_size: int = 500  # due entries moved per Lua call
+    scheduler_tick: float = 1.0  # max seconds between scheduler checks
+    retry_enabled: bool = True  # reschedule failed tasks with backoff
+    retry_max_attempts: int = 5  # then the task is marked failed
+    retry_limits: str = ""  # per task name, e.g. "send_email:10,report:2"
+    retry_backoff_base: float = 1.0  # seconds before the first retry
+    retry_backoff_max: float = 300.0  # backoff cap (seconds)
+    metrics_interval: float = 15.0  # seconds between backlog metric samples
+    metrics_terminal_interval: float = 300.0  # processed/failed counts (index scan)
+    # background loops one deployment needs once; run them in the maintenance
+    # process (app.workers.maintenance_entrypoint) or turn one on in a single API
+    api_scheduler: bool = False  # delayed scheduler in the API process
+    api_archiver: bool = False  # outbox archiver in the API process
+    api_stream_trimmer: bool = False  # stream trimmer in the API process
+    api_metrics_collector: bool = False  # backlog metrics collector in the API process
+    maintenance_port: int = 8091  # metrics of the maintenance process
+    supervisor_id: str = ""  # in consumer names, unique per supervisor; "" = hostname
+    supervisor_min_workers: int = 1
+    supervisor_max_workers: int = 0  # 0 = one per CPU core
+    supervisor_backlog_per_worker: int = 1000  # lag + pending entries per worker
+    supervisor_interval: float = 5.0  # seconds between backlog checks
+    supervisor_scale_down_delay: float = 60.0  # min seconds between scaling steps down
+    supervisor_restart_delay: float = 1.0  # first restart delay, doubles while crashing
+    supervisor_stop_timeout: float = 30.0  # then a stopping worker is killed
+    supervisor_port: int = 8090  # supervisor metrics; worker N uses consumer_port + N
 
     # 🪶 Logging
     log_level: str = "INFO"
 
+    @model_validator(mode="after")
+    def check_run_timeout(self):
+        # a reclaimed entry must find its dead worker's task claimable again,
+        # or it would be left pending for nothing until dead-lettered
+        if self.task_run_timeout >= self.consumer_reclaim_idle_ms / 1000:
+            raise ValueError(
+                "task_run_timeout must be shorter than consumer_reclaim_idle_ms"
+            )
+        return self
+
     # Auto-generated URLs
     @computed_field
     @property
@@ -44,6 +135,15 @@ class Settings(BaseSettings):
             f"@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
         )
 
+    @computed_field
+    @property
+    def postgres_dsn(self) -> str:
+        """Plain libpq DSN for raw asyncpg connections (LISTEN)"""
+        return (
+            f"postgresql://{self.postgres_user}:{self.postgres_password}"
+            f"@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
+        )
+
     @computed_field
     @property
     def redis_url(self) -> str:
@@ -0,0 +1,23 @@
+# app/workers/archiver_entrypoint.py
+import asyncio
+import logging
+from app.infra.db.repo_async import AsyncTaskRepository
+from app.infra.outbox.archiver import OutboxArchiver
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("archiver")
+
+
+async def run():
+    repo = AsyncTaskRepository()
+    archiver = OutboxArchiver(repo)
+    try:
+        await archiver.run_loop()
+    except asyncio.CancelledError:
+        logger.info("Archiver stopped by user")
+    finally:
+        await archiver.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
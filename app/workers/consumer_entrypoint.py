@@ -2,14 +2,20 @@
 import asyncio
 import logging
 from prometheus_client import Counter, start_http_server
-from sqlalchemy import update
 
+from app.domain.exceptions import TaskStateConflictError
+from app.domain.models import TaskState
+from app.infra.db.payload_store import PayloadResolver
 from app.infra.db.repo_async import AsyncTaskRepository
+from app.infra.db.state_batcher import TaskStateBatcher
 from app.infra.event_bus import consumer as consumer_module
+from app.infra.event_bus.lanes import lane_streams, lane_weights
+from app.infra.event_bus.partitioning import PartitionCoordinator, parse_partitions
+from app.infra.event_bus.retry import RetryEngine
 from app.infra.redis.lock import RedisLock
+from app.infra.redis.task_cache import get_task_cache
 from app.settings import settings
-from app.infra.db.sqlalchemy_models import TaskORM
-from app.infra.db.repo_async import AsyncSessionLocal
+from app.workers.runner import run_until_stopped
 
 EVENTS_CONSUMED = Counter("samurai_events_consumed_total", "Total consumed events")
 EVENTS_PROCESS_ERRORS = Counter(
@@ -20,69 +26,149 @@ logging.basicConfig(level=settings.log_level)
 logger = logging.getLogger("worker")
 
 task_repo = AsyncTaskRepository()
+task_cache = get_task_cache()
+state_batcher = TaskStateBatcher(task_repo, cache=task_cache)
+# large payloads arrive as {"$blob": ...} references; resolve only when needed
+payload_resolver = PayloadResolver(task_repo)
+# handlers with external side effects additionally hold a Redis lock
+locked_task_names = {
+    n.strip() for n in settings.task_lock_names.split(",") if n.strip()
+}
 
 
 async def handle(event_type: str, task_id: str, data: dict, redis):
-    lock = RedisLock(redis, f"task-lock:{data.get('task_id')}")
-
     task_id = task_id or data.get("task_id")
     if not task_id:
         logger.warning("No task_id in event, skipping")
         return
 
+    # pending/retrying -> running, one conditional UPDATE; no lock needed
+    claim = await task_repo.claim_task(task_id, settings.task_run_timeout)
+    if claim.version is None:
+        if claim.state == TaskState.RUNNING:
+            # not stale yet: keep the entry pending (not acked), so it is
+            # delivered again if the other worker dies before finishing
+            raise consumer_module.LeavePending(f"task {task_id} is running elsewhere")
+        if claim.state is None:
+            logger.warning("Event for unknown task %s dropped", task_id)
+        else:
+            logger.info("Task %s is already %s, skipping", task_id, claim.state)
+        return
+    version = claim.version
+    if task_cache is not None:
+        # pending/retrying -> running is a transition too
+        await task_cache.invalidate([task_id])
+
+    lock = None
+    if data.get("name") in locked_task_names:
+        lock = RedisLock(redis, f"task-lock:{task_id}")
+        if not await lock.acquire():
+            # another worker holds the task; the retry engine tries again later
+            raise RuntimeError(f"task {task_id} is locked by another worker")
+
     try:
         logger.info(
             "handle event_type=%s task_id=%s data=%s", event_type, task_id, data
         )
         EVENTS_CONSUMED.inc()
-        # task process simulator
+        # task process simulator; real work that needs the task body would
+        # fetch it with `await payload_resolver.resolve(data.get("payload"))`
         await asyncio.sleep(0.4)
 
-        # update DB
-        async with AsyncSessionLocal() as session:
-            async with session.begin():
-                stmt = (
-                    update(TaskORM)
-                    .where(TaskORM.id == task_id)
-                    .values(state="processed")
-                )
-                await session.execute(stmt)
+        # update DB: coalesced with concurrent handlers' transitions into one UPDATE;
+        # returns once committed, so the message is acked only after that.
+        # applied only if the task is still running at our version (and, with a
+        # lock, no newer holder's fencing token is on the row)
+        await state_batcher.submit(
+            task_id,
+            TaskState.PROCESSED,
+            fence=lock.token if lock else None,
+            expected_state=TaskState.RUNNING,
+            version=version,
+        )
 
         logger.info(f"Task {task_id} marked as processed by consumer 1.")
 
+    except TaskStateConflictError:
+        logger.warning(f"Task {task_id} was taken over by another worker")
     except Exception as e:
         EVENTS_PROCESS_ERRORS.inc()
         logger.exception(f"Error processing task by consumer 1 {task_id}: {e}")
+        # the consumer's retry engine reschedules it with backoff
+        raise
     finally:
-        await lock.release()
+        if lock is not None:
+            await lock.release()
+
+
+HANDLERS = {
+    "task.created": handle,
+}
 
 
-async def run():
+async def run(consumer_name: str | None = None, metrics_port: int | None = None):
+    # set per process by the supervisor; a single worker uses CONSUMER_NAME/PORT
+    consumer_name = consumer_name or settings.consumer_name
+    start_http_server(metrics_port or settings.consumer_port)
 
-    start_http_server(settings.consumer_port)
+    # explicit partitions from CONSUMER_PARTITIONS, or balanced through Redis;
+    # every partition is read in each priority lane
+    if settings.consumer_partitions:
+        streams = lane_streams(parse_partitions(settings.consumer_partitions))
+    elif settings.stream_partitions > 1:
+        streams = {}  # assigned by the coordinator below
+    else:
+        streams = lane_streams([0])
 
     consumer_declare = consumer_module.RedisStreamConsumer(
-        stream=settings.stream_name,
+        stream=streams,
+        lane_weights=lane_weights(),
         group=settings.consumer_group,
-        consumer_name=settings.consumer_name,
+        consumer_name=consumer_name,
+        max_in_flight=settings.consumer_max_in_flight,
+        ordered=settings.consumer_ordered,
+        retry=RetryEngine(task_repo) if settings.retry_enabled else None,
     )
     redis = await consumer_declare.get_client()
 
+    coordinator = coordinator_task = None
+    if not streams:
+        coordinator = PartitionCoordinator(redis, member=consumer_name)
+
+        async def on_partitions(partitions):
+            await consumer_declare.set_streams(lane_streams(partitions))
+
+        await on_partitions(await coordinator.current_partitions())
+        coordinator_task = asyncio.create_task(coordinator.run(on_partitions))
+
     logger.info(
-        "Consumer started, listening to Redis stream '%s'...", settings.stream_name
+        "Consumer started, listening to Redis streams %s...", consumer_declare.streams
     )
 
     try:
+        # one handler per event type; limits come from HANDLER_LIMITS
+        for event_type, fn in HANDLERS.items():
 
-        async def wrapped_handler(event_type, task_id, data):
-            await handle(event_type, task_id, data, redis)
+            async def wrapped_handler(event_type, task_id, data, fn=fn):
+                await fn(event_type, task_id, data, redis)
 
-        await consumer_declare.run(wrapped_handler, read_count=5)
+            consumer_declare.register(event_type, wrapped_handler)
+
+        await consumer_declare.run(read_count=5)
     except asyncio.CancelledError:
-        logger.info("Consumer stopped by user")
+        logger.info("Consumer %s stopped", consumer_name)
     finally:
+        if coordinator is not None:
+            coordinator_task.cancel()
+            await coordinator.leave()
         await consumer_declare.stop()
+        await state_batcher.stop()
+
+
+def main(consumer_name: str | None = None, metrics_port: int | None = None):
+    """run until SIGTERM / SIGINT; in-flight handlers are drained before exit"""
+    run_until_stopped(run(consumer_name, metrics_port))
 
 
 if __name__ == "__main__":
-    asyncio.run(run())
+    main()
@@ -0,0 +1,52 @@
+# app/workers/maintenance_entrypoint.py
+"""
+Background loops that must not run once per replica.
+run exactly one of these processes per deployment: API replicas and
+consumers only start them when the matching API_* flag asks for it.
+  - metrics collector: backlog COUNT queries and stream scans, on this
+    process's /metrics (`maintenance_port`)
+  - delayed scheduler: moves due entries into their streams
+  - outbox archiver: deletes (or, with OUTBOX_ARCHIVE, moves) published
+    outbox rows past retention, and purges expired idempotency keys
+  - stream trimmer: drops stream entries every group has acked
+"""
+
+import asyncio
+import logging
+from prometheus_client import start_http_server
+
+from app.settings import settings
+from app.workers.archiver_entrypoint import run as run_archiver
+from app.workers.metrics_entrypoint import run as run_metrics
+from app.workers.retention_entrypoint import run as run_retention
+from app.workers.runner import run_until_stopped
+from app.workers.scheduler_entrypoint import run as run_scheduler
+
+logging.basicConfig(level=settings.log_level)
+logger = logging.getLogger("maintenance")
+
+LOOPS = {
+    "metrics": run_metrics,
+    "scheduler": run_scheduler,
+    "archiver": run_archiver,
+    "retention": run_retention,
+}
+
+
+async def run():
+    start_http_server(settings.maintenance_port)
+    tasks = [asyncio.create_task(loop(), name=name) for name, loop in LOOPS.items()]
+    logger.info("Maintenance loops started: %s", ", ".join(LOOPS))
+    try:
+        await asyncio.gather(*tasks)
+    except asyncio.CancelledError:
+        logger.info("Maintenance stopped")
+    finally:
+        for task in tasks:
+            task.cancel()
+        # each loop stops its component when cancelled
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    run_until_stopped(run())
@@ -0,0 +1,22 @@
+# app/workers/metrics_entrypoint.py
+import asyncio
+import logging
+from app.infra.db.repo_async import AsyncTaskRepository
+from app.infra.monitoring.collector import MetricsCollector
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("metrics")
+
+
+async def run():
+    collector = MetricsCollector(AsyncTaskRepository())
+    try:
+        await collector.run_loop()
+    except asyncio.CancelledError:
+        logger.info("Metrics collector stopped by user")
+    finally:
+        await collector.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,22 @@
+# app/workers/retention_entrypoint.py
+import asyncio
+import logging
+from app.infra.event_bus.lanes import all_lane_streams
+from app.infra.event_bus.retention import StreamTrimmer
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("retention")
+
+
+async def run():
+    trimmer = StreamTrimmer(all_lane_streams())
+    try:
+        await trimmer.run_loop()
+    except asyncio.CancelledError:
+        logger.info("Stream trimmer stopped by user")
+    finally:
+        await trimmer.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,31 @@
+# app/workers/runner.py
+import asyncio
+import logging
+import signal
+from typing import Coroutine
+
+logger = logging.getLogger("runner")
+
+
+def run_until_stopped(main: Coroutine) -> None:
+    """
+    asyncio.run(main) where SIGTERM / SIGINT cancel `main` once, so its
+    `finally` blocks can drain; further signals are ignored until it returns
+    """
+
+    async def _run():
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+
+        def _stop(sig):
+            if task.cancelling():
+                logger.info("%s ignored, already stopping", sig.name)
+                return
+            logger.info("%s received, stopping", sig.name)
+            task.cancel()
+
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, _stop, sig)
+        await main
+
+    asyncio.run(_run())
@@ -0,0 +1,21 @@
+# app/workers/scheduler_entrypoint.py
+import asyncio
+import logging
+from app.infra.event_bus.scheduler import DelayedScheduler
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger("scheduler")
+
+
+async def run():
+    scheduler = DelayedScheduler()
+    try:
+        await scheduler.run_loop()
+    except asyncio.CancelledError:
+        logger.info("Scheduler stopped by user")
+    finally:
+        await scheduler.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
@@ -0,0 +1,353 @@
+# app/workers/supervisor.py
+"""
+Worker supervisor.
+runs the consumer as a pool of processes, one asyncio loop per core:
+  - worker `slot` is consumer `{consumer_name}-{supervisor_id}-{slot}` with
+    metrics on `consumer_port + slot`; SUPERVISOR_ID (default: the hostname)
+    must be unique per supervisor and stable across its restarts, so the
+    names come back after a restart and a supervisor only ever deletes
+    consumers named after its own id
+  - a worker that dies is started again under the same name (with a backoff
+    that doubles while it keeps crashing), so its pending entries stay its own
+  - the pool grows and shrinks between min and max workers with the group's
+    backlog: lag + pending entries over every stream the workers read
+  - a retired worker gets SIGTERM and drains its in-flight handlers; its
+    consumer is removed with XGROUP DELCONSUMER only once its PEL is empty
+    (whatever it left behind moves to live workers through XAUTOCLAIM first).
+    on stop every idle consumer of the pool is removed the same way, and
+    consumers an earlier run left behind (e.g. in slots it no longer uses)
+    are removed once their PEL drains
+"""
+
+import asyncio
+import logging
+import math
+import multiprocessing
+import os
+import socket
+import time
+from typing import Callable, Dict, List
+
+from prometheus_client import Counter, Gauge
+from redis.asyncio import from_url, Redis
+from redis.exceptions import ResponseError
+from app.infra.event_bus.codec import as_text
+from app.infra.event_bus.lanes import all_lane_streams, lane_streams
+from app.infra.event_bus.partitioning import parse_partitions
+from app.settings import settings
+
+logger = logging.getLogger("supervisor")
+
+WORKERS = Gauge("samurai_supervisor_workers", "Worker processes in the pool")
+WORKERS_DESIRED = Gauge(
+    "samurai_supervisor_workers_desired", "Worker processes wanted for the backlog"
+)
+BACKLOG = Gauge(
+    "samurai_supervisor_backlog", "Group lag plus pending entries, over all streams"
+)
+RESTARTS = Counter(
+    "samurai_supervisor_restarts_total", "Worker processes restarted after exiting"
+)
+RETIRED = Counter(
+    "samurai_supervisor_retired_total",
+    "Consumers removed from the group after scaling down",
+)
+
+# seconds; also how long a worker must live to reset its backoff
+RESTART_DELAY_MAX = 60.0
+
+
+def _worker_main(consumer_name: str, port: int) -> None:
+    # imported in the child only: the worker module builds its clients on import
+    from app.workers import consumer_entrypoint
+
+    consumer_entrypoint.main(consumer_name, port)
+
+
+def spawn_worker(consumer_name: str, port: int):
+    """start a worker process (spawned, so it shares no loop or socket with us)"""
+    ctx = multiprocessing.get_context("spawn")
+    proc = ctx.Process(
+        target=_worker_main, args=(consumer_name, port), name=consumer_name
+    )
+    proc.start()
+    return proc
+
+
+def group_streams() -> List[str]:
+    """every stream the workers of this pool may read"""
+    if settings.consumer_partitions:
+        return list(lane_streams(parse_partitions(settings.consumer_partitions)))
+    return all_lane_streams()
+
+
+def desired_workers(
+    backlog: int, min_workers: int, max_workers: int, per_worker: int
+) -> int:
+    return max(min_workers, min(max_workers, math.ceil(backlog / per_worker)))
+
+
+class _Worker:
+    def __init__(self, slot: int, name: str, proc):
+        self.slot = slot
+        self.name = name
+        self.proc = proc
+        self.started = time.monotonic()
+        self.restarts = 0
+        self.restart_at: float | None = None
+        self.retired_at: float | None = None
+
+
+class WorkerSupervisor:
+    def __init__(
+        self,
+        streams: List[str] | None = None,
+        redis_url: str | None = None,
+        spawn: Callable = spawn_worker,
+        min_workers: int | None = None,
+        max_workers: int | None = None,
+        backlog_per_worker: int | None = None,
+        interval: float | None = None,
+    ):
+        self.streams = streams if streams is not None else group_streams()
+        self.redis_url = redis_url or settings.redis_url
+        self.group = settings.consumer_group
+        self.spawn = spawn
+        self.min_workers = max(min_workers or settings.supervisor_min_workers, 1)
+        self.max_workers = max(
+            max_workers or settings.supervisor_max_workers or os.cpu_count() or 1,
+            self.min_workers,
+        )
+        self.backlog_per_worker = (
+            backlog_per_worker or settings.supervisor_backlog_per_worker
+        )
+        self.interval = interval or settings.supervisor_interval
+        self.scale_down_delay = settings.supervisor_scale_down_delay
+        self.restart_delay = settings.supervisor_restart_delay
+        self.stop_timeout = settings.supervisor_stop_timeout
+        self._workers: Dict[int, _Worker] = {}
+        # stopped by scale-down, kept until their consumer is deleted
+        self._retired: Dict[int, _Worker] = {}
+        self._last_scale = 0.0
+        self.instance = settings.supervisor_id or socket.gethostname()
+        # consumers of an earlier run of this supervisor, not in use now
+        self._stale: set[str] = set()
+        self._client: Redis | None = None
+        self._running = False
+
+    async def _get_client(self) -> Redis:
+        if not self._client:
+            self._client = from_url(self.redis_url)
+        return self._client
+
+    def consumer_name(self, slot: int) -> str:
+        return f"{settings.consumer_name}-{self.instance}-{slot}"
+
+    def owns(self, consumer: str) -> bool:
+        """a consumer this supervisor (in this or an earlier run) started"""
+        prefix = f"{settings.consumer_name}-{self.instance}-"
+        return consumer.startswith(prefix) and consumer[len(prefix) :].isdigit()
+
+    def _start(self, slot: int) -> _Worker:
+        name = self.consumer_name(slot)
+        self._stale.discard(name)
+        worker = _Worker(slot, name, self.spawn(name, settings.consumer_port + slot))
+        self._workers[slot] = worker
+        WORKERS.set(len(self._workers))
+        logger.info("Worker %s started (pid %s)", name, worker.proc.pid)
+        return worker
+
+    def _free_slot(self) -> int:
+        # a retired name is not reused before its consumer is deleted
+        slot = 0
+        while slot in self._workers or slot in self._retired:
+            slot += 1
+        return slot
+
+    def check_workers(self, now: float) -> None:
+        """restart workers that exited, with a doubling delay while they crash-loop"""
+        for slot, worker in list(self._workers.items()):
+            if worker.proc.is_alive():
+                continue
+            if worker.restart_at is None:
+                if now - worker.started > RESTART_DELAY_MAX:
+                    worker.restarts = 0
+                delay = min(self.restart_delay * 2**worker.restarts, RESTART_DELAY_MAX)
+                worker.restart_at = now + delay
+                logger.warning(
+                    "Worker %s exited with %s, restarting in %.1fs",
+                    worker.name,
+                    worker.proc.exitcode,
+                    delay,
+                )
+            elif now >= worker.restart_at:
+                self._start(slot).restarts = worker.restarts + 1
+                RESTARTS.inc()
+
+    async def backlog(self) -> int:
+        """entries not yet delivered (lag) plus delivered but not acked (PEL)"""
+        r = await self._get_client()
+        total = 0
+        for stream in self.streams:
+            try:
+                groups = await r.xinfo_groups(stream)
+            except ResponseError:
+                continue  # stream not created yet
+            for g in groups:
+                if as_text(g["name"]) == self.group:
+                    total += int(g.get("lag") or 0) + int(g.get("pending") or 0)
+        return total
+
+    def scale(self, backlog: int, now: float) -> None:
+        """grow at once; shrink one worker per `scale_down_delay`"""
+        desired = desired_workers(
+            backlog, self.min_workers, self.max_workers, self.backlog_per_worker
+        )
+        WORKERS_DESIRED.set(desired)
+        current = len(self._workers)
+        if desired > current:
+            logger.info("Backlog %s: scaling up to %s workers", backlog, desired)
+            for _ in range(desired - current):
+                self._start(self._free_slot())
+            self._last_scale = now
+        elif desired < current and now - self._last_scale >= self.scale_down_delay:
+            logger.info("Backlog %s: scaling down to %s workers", backlog, current - 1)
+            self.retire(max(self._workers), now)
+            self._last_scale = now
+
+    def retire(self, slot: int, now: float) -> None:
+        worker = self._workers.pop(slot)
+        WORKERS.set(len(self._workers))
+        worker.retired_at = now
+        if worker.proc.is_alive():
+            worker.proc.terminate()
+        self._retired[slot] = worker
+
+    async def _own_consumers(self, r: Redis) -> Dict[str, int]:
+        """pending entries of every consumer this supervisor owns, over all streams"""
+        owned: Dict[str, int] = {}
+        for stream in self.streams:
+            try:
+                consumers = await r.xinfo_consumers(stream, self.group)
+            except ResponseError:
+                continue
+            for c in consumers:
+                name = as_text(c["name"])
+                if self.owns(name):
+                    owned[name] = owned.get(name, 0) + int(c.get("pending") or 0)
+        return owned
+
+    async def _pending_of(self, r: Redis, consumer: str) -> int:
+        return (await self._own_consumers(r)).get(consumer, 0)
+
+    async def _delete_consumer(self, r: Redis, consumer: str) -> None:
+        if not self.owns(consumer):
+            return
+        for stream in self.streams:
+            try:
+                await r.xgroup_delconsumer(stream, self.group, consumer)
+            except ResponseError:
+                pass
+        logger.info("Consumer %s removed from group %s", consumer, self.group)
+
+    async def find_stale(self) -> None:
+        """consumers an earlier run left in the group that no worker uses now"""
+        r = await self._get_client()
+        live = {w.name for w in [*self._workers.values(), *self._retired.values()]}
+        self._stale = set(await self._own_consumers(r)) - live
+
+    async def reap_stale(self) -> None:
+        if not self._stale:
+            return
+        r = await self._get_client()
+        pending = await self._own_consumers(r)
+        for name in list(self._stale):
+            if not pending.get(name):
+                await self._delete_consumer(r, name)
+                self._stale.discard(name)
+
+    async def reap_retired(self, now: float) -> None:
+        """delete the consumers of stopped workers whose pending entries are gone"""
+        if not self._retired:
+            return
+        r = await self._get_client()
+        for slot, worker in list(self._retired.items()):
+            if worker.proc.is_alive():
+                if now - worker.retired_at > self.stop_timeout:
+                    logger.warning("Worker %s did not stop, killing it", worker.name)
+                    worker.proc.kill()
+                continue
+            pending = await self._pending_of(r, worker.name)
+            if pending:
+                logger.debug("Consumer %s still owns %s entries", worker.name, pending)
+                continue
+            await self._delete_consumer(r, worker.name)
+            del self._retired[slot]
+            RETIRED.inc()
+
+    async def tick(self, now: float | None = None) -> None:
+        now = time.monotonic() if now is None else now
+        self.check_workers(now)
+        try:
+            backlog = await self.backlog()
+        except Exception as e:
+            # keep the pool as it is until Redis answers again
+            logger.warning("Backlog check failed: %s", e)
+        else:
+            BACKLOG.set(backlog)
+            self.scale(backlog, now)
+        try:
+            await self.reap_retired(now)
+            await self.reap_stale()
+        except Exception as e:
+            logger.warning("Retired consumer cleanup failed: %s", e)
+
+    async def run_loop(self) -> None:
+        self._running = True
+        for _ in range(self.min_workers):
+            self._start(self._free_slot())
+        self._last_scale = time.monotonic()
+        try:
+            await self.find_stale()
+        except Exception as e:
+            logger.warning("Looking up consumers of an earlier run failed: %s", e)
+        while self._running:
+            await self.tick()
+            await asyncio.sleep(self.interval)
+
+    async def stop(self) -> None:
+        """
+        SIGTERM every worker, SIGKILL the ones still running after stop_timeout,
+        then remove the consumers whose PEL is empty (the others keep their
+        entries until a live worker reclaims them)
+        """
+        self._running = False
+        workers = [*self._workers.values(), *self._retired.values()]
+        procs = [w.proc for w in workers]
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+        deadline = time.monotonic() + self.stop_timeout
+        while any(p.is_alive() for p in procs) and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        for proc in procs:
+            if proc.is_alive():
+                proc.kill()
+        self._workers.clear()
+        self._retired.clear()
+        WORKERS.set(0)
+        try:
+            r = await self._get_client()
+            pending = await self._own_consumers(r)
+            for name in {w.name for w in workers} | self._stale:
+                if pending.get(name):
+                    logger.info(
+                        "Consumer %s kept: %s pending entries", name, pending[name]
+                    )
+                else:
+                    await self._delete_consumer(r, name)
+        except Exception as e:
+            logger.warning("Removing the pool's consumers failed: %s", e)
+        if self._client:
+            await self._client.close()
+            self._client = None
@@ -0,0 +1,26 @@
+# app/workers/supervisor_entrypoint.py
+import asyncio
+import logging
+from prometheus_client import start_http_server
+
+from app.settings import settings
+from app.workers.runner import run_until_stopped
+from app.workers.supervisor import WorkerSupervisor
+
+logging.basicConfig(level=settings.log_level)
+logger = logging.getLogger("supervisor")
+
+
+async def run():
+    start_http_server(settings.supervisor_port)
+    supervisor = WorkerSupervisor()
+    try:
+        await supervisor.run_loop()
+    except asyncio.CancelledError:
+        logger.info("Supervisor stopped")
+    finally:
+        await supervisor.stop()
+
+
+if __name__ == "__main__":
+    run_until_stopped(run())
@@ -0,0 +1,57 @@
+# benchmarks/codec_bench.py
+"""
+Micro-benchmark of the stream entry codecs on realistic task payloads.
+
+    python -m benchmarks.codec_bench [iterations]
+"""
+
+import sys
+import timeit
+import uuid
+from datetime import datetime, timezone
+
+from app.infra.event_bus.codec import _CODECS
+
+
+def sample_payloads() -> dict:
+    small = {
+        "task_id": str(uuid.uuid4()),
+        "name": "send-email",
+        "payload": {"to": "user@example.com", "template": "welcome"},
+    }
+    medium = {
+        "task_id": uuid.uuid4(),
+        "name": "render-report",
+        "payload": {
+            "created_at": datetime.now(timezone.utc),
+            "rows": [
+                {"id": i, "sku": f"SKU-{i:06d}", "qty": i % 7, "price": i * 1.25}
+                for i in range(200)
+            ],
+        },
+    }
+    large = {
+        "task_id": uuid.uuid4(),
+        "name": "import-batch",
+        "payload": {
+            "items": [dict(medium["payload"]["rows"][0], n=i) for i in range(5000)]
+        },
+    }
+    return {"small": small, "medium": medium, "large": large}
+
+
+def main(iterations: int = 2000):
+    print(
+        f"{'payload':<8} {'codec':<8} {'bytes':>9} {'encode us':>10} {'decode us':>10}"
+    )
+    for label, payload in sample_payloads().items():
+        n = max(1, iterations // (50 if label == "large" else 1))
+        for name, codec in _CODECS.items():
+            raw = codec.dumps(payload)
+            enc = timeit.timeit(lambda: codec.dumps(payload), number=n) / n * 1e6
+            dec = timeit.timeit(lambda: codec.loads(raw), number=n) / n * 1e6
+            print(f"{label:<8} {name:<8} {len(raw):>9} {enc:>10.1f} {dec:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,127 @@
+# tests/conftest.py
+"""
+Fakes shared by the unit tests.
+FakeRedis subclasses implement the commands a test needs as coroutines;
+FakePipeline queues calls to them and runs them on execute(), so code
+under test gets the same results piped or not.
+`lua_redis` runs the real Lua scripts: against the Redis at TEST_REDIS_URL
+(a throwaway one, it is flushed) or, by default, fakeredis with its Lua
+engine.
+"""
+
+import os
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.dialects import postgresql
+
+from app.infra.db.repo_async import AsyncTaskRepository
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.calls = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __getattr__(self, command):
+        getattr(self.redis, command)  # unknown commands fail when queued
+
+        def queue(*args, **kwargs):
+            self.calls.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self, raise_on_error=True):
+        # like redis: every queued command runs, errors come back in place
+        calls, self.calls = self.calls, []
+        results = []
+        for command, args, kwargs in calls:
+            try:
+                results.append(await getattr(self.redis, command)(*args, **kwargs))
+            except Exception as e:
+                results.append(e)
+        if raise_on_error:
+            for result in results:
+                if isinstance(result, Exception):
+                    raise result
+        return results
+
+
+class FakeRedis:
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def aclose(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class FakeResult:
+    def __init__(self, rows, rowcount):
+        self.rows = rows
+        self.rowcount = rowcount
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self.rows
+
+
+class FakeSession:
+    """records the statements it is given; every one returns `rows`"""
+
+    def __init__(self, rows=(), rowcount=0):
+        self.statements = []
+        self.rows = list(rows)
+        self.rowcount = rowcount
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def begin(self):
+        return self
+
+    async def execute(self, stmt, params=None):
+        self.statements.append(stmt)
+        return FakeResult(self.rows, self.rowcount)
+
+
+def make_repo(session):
+    repo = AsyncTaskRepository()
+    repo._session_factory = lambda: session
+    return repo
+
+
+def compiled(stmt):
+    c = stmt.compile(dialect=postgresql.dialect())
+    return " ".join(str(c).split()), c.params
+
+
+@pytest_asyncio.fixture
+async def lua_redis():
+    url = os.getenv("TEST_REDIS_URL")
+    if url:
+        from redis.asyncio import from_url
+
+        client = from_url(url)
+    else:
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        client = fakeredis.FakeAsyncRedis()
+    await client.flushdb()
+    yield client
+    await client.flushdb()
+    await client.aclose()
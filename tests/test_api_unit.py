@@ -9,3 +9,46 @@ async def test_health():
     async with AsyncClient(app=app, base_url="http://test") as ac:
         r = await ac.get("/v1/tasks/nonexistent")
         assert r.status_code in (200, 404)  # route exists; behavior depends on DB
+
+
+@pytest.mark.asyncio
+async def test_batch_create_rejects_oversized_batch(monkeypatch):
+    from app.settings import settings
+
+    monkeypatch.setattr(settings, "task_batch_max_size", 2)
+    body = {"tasks": [{"name": "t", "payload": {}}] * 3}
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        r = await ac.post("/v1/tasks:batch", json=body)
+        assert r.status_code == 413
+
+
+def test_list_cursor_roundtrip():
+    import uuid
+    from datetime import datetime, timezone
+    from app.api.v1.samurai_queries import encode_cursor, decode_cursor
+
+    created_at = datetime(2024, 1, 2, 3, 4, 5, 6, tzinfo=timezone.utc)
+    task_id = uuid.uuid4()
+    assert decode_cursor(encode_cursor(created_at, task_id)) == (created_at, task_id)
+
+
+@pytest.mark.asyncio
+async def test_list_rejects_invalid_cursor():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        r = await ac.get("/v1/tasks", params={"cursor": "not-a-cursor"})
+        assert r.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_create_rejects_unknown_priority():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        r = await ac.post("/v1/tasks", json={"name": "t", "priority": "urgent!!"})
+        assert r.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_create_rejects_run_at_with_delay():
+    body = {"name": "t", "run_at": "2030-01-01T00:00:00Z", "delay_seconds": 5}
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        r = await ac.post("/v1/tasks", json=body)
+        assert r.status_code == 422
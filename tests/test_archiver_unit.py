@@ -0,0 +1,52 @@
+# tests/test_archiver_unit.py
+from datetime import datetime, timedelta
+
+import pytest
+from app.infra.outbox.archiver import OutboxArchiver
+
+
+class FakeRepo:
+    def __init__(self, old_rows, old_keys=0):
+        self.old_rows = old_rows
+        self.old_keys = old_keys
+        self.calls = []
+
+    async def archive_published_outbox(self, older_than, limit, archive):
+        self.calls.append((older_than, limit, archive))
+        n = min(self.old_rows, limit)
+        self.old_rows -= n
+        return n
+
+    async def purge_expired_idempotency_keys(self, limit):
+        n = min(self.old_keys, limit)
+        self.old_keys -= n
+        return n
+
+
+@pytest.mark.asyncio
+async def test_backlog_is_archived_in_bounded_batches():
+    repo = FakeRepo(old_rows=250, old_keys=120)
+    archiver = OutboxArchiver(repo, retention_hours=2, batch_size=100, archive=True)
+
+    before = datetime.utcnow()
+    assert await archiver.run_once() == 250
+
+    # full batches go again, the first short one ends the run
+    assert [limit for _, limit, _ in repo.calls] == [100, 100, 100]
+    assert all(archive for _, _, archive in repo.calls)
+    cutoffs = {older_than for older_than, _, _ in repo.calls}
+    (cutoff,) = cutoffs  # one cutoff for the whole run
+    assert (
+        before - timedelta(hours=2) <= cutoff <= datetime.utcnow() - timedelta(hours=2)
+    )
+    assert repo.old_keys == 0
+
+
+@pytest.mark.asyncio
+async def test_exact_batch_multiple_ends_on_an_empty_batch():
+    repo = FakeRepo(old_rows=200)
+    archiver = OutboxArchiver(repo, batch_size=100, archive=False)
+
+    assert await archiver.run_once() == 200
+    assert [limit for _, limit, _ in repo.calls] == [100, 100, 100]
+    assert not any(archive for _, _, archive in repo.calls)
@@ -0,0 +1,63 @@
+# tests/test_codec_unit.py
+import json
+import uuid
+from datetime import datetime, timezone
+import pytest
+from app.infra.event_bus.codec import (
+    Codec,
+    as_text,
+    decode_entry,
+    encode_entry,
+    get_codec,
+)
+
+
+def as_raw(entry: dict) -> dict:
+    """what redis gives back: bytes keys and values"""
+    return {
+        k.encode(): v if isinstance(v, bytes) else str(v).encode()
+        for k, v in entry.items()
+    }
+
+
+@pytest.mark.parametrize("name", ["json", "orjson", "msgpack"])
+def test_roundtrip_with_native_uuid_and_datetime(name):
+    task_id = uuid.uuid4()
+    now = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    entry = encode_entry(
+        "task.created", {"task_id": task_id, "at": now}, get_codec(name)
+    )
+
+    event_type, _, data = decode_entry(as_raw(entry))
+
+    assert event_type == "task.created"
+    assert data["task_id"] == str(task_id)
+    assert datetime.fromisoformat(data["at"]) == now
+
+
+def test_legacy_entry_without_codec_field_is_json():
+    raw = {b"type": b"task.created", b"payload": json.dumps({"a": 1}).encode()}
+    assert decode_entry(raw) == ("task.created", "", {"a": 1})
+
+
+def test_unknown_codec_is_rejected():
+    with pytest.raises(ValueError):
+        get_codec("pickle")
+
+
+def test_codec_without_loads_cannot_be_registered():
+    class HalfCodec(Codec):
+        name = "half"
+
+        def dumps(self, obj) -> bytes:
+            return b""
+
+    with pytest.raises(TypeError):
+        HalfCodec()
+
+
+def test_as_text_normalizes_redis_replies():
+    assert as_text(b"1-0") == "1-0"
+    assert as_text("g") == "g"
+    assert as_text(3) == "3"
+    assert as_text(None) is None
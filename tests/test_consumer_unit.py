@@ -0,0 +1,581 @@
+# tests/test_consumer_unit.py
+import asyncio
+import json
+import pytest
+from app.infra.event_bus.consumer import DEFERRED_FIELD, RedisStreamConsumer
+from app.infra.event_bus.reclaimer import PendingReclaimer
+from app.infra.event_bus.scheduler import schedule_key
+from tests import conftest
+
+
+class FakeRedis(conftest.FakeRedis):
+    def __init__(self):
+        self.acked = []
+        self.xack_calls = 0
+        self.added = []
+        self.pending = {}  # msg_id -> (raw, times_delivered)
+        self.scheduled = {}
+        self.touched = []
+
+    async def hset(self, key, mapping):
+        self.scheduled[key] = mapping
+
+    async def zadd(self, key, mapping):
+        pass
+
+    async def xclaim(self, stream, group, consumer, min_idle_time, message_ids, justid):
+        assert justid and min_idle_time == 0
+        self.touched.extend(message_ids)
+
+    async def xack(self, stream, group, *ids):
+        self.xack_calls += 1
+        self.acked.extend(ids)
+
+    async def xadd(self, stream, entry):
+        self.added.append((stream, entry))
+        return b"%d-0" % len(self.added)
+
+    async def xgroup_create(self, stream, group, id="0", mkstream=False):
+        pass
+
+    async def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        await asyncio.sleep(0.01)
+        return []
+
+    async def xinfo_groups(self, stream):
+        return []
+
+    async def xpending(self, stream, group):
+        return {"pending": len(self.pending)}
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, start_id, count):
+        messages = []
+        for msg_id, (raw, n) in self.pending.items():
+            self.pending[msg_id] = (raw, n + 1)
+            messages.append((msg_id, raw))
+        return [b"0-0", messages, []]
+
+    async def xpending_range(self, stream, group, min, max, count):
+        def key(msg_id):
+            return tuple(int(p) for p in msg_id.split(b"-"))
+
+        rows = [
+            {"message_id": msg_id, "times_delivered": n}
+            for msg_id, (_, n) in sorted(self.pending.items(), key=lambda p: key(p[0]))
+            if key(min) <= key(msg_id) <= key(max)
+        ]
+        return rows[:count]
+
+
+def make_consumer(**kwargs):
+    kwargs.setdefault("dedupe", False)
+    c = RedisStreamConsumer("s", max_in_flight=4, ack_batch_size=100, **kwargs)
+    c._client = FakeRedis()
+    c._slots = asyncio.Semaphore(c.max_in_flight)
+    return c
+
+
+def raw_entry(task_id, seq=0):
+    payload = json.dumps({"task_id": task_id, "seq": seq}).encode()
+    return {b"type": b"task.created", b"payload": payload}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_handlers_keep_per_task_order_and_batch_acks():
+    c = make_consumer(ordered=True)
+    seen = []
+    running = 0
+    peak = 0
+    running_a = 0
+
+    async def handler(event_type, task_id, data):
+        nonlocal running, peak, running_a
+        running += 1
+        peak = max(peak, running)
+        if data["task_id"] == "a":
+            running_a += 1
+            assert running_a == 1
+        await asyncio.sleep(0.01)
+        seen.append((data["task_id"], data["seq"]))
+        if data["task_id"] == "a":
+            running_a -= 1
+        running -= 1
+
+    ids = []
+    for i in range(8):
+        msg_id = f"{i}-0".encode()
+        ids.append(msg_id)
+        await c.dispatch(handler, msg_id, raw_entry("a" if i % 2 else f"b{i}", i))
+    await c.drain()
+
+    assert peak > 1
+    assert [seq for key, seq in seen if key == "a"] == [1, 3, 5, 7]
+    assert sorted(c._client.acked) == sorted(ids)
+    assert c._client.xack_calls == 1
+    assert c._key_locks == {}
+
+
+@pytest.mark.asyncio
+async def test_failed_handler_is_not_acked():
+    c = make_consumer()
+
+    async def handler(event_type, task_id, data):
+        if data["task_id"] == "bad":
+            raise RuntimeError("boom")
+
+    await c.dispatch(handler, b"1-0", raw_entry("ok"))
+    await c.dispatch(handler, b"2-0", raw_entry("bad"))
+    await c.drain()
+
+    assert c._client.acked == [b"1-0"]
+
+
+@pytest.mark.asyncio
+async def test_leave_pending_skips_ack_and_retry():
+    from app.infra.event_bus.consumer import LeavePending
+
+    class NoRetry:
+        async def on_failure(self, *args, **kwargs):
+            raise AssertionError("must not be retried")
+
+    c = make_consumer(retry=NoRetry())
+
+    async def handler(event_type, task_id, data):
+        raise LeavePending("running elsewhere")
+
+    await c.dispatch(handler, b"1-0", raw_entry("busy"))
+    await c.drain()
+
+    assert c._client.acked == []
+    assert "running elsewhere" in c.last_error(b"1-0", "s")
+
+
+@pytest.mark.asyncio
+async def test_failed_handler_is_handed_to_retry_engine_and_acked():
+    class FakeRetry:
+        def __init__(self):
+            self.calls = []
+
+        async def on_failure(
+            self, r, stream, event_type, task_id, data, exc, outbox_id=None
+        ):
+            self.calls.append((stream, task_id, str(exc)))
+
+    retry = FakeRetry()
+    c = make_consumer(retry=retry)
+
+    async def handler(event_type, task_id, data):
+        raise RuntimeError("boom")
+
+    await c.dispatch(handler, b"1-0", raw_entry("bad"))
+    await c.drain()
+
+    assert retry.calls == [("s", "bad", "boom")]
+    assert c._client.acked == [b"1-0"]
+    assert c.last_error(b"1-0", "s") is None
+
+
+class DedupeRedis(FakeRedis):
+    def __init__(self):
+        super().__init__()
+        self.keys = {}
+
+        self.mgets = []
+
+    async def set(self, key, value, ex=None):
+        self.keys[key] = ex
+
+    async def mget(self, keys):
+        self.mgets.append(list(keys))
+        return [b"1" if k in self.keys else None for k in keys]
+
+
+@pytest.mark.asyncio
+async def test_duplicate_events_are_dropped_before_the_handler():
+    shared = DedupeRedis()
+    calls = []
+
+    async def handler(event_type, task_id, data):
+        calls.append(data["seq"])
+
+    def with_outbox_id(raw, outbox_id, attempt=None):
+        raw = {**raw, b"outbox_id": outbox_id}
+        if attempt:
+            raw[b"attempt"] = attempt
+        return raw
+
+    first = make_consumer(dedupe=True)
+    first._client = shared
+    await first.dispatch(handler, b"1-0", with_outbox_id(raw_entry("a", 1), b"7"))
+    # the outbox row published twice, e.g. after a lost mark
+    await first.dispatch(handler, b"2-0", with_outbox_id(raw_entry("a", 1), b"7"))
+    # a retry attempt of the same row is a new event
+    await first.dispatch(handler, b"3-0", with_outbox_id(raw_entry("a", 2), b"7", b"1"))
+    await first.drain()
+
+    # another worker of the group, with an empty local cache
+    second = make_consumer(dedupe=True)
+    second._client = shared
+    await second.dispatch_many(
+        handler, [(b"4-0", with_outbox_id(raw_entry("a", 1), b"7"))], stream="s"
+    )
+    await second.drain()
+
+    assert calls == [1, 2]
+    assert shared.acked == [b"1-0", b"2-0", b"3-0", b"4-0"]
+    assert set(shared.keys) == {
+        "processed:samurai-workers:7",
+        "processed:samurai-workers:7:1",
+    }
+
+
+@pytest.mark.asyncio
+async def test_read_batch_is_checked_for_duplicates_in_one_round_trip():
+    shared = DedupeRedis()
+    shared.keys["processed:samurai-workers:s:2-0"] = 60
+    calls = []
+
+    async def handler(event_type, task_id, data):
+        calls.append(data["seq"])
+
+    c = make_consumer(dedupe=True)
+    c._client = shared
+    batch = [(b"%d-0" % i, raw_entry("k%d" % i, i)) for i in range(1, 5)]
+    await c.dispatch_many(handler, batch, stream="s")
+    await c.drain()
+
+    assert len(shared.mgets) == 1 and len(shared.mgets[0]) == 4
+    assert sorted(calls) == [1, 3, 4]
+    assert sorted(shared.acked) == [b"1-0", b"2-0", b"3-0", b"4-0"]
+
+    # handled ids are now cached locally: the same batch needs no lookup
+    await c.dispatch_many(handler, batch, stream="s")
+    await c.drain()
+    assert len(shared.mgets) == 1
+    assert sorted(calls) == [1, 3, 4]
+
+
+def test_dedupe_ttl_defaults_to_the_redelivery_horizon(monkeypatch):
+    from app.infra.redis.dedupe import ProcessedEventSet, redelivery_horizon
+    from app.settings import settings
+
+    monkeypatch.setattr(settings, "consumer_dedupe_ttl", 0)
+    monkeypatch.setattr(settings, "consumer_reclaim_idle_ms", 60000)
+    monkeypatch.setattr(settings, "consumer_reclaim_interval", 5.0)
+    monkeypatch.setattr(settings, "consumer_max_deliveries", 5)
+    monkeypatch.setattr(settings, "retry_backoff_max", 300.0)
+    monkeypatch.setattr(settings, "outbox_lease_seconds", 30.0)
+
+    assert redelivery_horizon() == 65 * 5 + 300 + 30
+    assert ProcessedEventSet("g").ttl == redelivery_horizon()
+    assert ProcessedEventSet("g", ttl=10).ttl == 10
+
+
+@pytest.mark.asyncio
+async def test_slow_event_type_is_capped_without_blocking_other_types():
+    c = make_consumer()  # max_in_flight=4
+    running = {"slow": 0, "fast": 0}
+    peak_slow, finished = 0, []
+    release_slow = asyncio.Event()
+
+    async def slow(event_type, task_id, data):
+        nonlocal peak_slow
+        running["slow"] += 1
+        peak_slow = max(peak_slow, running["slow"])
+        await release_slow.wait()
+        running["slow"] -= 1
+        finished.append("slow")
+
+    async def fast(event_type, task_id, data):
+        finished.append("fast")
+
+    c.register("report.build", slow, max_concurrency=1, max_waiting=10)
+    c.register("task.created", fast)
+
+    def typed(event_type, task_id):
+        raw = raw_entry(task_id)
+        raw[b"type"] = event_type
+        return raw
+
+    for i in range(5):
+        await c.dispatch(None, f"{i}-1".encode(), typed(b"report.build", f"r{i}"))
+    for i in range(5):
+        await c.dispatch(None, f"{i}-2".encode(), typed(b"task.created", f"t{i}"))
+    await asyncio.sleep(0.01)
+
+    # waiting slow messages hold no global slot: every fast one already ran
+    assert finished == ["fast"] * 5
+    release_slow.set()
+    await c.drain()
+    assert peak_slow == 1
+    assert len(c._client.acked) == 10
+
+
+@pytest.mark.asyncio
+async def test_full_type_buffer_defers_instead_of_blocking_the_reader():
+    c = make_consumer()
+    release = asyncio.Event()
+
+    async def slow(event_type, task_id, data):
+        await release.wait()
+
+    c.register("task.created", slow, max_concurrency=1, max_waiting=1)
+    for i in range(4):
+        await asyncio.wait_for(
+            c.dispatch(None, f"{i}-0".encode(), raw_entry(f"r{i}")), 0.1
+        )
+    await asyncio.sleep(0.01)
+
+    # 1 running + 1 buffered; the other two went to the scheduler, acked
+    assert sorted(c._client.acked) == [b"2-0", b"3-0"]
+    assert len(c._client.scheduled) == 2
+    (key,) = [k for k in c._client.scheduled if "2-0" in k]
+    # kept in the scheduler of the stream it came from
+    assert key.startswith(schedule_key("s"))
+    assert c._client.scheduled[key][b"payload"] == raw_entry("r2")[b"payload"]
+    assert c._client.scheduled[key][DEFERRED_FIELD] == b"1"
+
+    # only the buffered message is kept out of other reclaimers
+    await c._touch_buffered()
+    assert c._client.touched == [b"1-0"]
+
+    release.set()
+    await c.drain()
+    assert sorted(c._client.acked) == [b"0-0", b"1-0", b"2-0", b"3-0"]
+    assert c._buffered == set()
+
+
+@pytest.mark.asyncio
+async def test_unregistered_event_type_without_default_handler_fails():
+    c = make_consumer()
+    await c.dispatch(None, b"1-0", raw_entry("x"))
+    await c.drain()
+    assert c._client.acked == []
+    assert "no handler registered" in c.last_error(b"1-0", "s")
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_limits_rate():
+    import time
+    from app.infra.event_bus.handlers import TokenBucket, parse_handler_limits
+
+    bucket = TokenBucket(rate=100, burst=1)
+    start = time.monotonic()
+    for _ in range(4):
+        await bucket.acquire()
+    assert time.monotonic() - start >= 0.03
+
+    assert parse_handler_limits("a:4:10, b:2")["b"] == {
+        "max_concurrency": 2,
+        "rate": None,
+        "burst": None,
+    }
+
+
+@pytest.mark.asyncio
+async def test_shared_token_bucket_limits_all_workers_together(lua_redis):
+    from app.infra.event_bus.handlers import RedisTokenBucket
+
+    async def get_client():
+        return lua_redis
+
+    # two workers, one bucket of 2 tokens refilled at 50/s
+    a, b = (RedisTokenBucket(get_client, "rl:t", rate=50, burst=2) for _ in "ab")
+    assert await a.acquire() == 0 and await b.acquire() == 0
+    assert 0 < await a.acquire() <= 0.03
+
+    tokens, ts = await lua_redis.hmget("rl:t", "tokens", "ts")
+    assert float(tokens) < 1 and float(ts) > 0
+    assert 0 < await lua_redis.pttl("rl:t") <= 1040
+    # the script ran: neither worker fell back to its local bucket
+    assert a._fallback._tokens == b._fallback._tokens == 2
+
+
+def test_read_count_adapts_to_backlog():
+    c = make_consumer(read_count_max=16)
+    count = 2
+    for _ in range(5):
+        count = c._next_count(count, True, 2)
+    assert count == 16
+    for _ in range(5):
+        count = c._next_count(count, False, 2)
+    assert count == 2
+
+
+@pytest.mark.asyncio
+async def test_reclaimer_redelivers_and_dead_letters():
+    c = make_consumer()
+    handled = []
+
+    async def handler(event_type, task_id, data):
+        handled.append(data["task_id"])
+
+    c._client.pending = {
+        b"1-0": (raw_entry("fresh"), 1),
+        b"2-0": (raw_entry("poison"), 5),
+    }
+    reclaimer = PendingReclaimer(
+        c, handler, max_deliveries=5, dead_letter_stream="dead"
+    )
+    assert await reclaimer.reclaim_once() == 2
+    await c.drain()
+
+    assert handled == ["fresh"]
+    ((stream, entry),) = c._client.added
+    assert stream == "dead" and entry["source_id"] == b"2-0"
+    assert sorted(c._client.acked) == [b"1-0", b"2-0"]
+
+
+@pytest.mark.asyncio
+async def test_reclaimer_counts_deliveries_of_each_claimed_id():
+    c = make_consumer()
+    handled = []
+
+    async def handler(event_type, task_id, data):
+        handled.append(data["task_id"])
+
+    r = c._client
+    r.pending = {
+        b"1-0": (raw_entry("fresh"), 1),
+        b"2-0": (raw_entry("busy"), 1),  # not idle yet: skipped by XAUTOCLAIM
+        b"3-0": (raw_entry("poison"), 6),
+    }
+
+    async def xautoclaim(stream, group, consumer, min_idle_time, start_id, count):
+        return [b"0-0", [(m, r.pending[m][0]) for m in (b"1-0", b"3-0")], []]
+
+    r.xautoclaim = xautoclaim
+    reclaimer = PendingReclaimer(
+        c, handler, max_deliveries=5, dead_letter_stream="dead"
+    )
+    assert await reclaimer.reclaim_once() == 2
+    await c.drain()
+
+    # a range 1-0..3-0 capped at two rows would have left 3-0 at 0 deliveries
+    assert handled == ["fresh"]
+    ((stream, entry),) = r.added
+    assert entry["source_id"] == b"3-0" and entry["deliveries"] == 6
+
+
+@pytest.mark.asyncio
+async def test_reclaimers_follow_rebalanced_streams():
+    c = RedisStreamConsumer(["s:0", "s:1"], max_in_flight=4, dedupe=False)
+    c._client = FakeRedis()
+
+    async def handler(event_type, task_id, data):
+        pass
+
+    # handlers registered per type, none passed to run()
+    c.register("task.created", handler)
+    loop = asyncio.create_task(c.run())
+    await asyncio.sleep(0.02)
+    assert set(c._reclaimers) == {"s:0", "s:1"}
+
+    await c.set_streams(["s:1", "s:2", "s:3"])
+    assert set(c._reclaimers) == {"s:1", "s:2", "s:3"}
+
+    c._stopped = True
+    await loop
+    assert c._reclaimers == {}
+
+
+class OneReadRedis(FakeRedis):
+    """the first XREADGROUP returns `messages`, later ones nothing"""
+
+    def __init__(self, stream, messages):
+        super().__init__()
+        self.stream, self.messages = stream, messages
+
+    async def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        await asyncio.sleep(0.01)
+        messages, self.messages = self.messages, []
+        return [(self.stream, messages)] if messages else []
+
+
+@pytest.mark.asyncio
+async def test_lane_wait_observes_only_fresh_reads():
+    import time
+    from prometheus_client import REGISTRY
+
+    def observed():
+        labels = {"lane": "waitlane"}
+        return [
+            REGISTRY.get_sample_value(f"samurai_lane_wait_seconds_{s}", labels) or 0
+            for s in ("count", "sum")
+        ]
+
+    async def handler(event_type, task_id, data):
+        pass
+
+    c = RedisStreamConsumer({"w:s": "waitlane"}, max_in_flight=4, dedupe=False)
+    fresh_id = b"%d-0" % (time.time() * 1000 - 2000)
+    deferred = {**raw_entry("back"), DEFERRED_FIELD: b"1"}
+    c._client = OneReadRedis(b"w:s", [(fresh_id, raw_entry("new")), (b"1-0", deferred)])
+    # idle since 1970, claimed back by the reclaimer
+    c._client.pending = {b"2-0": (raw_entry("stuck"), 1)}
+    c.register("task.created", handler)
+
+    loop = asyncio.create_task(c.run())
+    await asyncio.sleep(0.05)
+    await PendingReclaimer(c, handler, stream="w:s").reclaim_once()
+    c._stopped = True
+    await loop
+
+    count, total = observed()
+    assert count == 1 and 1.5 < total < 60
+
+
+def test_partitions_are_stable_and_spread_over_members():
+    import uuid
+    from app.infra.event_bus.partitioning import assign, partition_for
+
+    task_id = uuid.uuid4()
+    assert partition_for(task_id, 8) == partition_for(str(task_id).upper(), 8)
+
+    members = ["w-b", "w-a", "w-c"]
+    shares = [assign(m, members, 8) for m in members]
+    assert sorted(p for share in shares for p in share) == list(range(8))
+    assert assign("gone", members, 8) == []
+
+
+class LaneRedis:
+    """xreadgroup over in-memory lanes; records the counts asked per call"""
+
+    def __init__(self, backlog):
+        self.backlog = backlog  # stream -> number of waiting entries
+        self.asked = []
+
+    async def xreadgroup(self, group, consumer, streams, count, block=None):
+        resp = []
+        for stream in streams:
+            n = min(count, self.backlog[stream])
+            self.backlog[stream] -= n
+            self.asked.append((stream, count, block))
+            if n:
+                resp.append((stream, [(f"{i}-0".encode(), {}) for i in range(n)]))
+        return resp
+
+
+@pytest.mark.asyncio
+async def test_weighted_read_shares_budget_and_passes_spare_on():
+    c = RedisStreamConsumer(
+        {"q:high": "high", "q": "normal", "q:low": "low"},
+        lane_weights={"high": 6, "normal": 3, "low": 1},
+    )
+    r = LaneRedis({"q:high": 100, "q": 1, "q:low": 100})
+
+    resp = await c._read_weighted(r, 10)
+
+    got = {stream: len(messages) for stream, messages in resp}
+    # high gets 6, normal has only 1 of its 3, low gets its 1 plus the spare 2
+    assert got == {"q:high": 6, "q": 1, "q:low": 3}
+    assert all(block is None for *_, block in r.asked)
+
+
+@pytest.mark.asyncio
+async def test_weighted_read_blocks_only_when_all_lanes_are_empty():
+    c = RedisStreamConsumer({"q:high": "high", "q": "normal"}, lane_weights={"high": 2})
+    r = LaneRedis({"q:high": 0, "q": 0})
+
+    assert await c._read_weighted(r, 10) == []
+    assert r.asked[-1][2] == c.block_ms
@@ -0,0 +1,249 @@
+# tests/test_flusher_unit.py
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.infra.outbox.flusher import OutboxFlusher
+from app.settings import settings
+from tests import conftest
+
+
+class FakeRedis(conftest.FakeRedis):
+    def __init__(self, reject=()):
+        self.added = []
+        self.reject = set(reject)  # outbox ids whose next XADD fails
+
+    async def xadd(self, stream, fields):
+        outbox_id = int(fields["outbox_id"])
+        if outbox_id in self.reject:
+            self.reject.discard(outbox_id)
+            raise RuntimeError("OOM command not allowed")
+        self.added.append(outbox_id)
+        return b"1-%d" % len(self.added)
+
+
+class FlakyRepo:
+    def __init__(self, down=False):
+        self.down = down
+        self.marked = {}
+        self.released = []
+
+    async def mark_outbox_published_bulk(self, pairs):
+        if self.down:
+            raise ConnectionError("db down")
+        self.marked.update(pairs)
+
+    async def mark_outbox_published(self, outbox_id, stream_id=None):
+        if self.down:
+            raise ConnectionError("db down")
+        self.marked[outbox_id] = stream_id
+
+    async def release_outbox_claims(self, ids, owner):
+        self.released.extend(ids)
+
+
+def _event(id):
+    return SimpleNamespace(
+        id=id,
+        stream=settings.stream_name,
+        event_type="task.created",
+        payload={"task_id": f"t{id}"},
+        created_at=datetime.now(timezone.utc),
+        run_at=None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_unmarked_rows_are_never_published_twice():
+    r, repo = FakeRedis(), FlakyRepo(down=True)
+    flusher = OutboxFlusher(repo, redis_url="redis://unused")
+    events = [_event(1), _event(2)]
+
+    # bulk and per-event marking both fail: no exception, no second XADD
+    await flusher._publish_batch(r, events)
+    assert r.added == [1, 2]
+    assert set(flusher._unmarked) == {1, 2}
+    assert repo.released == []
+    await flusher._publish_one(r, events[0])
+    assert r.added == [1, 2]
+
+    # the rows come back (lease expired, re-claimed): only marked this time
+    repo.down = False
+    await flusher._publish_batch(r, events)
+    assert r.added == [1, 2]
+    assert repo.marked == {1: "1-1", 2: "1-2"}
+    assert flusher._unmarked == {}
+
+
+@pytest.mark.asyncio
+async def test_rejected_entries_are_retried_one_by_one():
+    r, repo = FakeRedis(reject={2}), FlakyRepo()
+    flusher = OutboxFlusher(repo, redis_url="redis://unused")
+
+    await flusher._publish_batch(r, [_event(1), _event(2), _event(3)])
+
+    # only the rejected row went out a second time
+    assert sorted(r.added) == [1, 2, 3]
+    assert set(repo.marked) == {1, 2, 3}
+
+
+@pytest.mark.asyncio
+async def test_failed_single_publish_releases_its_claim():
+    r, repo = FakeRedis(reject={4}), FlakyRepo()
+    flusher = OutboxFlusher(repo, redis_url="redis://unused")
+
+    await flusher._publish_one(r, _event(4))
+
+    assert r.added == [] and repo.marked == {}
+    assert repo.released == [4]
+
+
+class FakeListenConn:
+    def __init__(self):
+        self.listeners = {}
+        self.closed = False
+
+    async def add_listener(self, channel, callback):
+        self.listeners[channel] = callback
+
+    def is_closed(self):
+        return self.closed
+
+    async def close(self):
+        self.closed = True
+
+
+class QueueRepo(FlakyRepo):
+    def __init__(self):
+        super().__init__()
+        self.rows = []
+        self.claims = 0
+
+    async def claim_pending_outbox(self, owner, limit, lease_seconds):
+        self.claims += 1
+        rows, self.rows = self.rows, []
+        return rows
+
+
+@pytest.mark.asyncio
+async def test_notify_wakes_the_idle_flusher(monkeypatch):
+    from app.infra.outbox import flusher as flusher_module
+
+    conn = FakeListenConn()
+
+    async def connect(dsn):
+        return conn
+
+    monkeypatch.setattr(flusher_module.asyncpg, "connect", connect)
+    monkeypatch.setattr(settings, "outbox_safety_poll_interval", 30.0)
+    repo = QueueRepo()
+    flusher = OutboxFlusher(repo, redis_url="redis://unused", poll_interval=30.0)
+    flusher.notify = True
+    flusher._redis = FakeRedis()
+    loop = asyncio.create_task(flusher.run_loop())
+    try:
+        # the wakeup set on LISTEN setup triggers one more claim, then it idles
+        for _ in range(100):
+            if repo.claims >= 2:
+                break
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        assert repo.claims == 2
+
+        repo.rows = [_event(5)]
+        notify = conn.listeners[settings.outbox_notify_channel]
+        notify(conn, 1, settings.outbox_notify_channel, "")
+        for _ in range(100):
+            if repo.marked:
+                break
+            await asyncio.sleep(0.01)
+        # published long before the 30s safety poll
+        assert flusher._redis.added == [5] and repo.marked == {5: "1-1"}
+    finally:
+        await flusher.stop()
+        await asyncio.wait_for(loop, timeout=1.0)
+    assert conn.closed
+
+
+@pytest.mark.asyncio
+async def test_failed_listen_falls_back_to_poll_interval(monkeypatch):
+    from app.infra.outbox import flusher as flusher_module
+
+    attempts = []
+
+    async def connect(dsn):
+        attempts.append(dsn)
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(flusher_module.asyncpg, "connect", connect)
+    monkeypatch.setattr(settings, "outbox_safety_poll_interval", 30.0)
+    flusher = OutboxFlusher(FlakyRepo(), redis_url="redis://unused", poll_interval=0.05)
+    flusher.notify = True
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await asyncio.wait_for(flusher._wait_for_work(), timeout=1.0)
+    assert flusher._listen_conn is None
+    assert loop.time() - started < 1.0
+
+    # LISTEN is tried again on the next idle wait
+    await asyncio.wait_for(flusher._wait_for_work(), timeout=1.0)
+    assert len(attempts) == 2
+
+
+class TrickleRepo(FlakyRepo):
+    """each claim returns the next scripted batch; records the limits asked"""
+
+    def __init__(self, *batches):
+        super().__init__()
+        self.batches = [[_event(i) for i in b] for b in batches]
+        self.limits = []
+
+    async def claim_pending_outbox(self, owner, limit, lease_seconds):
+        self.limits.append(limit)
+        return self.batches.pop(0) if self.batches else []
+
+
+@pytest.mark.asyncio
+async def test_partial_batch_is_topped_up_before_publishing():
+    repo = TrickleRepo([1], [2, 3])
+    flusher = OutboxFlusher(repo, redis_url="redis://unused", batch_size=4)
+    flusher.max_linger = 0.05
+    flusher._running = True
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    batch = await flusher._claim_batch()
+
+    assert [ev.id for ev in batch] == [1, 2, 3]
+    # one claim at the deadline, only for the missing rows
+    assert repo.limits == [4, 3]
+    assert loop.time() - started >= 0.05
+
+
+@pytest.mark.asyncio
+async def test_notify_during_linger_fills_the_batch_early():
+    repo = TrickleRepo([1], [2, 3])
+    flusher = OutboxFlusher(repo, redis_url="redis://unused", batch_size=3)
+    flusher.max_linger = 5.0
+    flusher._running = True
+
+    asyncio.get_running_loop().call_later(0.01, flusher._wakeup.set)
+    batch = await asyncio.wait_for(flusher._claim_batch(), timeout=1.0)
+
+    assert [ev.id for ev in batch] == [1, 2, 3]
+    assert repo.limits == [3, 2]
+
+
+@pytest.mark.asyncio
+async def test_full_or_empty_claim_does_not_linger():
+    flusher = OutboxFlusher(
+        TrickleRepo([1, 2]), redis_url="redis://unused", batch_size=2
+    )
+    flusher.max_linger = 5.0
+    flusher._running = True
+
+    assert len(await asyncio.wait_for(flusher._claim_batch(), timeout=1.0)) == 2
+    assert await asyncio.wait_for(flusher._claim_batch(), timeout=1.0) == []
@@ -0,0 +1,71 @@
+# tests/test_idempotency_unit.py
+import uuid
+
+import pytest
+
+from app.domain.services_async import TaskServiceAsync
+from app.infra.redis.idempotency import IdempotencyStore
+from tests import conftest
+
+
+class FakeRedis(conftest.FakeRedis):
+    def __init__(self):
+        self.data = {}
+
+    async def set(self, key, value, nx=False, ex=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value.encode() if isinstance(value, str) else value
+        return True
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def delete(self, *keys):
+        for k in keys:
+            self.data.pop(k, None)
+
+
+class FakeRepo:
+    def __init__(self):
+        self.keys = {}
+        self.inserts = 0
+
+    async def add_tasks_with_outbox(self, tasks, events, idempotency_key=None):
+        if idempotency_key in self.keys:
+            return self.keys[idempotency_key]
+        self.keys[idempotency_key] = [t.id for t in tasks]
+        self.inserts += 1
+        return None
+
+
+def make_service():
+    store = IdempotencyStore(redis_url="redis://unused", ttl=60)
+    store._client = FakeRedis()
+    return TaskServiceAsync(FakeRepo(), idempotency=store), store
+
+
+ITEMS = [("t", {}, None, None)]
+
+
+@pytest.mark.asyncio
+async def test_repeated_key_returns_original_ids_from_redis():
+    svc, _ = make_service()
+    ids, replayed = await svc.create_tasks_once("k", ITEMS)
+    again, replayed_again = await svc.create_tasks_once("k", ITEMS)
+
+    assert not replayed and replayed_again
+    assert again == ids and isinstance(ids[0], uuid.UUID)
+    assert svc.repo.inserts == 1
+
+
+@pytest.mark.asyncio
+async def test_postgres_decides_when_redis_lost_the_key():
+    svc, store = make_service()
+    ids, _ = await svc.create_tasks_once("k", ITEMS)
+    store._client.data.clear()
+
+    again, replayed = await svc.create_tasks_once("k", ITEMS)
+
+    assert replayed and again == ids
+    assert svc.repo.inserts == 1
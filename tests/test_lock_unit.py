@@ -0,0 +1,66 @@
+# tests/test_lock_unit.py
+import pytest
+
+from app.infra.redis.lock import (
+    ACQUIRE_SCRIPT,
+    RELEASE_SCRIPT,
+    RENEW_SCRIPT,
+    LockManager,
+    RedisLock,
+)
+
+
+class ScriptRedis:
+    """emulates the lock scripts in memory and counts script calls"""
+
+    def __init__(self):
+        self.data = {}
+        self.calls = []
+
+    def register_script(self, source):
+        name = {
+            ACQUIRE_SCRIPT: "acquire",
+            RELEASE_SCRIPT: "release",
+            RENEW_SCRIPT: "renew",
+        }[source]
+
+        async def run(keys, args):
+            self.calls.append((name, len(keys)))
+            if name == "acquire":
+                if keys[0] in self.data:
+                    return None
+                self.data[keys[0]] = args[0]
+                self.data[keys[1]] = self.data.get(keys[1], 0) + 1
+                return self.data[keys[1]]
+            if name == "release":
+                if self.data.get(keys[0]) == args[0]:
+                    del self.data[keys[0]]
+                    return 1
+                return 0
+            return [int(self.data.get(k) == v) for k, v in zip(keys, args[1:])]
+
+        return run
+
+
+@pytest.mark.asyncio
+async def test_locks_are_renewed_together_and_tokens_grow():
+    r = ScriptRedis()
+    manager = LockManager(r, ttl=60000, batch_size=2)
+    locks = [RedisLock(r, f"task-lock:{i}", manager=manager) for i in range(5)]
+    for lock in locks:
+        assert await lock.acquire()
+    assert not await RedisLock(r, "task-lock:0", manager=manager).acquire()
+    assert [lock.token for lock in locks] == [1, 2, 3, 4, 5]
+
+    # someone else took task-lock:3 after it expired
+    r.data["task-lock:3"] = "other"
+    r.calls.clear()
+    await manager.renew_once()
+
+    assert r.calls == [("renew", 2), ("renew", 2), ("renew", 1)]
+    assert locks[3].lost and not locks[2].lost
+
+    for lock in locks:
+        await lock.release()
+    assert r.data["task-lock:3"] == "other"
+    await manager.close()
@@ -0,0 +1,69 @@
+import pytest
+from prometheus_client import REGISTRY
+from redis.exceptions import ResponseError
+
+from app.infra.monitoring.collector import MetricsCollector
+from tests import conftest
+
+
+class FakeRepo:
+    def __init__(self):
+        self.state_queries = []
+
+    async def outbox_backlog(self):
+        return 1234, 42.5
+
+    async def count_tasks_by_state(self, states=None):
+        self.state_queries.append(states)
+        counts = {"pending": 7, "running": 2, "processed": 900}
+        if states is None:
+            return counts
+        return {s: c for s, c in counts.items() if s in states}
+
+
+class FakeRedis(conftest.FakeRedis):
+    def __init__(self, streams):
+        self.streams = streams
+
+    async def xlen(self, stream):
+        return len(self.streams.get(stream, {}).get("entries", []))
+
+    async def xinfo_groups(self, stream):
+        if stream not in self.streams:
+            raise ResponseError("no such key")
+        return self.streams[stream]["groups"]
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels)
+
+
+@pytest.mark.asyncio
+async def test_collects_true_backlog_from_outbox_streams_and_tasks():
+    repo = FakeRepo()
+    c = MetricsCollector(repo, streams=["m:s", "m:missing"], terminal_interval=60)
+    c._client = FakeRedis(
+        {
+            "m:s": {
+                "entries": [1, 2, 3],
+                "groups": [{"name": b"g", "pending": 4, "lag": 9}],
+            }
+        }
+    )
+
+    await c.collect_once(now=0)
+    assert sample("samurai_outbox_pending") == 1234
+    assert sample("samurai_outbox_oldest_unpublished_seconds") == 42.5
+    assert sample("samurai_stream_length", stream="m:s") == 3
+    assert sample("samurai_stream_length", stream="m:missing") == 0
+    assert sample("samurai_stream_pel_size", stream="m:s", group="g") == 4
+    assert sample("samurai_stream_lag", stream="m:s", group="g") == 9
+    assert sample("samurai_tasks_by_state", state="processed") == 900
+    assert sample("samurai_tasks_by_state", state="failed") == 0
+    assert sample("samurai_tasks_by_state", state="retrying") == 0
+
+    # finished states are only recounted after terminal_interval
+    await c.collect_once(now=30)
+    assert repo.state_queries[-1] == ("pending", "running", "retrying")
+    await c.collect_once(now=61)
+    assert repo.state_queries[-1] is None
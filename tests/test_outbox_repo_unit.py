@@ -0,0 +1,128 @@
+# tests/test_outbox_repo_unit.py
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from tests.conftest import FakeSession, compiled, make_repo
+
+
+@pytest.mark.asyncio
+async def test_claim_takes_only_free_or_expired_leases_in_one_statement():
+    t0 = datetime(2024, 1, 1)
+    rows = [
+        SimpleNamespace(id=2, created_at=t0),
+        SimpleNamespace(id=1, created_at=t0),
+        SimpleNamespace(id=3, created_at=t0 - timedelta(seconds=1)),
+    ]
+    session = FakeSession(rows)
+
+    claimed = await make_repo(session).claim_pending_outbox(
+        "f1", limit=10, lease_seconds=30
+    )
+
+    (stmt,) = session.statements
+    sql, params = compiled(stmt)
+    # exclusivity: rows locked by a concurrent claim are skipped, not shared
+    assert sql.startswith("UPDATE outbox_events SET locked_by=")
+    assert "FOR UPDATE SKIP LOCKED" in sql
+    # expiry takeover: a lease that ran out is claimable again
+    assert (
+        "outbox_events.locked_until IS NULL OR outbox_events.locked_until < now()"
+        in sql
+    )
+    assert "locked_until=(now() + " in sql
+    assert "RETURNING" in sql
+    assert "f1" in params.values() and timedelta(seconds=30) in params.values()
+    assert 10 in params.values()
+    assert [r.id for r in claimed] == [3, 1, 2]
+
+
+@pytest.mark.asyncio
+async def test_release_is_scoped_to_the_owner_and_unpublished_rows():
+    session = FakeSession()
+    repo = make_repo(session)
+
+    await repo.release_outbox_claims([], "f1")
+    assert session.statements == []
+
+    await repo.release_outbox_claims([4, 5], "f1")
+    (stmt,) = session.statements
+    sql, params = compiled(stmt)
+    assert sql.startswith("UPDATE outbox_events SET locked_by=%(locked_by)s")
+    assert "outbox_events.locked_by = %(locked_by_1)s" in sql
+    assert "outbox_events.published = false" in sql
+    assert params["locked_by"] is None and params["locked_until"] is None
+    assert params["locked_by_1"] == "f1"
+    assert params["id_1"] == [4, 5]
+
+
+@pytest.mark.asyncio
+async def test_archive_deletes_one_bounded_batch_of_old_published_rows():
+    session = FakeSession(rowcount=3)
+    cutoff = datetime(2024, 1, 1)
+
+    n = await make_repo(session).archive_published_outbox(cutoff, limit=100)
+
+    (stmt,) = session.statements
+    sql, params = compiled(stmt)
+    assert n == 3
+    assert sql.startswith("DELETE FROM outbox_events WHERE outbox_events.id IN (SELECT")
+    assert "outbox_events.published = true" in sql
+    assert "outbox_events.published_at < %(published_at_1)s" in sql
+    assert "ORDER BY outbox_events.published_at LIMIT %(param_1)s" in sql
+    assert sql.endswith("FOR UPDATE SKIP LOCKED)")
+    assert "outbox_events_archive" not in sql and "RETURNING" not in sql
+    assert params["published_at_1"] == cutoff and params["param_1"] == 100
+
+
+@pytest.mark.asyncio
+async def test_archive_moves_the_batch_in_one_statement():
+    from app.infra.db.sqlalchemy_models import EventOutboxArchiveORM
+
+    session = FakeSession(rowcount=2)
+
+    n = await make_repo(session).archive_published_outbox(
+        datetime(2024, 1, 1), limit=50, archive=True
+    )
+
+    (stmt,) = session.statements
+    sql, params = compiled(stmt)
+    cols = ", ".join(c.name for c in EventOutboxArchiveORM.__table__.columns)
+    assert n == 2
+    assert sql.startswith("WITH moved AS (DELETE FROM outbox_events WHERE")
+    assert "LIMIT %(param_1)s" in sql and "FOR UPDATE SKIP LOCKED" in sql
+    # every archive column is carried over, from the deleted rows only
+    assert f"INSERT INTO outbox_events_archive ({cols}) SELECT moved.id," in sql
+    assert "RETURNING outbox_events.id, outbox_events.stream," in sql
+    assert sql.endswith("FROM moved")
+    assert params["param_1"] == 50
+
+
+@pytest.mark.asyncio
+async def test_batch_create_uses_bounded_multi_row_inserts(monkeypatch):
+    from app.domain.models import Task
+    from app.infra.db import repo_async
+    from app.settings import settings
+
+    monkeypatch.setattr(repo_async, "INSERT_CHUNK_ROWS", 2)
+    monkeypatch.setattr(settings, "outbox_notify", False)
+    session = FakeSession()
+    tasks = [Task.new(f"t{i}", {"i": i}) for i in range(5)]
+    events = [{"stream": "s", "event_type": "task.created"} for _ in tasks]
+
+    await make_repo(session).add_tasks_with_outbox(tasks, events)
+
+    inserts = [compiled(s) for s in session.statements]
+    assert [sql.split(" (")[0] for sql, _ in inserts] == [
+        "INSERT INTO tasks",
+        "INSERT INTO tasks",
+        "INSERT INTO tasks",
+        "INSERT INTO outbox_events",
+        "INSERT INTO outbox_events",
+        "INSERT INTO outbox_events",
+    ]
+    # one statement per chunk, every row in its VALUES list
+    rows = [sql.split(" VALUES ")[1].count("), (") + 1 for sql, _ in inserts]
+    assert rows == [2, 2, 1, 2, 2, 1]
+    first, params = inserts[0]
+    assert params["id_m0"] == tasks[0].id and params["id_m1"] == tasks[1].id
@@ -0,0 +1,104 @@
+# tests/test_payload_store_unit.py
+import pytest
+from app.infra.db import payload_store
+from app.infra.db.payload_store import PayloadResolver, inflate, is_ref, offload
+
+
+def test_small_payload_stays_inline():
+    payload = {"a": 1}
+    stored, blob = offload(payload)
+    assert stored is payload and blob is None
+
+
+def test_large_payload_is_compressed_and_referenced(monkeypatch):
+    monkeypatch.setattr(payload_store.settings, "payload_offload_threshold", 1024)
+    payload = {"rows": [{"sku": f"SKU-{i}", "qty": i % 5} for i in range(500)]}
+
+    ref, blob = offload(payload)
+
+    assert is_ref(ref) and ref["$blob"] == blob["digest"]
+    assert len(blob["data"]) < blob["size"]
+    assert inflate(blob["codec"], blob["data"]) == payload
+    # content addressed: same payload, same digest
+    assert offload(payload)[1]["digest"] == blob["digest"]
+
+
+@pytest.mark.asyncio
+async def test_resolver_loads_each_blob_once():
+    class Repo:
+        calls = 0
+
+        async def load_payload_blobs(self, digests):
+            Repo.calls += 1
+            return {d: {"big": True} for d in digests}
+
+    resolver = PayloadResolver(Repo())
+    assert await resolver.resolve({"x": 1}) == {"x": 1}
+    for _ in range(3):
+        assert await resolver.resolve({"$blob": DIGEST, "size": 10}) == {"big": True}
+    assert Repo.calls == 1
+
+
+DIGEST = "ab" * 32
+
+
+def test_only_the_exact_reference_shape_is_a_reference():
+    assert is_ref({"$blob": DIGEST, "size": 10})
+    assert not is_ref({"$blob": "abc", "size": 10})
+    assert not is_ref({"$blob": DIGEST, "size": 10, "note": "x"})
+    assert not is_ref({"$blob": DIGEST})
+    # a client payload merely using the key stays inline and is not resolved
+    payload = {"$blob": "my own data"}
+    assert offload(payload) == (payload, None)
+
+
+def test_client_payload_shaped_like_a_reference_is_stored_out_of_line():
+    payload = {"$blob": DIGEST, "size": 10}
+
+    ref, blob = offload(payload)
+
+    assert ref != payload and is_ref(ref)
+    assert inflate(blob["codec"], blob["data"]) == payload
+
+
+@pytest.mark.asyncio
+async def test_missing_blob_keeps_the_reference():
+    class Repo:
+        async def load_payload_blobs(self, digests):
+            return {}
+
+    ref = {"$blob": DIGEST, "size": 10}
+    assert await PayloadResolver(Repo()).resolve(ref) == ref
+
+
+@pytest.mark.asyncio
+async def test_list_pages_keep_references_and_single_reads_inflate():
+    from datetime import datetime
+    from types import SimpleNamespace
+    from app.infra.db.repo_async import AsyncTaskRepository
+    from tests.conftest import FakeSession, make_repo
+
+    def row(payload):
+        return SimpleNamespace(
+            id=1,
+            name="t",
+            payload=payload,
+            state="pending",
+            attempts=0,
+            last_error=None,
+            version=0,
+            created_at=datetime(2024, 1, 1),
+            updated_at=None,
+        )
+
+    ref = {"$blob": DIGEST, "size": 10}
+    session = FakeSession([row(ref)])
+    (task,) = await make_repo(session).list_tasks()
+    # one query for the page, no blob is loaded or decompressed
+    assert len(session.statements) == 1
+    assert task.payload == ref
+
+    to_domain = AsyncTaskRepository._to_domain
+    assert to_domain(row(ref), {DIGEST: {"big": True}}).payload == {"big": True}
+    # a reference whose blob is gone is returned as stored, not a KeyError
+    assert to_domain(row(ref), {"cd" * 32: {}}).payload == ref
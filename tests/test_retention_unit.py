@@ -0,0 +1,38 @@
+# tests/test_retention_unit.py
+import pytest
+from app.infra.event_bus.retention import StreamTrimmer, parse_id
+from tests import conftest
+
+
+class FakeRedis(conftest.FakeRedis):
+    def __init__(self, groups, pel_min):
+        self.groups = groups
+        self.pel_min = pel_min
+
+    async def xinfo_groups(self, stream):
+        return self.groups
+
+    async def xpending(self, stream, group):
+        return {"pending": 1, "min": self.pel_min[group]}
+
+
+def test_parse_id_orders_numerically():
+    assert parse_id(b"10-0") > parse_id("9-5")
+    assert parse_id("9-10") > parse_id("9-9")
+
+
+@pytest.mark.asyncio
+async def test_boundary_is_slowest_group():
+    r = FakeRedis(
+        groups=[
+            {"name": b"fast", "pending": 0, "last-delivered-id": b"200-0"},
+            {"name": b"slow", "pending": 3, "last-delivered-id": b"150-0"},
+        ],
+        pel_min={b"slow": b"90-1"},
+    )
+    assert await StreamTrimmer(["s"]).safe_min_id(r, "s") == "90-1"
+
+
+@pytest.mark.asyncio
+async def test_stream_without_groups_is_never_trimmed():
+    assert await StreamTrimmer(["s"]).safe_min_id(FakeRedis([], {}), "s") is None
@@ -0,0 +1,120 @@
+# tests/test_scheduler_unit.py
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from app.infra.outbox.flusher import OutboxFlusher
+from app.infra.event_bus.scheduler import item_key, schedule, schedule_key
+from app.settings import settings
+from tests import conftest
+
+
+class FakeRedis(conftest.FakeRedis):
+    def __init__(self):
+        self.streams, self.hashes, self.zsets = {}, {}, {}
+
+    async def xadd(self, stream, fields):
+        self.streams.setdefault(stream, []).append(fields)
+        return b"1-%d" % len(self.streams[stream])
+
+    async def hset(self, key, mapping):
+        self.hashes[key] = mapping
+        return len(mapping)
+
+    async def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+        return len(mapping)
+
+
+class FakeRepo:
+    def __init__(self):
+        self.published = []
+
+    async def mark_outbox_published_bulk(self, pairs):
+        self.published.extend(pairs)
+
+
+def _event(id, run_at=None):
+    return SimpleNamespace(
+        id=id,
+        stream=settings.stream_name,
+        event_type="task.created",
+        payload={"task_id": f"t{id}", "name": "n", "payload": {}},
+        created_at=datetime.now(timezone.utc),
+        run_at=run_at,
+    )
+
+
+@pytest.mark.asyncio
+async def test_flusher_hands_future_events_to_scheduler():
+    r, repo = FakeRedis(), FakeRepo()
+    flusher = OutboxFlusher(repo, redis_url="redis://unused")
+    later = datetime.now(timezone.utc) + timedelta(hours=1)
+    past = datetime.now(timezone.utc) - timedelta(seconds=1)
+
+    await flusher._publish_batch(r, [_event(1), _event(2, later), _event(3, past)])
+
+    # due-now and overdue rows go straight to the stream
+    assert sum(len(v) for v in r.streams.values()) == 2
+    (key,) = r.zsets
+    assert key == schedule_key(flusher._target_stream(_event(2)))
+    zset = r.zsets[key]
+    assert list(zset) == ["2"]
+    assert zset["2"] == pytest.approx(later.timestamp())
+    assert r.hashes[item_key(key, 2)]["type"] == "task.created"
+    assert dict(repo.published)[2] == "scheduled:2"
+    assert {i for i, _ in repo.published} == {1, 2, 3}
+
+
+def test_scheduled_keys_share_the_slot_of_their_stream():
+    from redis.crc import key_slot
+
+    r = FakeRedis()
+    pipe = r.pipeline()
+    for stream in ("tasks:events:0", "tasks:events:high:7"):
+        schedule(pipe, stream, {"type": "t"}, 1.0, "retry:x:1")
+    for _, (key, *_), _ in pipe.calls:
+        stream = key[key.index("{") + 1 : key.index("}")]
+        assert key_slot(key.encode()) == key_slot(stream.encode())
+
+
+@pytest.mark.asyncio
+async def test_move_due_moves_only_due_entries_into_their_stream(lua_redis):
+    from app.infra.event_bus.scheduler import MOVE_DUE, DelayedScheduler
+
+    sched = DelayedScheduler(key="sched", streams=["s:a", "s:b"])
+    sched._client = lua_redis
+    sched._script = lua_redis.register_script(MOVE_DUE)
+    async with lua_redis.pipeline(transaction=False) as pipe:
+        schedule(pipe, "s:a", {"type": "a1"}, 10.0, 1, key="sched")
+        schedule(pipe, "s:a", {"type": "a2"}, 100.0, 2, key="sched")
+        schedule(pipe, "s:b", {"type": "b1"}, 5.0, 1, key="sched")
+        await pipe.execute()
+
+    assert await sched.move_due(now=50.0) == 2
+
+    (_, a1), *rest = await lua_redis.xrange("s:a")
+    assert a1 == {b"type": b"a1"} and rest == []
+    assert [f for _, f in await lua_redis.xrange("s:b")] == [{b"type": b"b1"}]
+    zset = schedule_key("s:a", "sched")
+    assert await lua_redis.zrange(zset, 0, -1) == [b"2"]
+    assert not await lua_redis.exists(item_key(zset, 1))
+
+    # an id read as due but re-scheduled meanwhile stays where it is
+    moved = await sched._script(keys=[zset, "s:a", item_key(zset, 2)], args=[50.0, 2])
+    assert moved == 0 and await lua_redis.exists(item_key(zset, 2))
+
+
+def test_retry_backoff_grows_with_jitter_and_cap():
+    from app.infra.event_bus.retry import RetryPolicy, parse_limits
+
+    policy = RetryPolicy(max_attempts=5, base=1.0, cap=8.0, limits={})
+    for attempt, delay in [(1, 1.0), (2, 2.0), (3, 4.0), (4, 8.0), (10, 8.0)]:
+        for _ in range(20):
+            assert delay / 2 <= policy.backoff(attempt) <= delay
+
+    policy.limits = parse_limits("email:10, report:2")
+    assert policy.attempts_for("email") == 10
+    assert policy.attempts_for("report") == 2
+    assert policy.attempts_for("other") == 5
@@ -0,0 +1,23 @@
+from app.infra.db.schema import upgrade_statements
+
+
+def test_upgrade_adds_new_columns_and_indexes_idempotently():
+    statements = upgrade_statements()
+
+    assert all("IF NOT EXISTS" in s for s in statements)
+    assert (
+        "ALTER TABLE tasks ADD COLUMN IF NOT EXISTS version INTEGER DEFAULT '0' NOT NULL"
+        in statements
+    )
+    for column in ("fence_token", "locked_by", "locked_until", "run_at"):
+        assert any(f"ADD COLUMN IF NOT EXISTS {column} " in s for s in statements)
+    indexes = [s for s in statements if s.startswith("CREATE INDEX")]
+    assert len(indexes) == 5
+    assert any(
+        "ix_outbox_unpublished_created_at_id" in s and "WHERE published = false" in s
+        for s in indexes
+    )
+    # columns come before the indexes that may use them
+    assert statements.index(indexes[0]) > max(
+        i for i, s in enumerate(statements) if s.startswith("ALTER")
+    )
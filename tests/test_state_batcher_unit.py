@@ -0,0 +1,97 @@
+# tests/test_state_batcher_unit.py
+import asyncio
+import uuid
+import pytest
+from app.infra.db.state_batcher import TaskStateBatcher
+
+
+class FakeRepo:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def update_task_states(self, transitions):
+        if self.fail:
+            raise RuntimeError("db down")
+        self.calls.append(dict(transitions))
+
+
+@pytest.mark.asyncio
+async def test_transitions_are_coalesced_into_bounded_batches():
+    repo = FakeRepo()
+    batcher = TaskStateBatcher(repo, max_rows=3, max_delay=0.01)
+    ids = [uuid.uuid4() for _ in range(7)]
+
+    await asyncio.gather(*[batcher.submit(i, "processed") for i in ids])
+    await batcher.stop()
+
+    assert [len(c) for c in repo.calls] == [3, 3, 1]
+    assert set().union(*repo.calls) == set(ids)
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_propagates_to_every_caller():
+    batcher = TaskStateBatcher(FakeRepo(fail=True), max_rows=10, max_delay=0.01)
+
+    results = await asyncio.gather(
+        batcher.submit(uuid.uuid4(), "processed"),
+        batcher.submit(uuid.uuid4(), "processed"),
+        return_exceptions=True,
+    )
+    await batcher.stop()
+
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_stale_fencing_token_fails_only_its_caller():
+    from app.domain.exceptions import StaleFencingTokenError
+
+    class FencedRepo(FakeRepo):
+        async def update_task_states(self, transitions):
+            await super().update_task_states([t[:2] for t in transitions])
+            return [t[0] for t in transitions if len(t) > 2 and t[2] < 10]
+
+    batcher = TaskStateBatcher(FencedRepo(), max_rows=10, max_delay=0.01)
+    results = await asyncio.gather(
+        batcher.submit(uuid.uuid4(), "processed", fence=3),
+        batcher.submit(uuid.uuid4(), "processed", fence=12),
+        batcher.submit(uuid.uuid4(), "processed"),
+        return_exceptions=True,
+    )
+    await batcher.stop()
+
+    assert isinstance(results[0], StaleFencingTokenError)
+    assert results[1:] == [None, None]
+
+
+@pytest.mark.asyncio
+async def test_version_conflict_fails_the_conditional_transition():
+    from app.domain.exceptions import TaskStateConflictError
+
+    class VersionedRepo(FakeRepo):
+        versions = {}
+
+        async def update_task_states(self, transitions):
+            self.calls.append(list(transitions))
+            return [
+                t.task_id
+                for t in transitions
+                if len(t) > 2 and t.version != self.versions[t.task_id]
+            ]
+
+    repo = VersionedRepo()
+    current, moved_on = uuid.uuid4(), uuid.uuid4()
+    repo.versions.update({current: 2, moved_on: 5})
+    batcher = TaskStateBatcher(repo, max_rows=10, max_delay=0.01)
+
+    results = await asyncio.gather(
+        batcher.submit(current, "processed", expected_state="running", version=2),
+        batcher.submit(moved_on, "processed", expected_state="running", version=4),
+        return_exceptions=True,
+    )
+    await batcher.stop()
+
+    assert results[0] is None
+    assert isinstance(results[1], TaskStateConflictError)
+    assert {t.expected_state for t in repo.calls[0]} == {"running"}
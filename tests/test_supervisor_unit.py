@@ -0,0 +1,163 @@
+import pytest
+
+from app.workers.supervisor import WorkerSupervisor, desired_workers
+from tests import conftest
+
+
+class FakeProc:
+    def __init__(self, name):
+        self.name = name
+        self.pid = 1
+        self.alive = True
+        self.exitcode = None
+        self.terminated = False
+
+    def is_alive(self):
+        return self.alive
+
+    def terminate(self):
+        self.terminated = True
+        self.alive = False
+        self.exitcode = 0
+
+    def kill(self):
+        self.alive = False
+
+
+class GroupRedis(conftest.FakeRedis):
+    def __init__(self):
+        self.lag = 0
+        self.pending = {}  # consumer -> pending entries
+        self.deleted = []
+
+    async def xinfo_groups(self, stream):
+        return [{"name": b"g", "lag": self.lag, "pending": sum(self.pending.values())}]
+
+    async def xinfo_consumers(self, stream, group):
+        return [{"name": n.encode(), "pending": p} for n, p in self.pending.items()]
+
+    async def xgroup_delconsumer(self, stream, group, name):
+        self.deleted.append(name)
+        return 0
+
+
+def make_supervisor(redis):
+    procs = []
+
+    def spawn(name, port):
+        procs.append(FakeProc(name))
+        return procs[-1]
+
+    sup = WorkerSupervisor(
+        streams=["s"], spawn=spawn, min_workers=1, max_workers=4, backlog_per_worker=100
+    )
+    sup.group = "g"
+    sup.scale_down_delay = 10
+    sup._client = redis
+    return sup, procs
+
+
+def test_consumer_names_are_stable_per_supervisor_id(monkeypatch):
+    from app.settings import settings
+
+    monkeypatch.setattr(settings, "supervisor_id", "")
+    restarted, _ = make_supervisor(GroupRedis())
+    first, _ = make_supervisor(GroupRedis())
+    # same host, same id: a restart comes back under the same names
+    assert first.consumer_name(0) == restarted.consumer_name(0)
+
+    monkeypatch.setattr(settings, "supervisor_id", "pool-b")
+    other, _ = make_supervisor(GroupRedis())
+    assert other.consumer_name(0) != first.consumer_name(0)
+    assert other.owns(other.consumer_name(3))
+    assert not other.owns(first.consumer_name(3))
+    assert not other.owns(other.consumer_name(3) + "x")
+
+
+@pytest.mark.asyncio
+async def test_stop_removes_idle_consumers_of_the_pool():
+    redis = GroupRedis()
+    sup, procs = make_supervisor(redis)
+    redis.lag = 200
+    await sup.tick(now=0)
+    busy, idle = sup.consumer_name(0), sup.consumer_name(1)
+    redis.pending = {busy: 2, idle: 0, "someone-else-0": 0}
+
+    await sup.stop()
+
+    assert all(p.terminated for p in procs)
+    # entries of the busy one wait for a live worker to reclaim them
+    assert redis.deleted == [idle]
+
+
+@pytest.mark.asyncio
+async def test_consumers_left_by_an_earlier_run_are_removed_once_idle():
+    redis = GroupRedis()
+    sup, _ = make_supervisor(redis)
+    left = sup.consumer_name(3)
+    redis.pending = {sup.consumer_name(0): 0, left: 1, "someone-else-3": 0}
+    sup._start(0)
+
+    await sup.find_stale()
+    assert sup._stale == {left}
+    await sup.tick(now=0)
+    assert redis.deleted == []
+
+    redis.pending[left] = 0
+    await sup.tick(now=1)
+    assert redis.deleted == [left]
+    assert not sup._stale
+
+
+def test_desired_workers_is_clamped():
+    assert desired_workers(0, 1, 4, 100) == 1
+    assert desired_workers(250, 1, 4, 100) == 3
+    assert desired_workers(10_000, 1, 4, 100) == 4
+
+
+@pytest.mark.asyncio
+async def test_scales_with_backlog_and_restarts_crashed_workers():
+    redis = GroupRedis()
+    sup, procs = make_supervisor(redis)
+
+    redis.lag = 300
+    await sup.tick(now=0)
+    assert sorted(sup._workers) == [0, 1, 2]
+    assert len({w.name for w in sup._workers.values()}) == 3
+
+    # a crash is restarted under the same name after the backoff
+    procs[1].alive = False
+    await sup.tick(now=1)
+    assert sup._workers[1].proc is procs[1]
+    await sup.tick(now=3)
+    assert sup._workers[1].proc is procs[3]
+    assert procs[3].name == procs[1].name
+
+
+@pytest.mark.asyncio
+async def test_retired_consumer_is_deleted_after_its_pel_drains():
+    redis = GroupRedis()
+    sup, procs = make_supervisor(redis)
+    redis.lag = 200
+    await sup.tick(now=0)
+    retired_name = sup._workers[1].name
+
+    # backlog gone: one worker retired per scale-down delay, not before it
+    redis.lag = 0
+    redis.pending = {retired_name: 3}
+    await sup.tick(now=5)
+    assert len(sup._workers) == 2
+    await sup.tick(now=10)
+    assert list(sup._workers) == [0]
+    assert procs[1].terminated
+    assert redis.deleted == []
+
+    # its name is not reused while it still owns entries
+    redis.lag = 200
+    await sup.tick(now=11)
+    assert retired_name not in {w.name for w in sup._workers.values()}
+
+    redis.pending = {}
+    await sup.tick(now=12)
+    assert redis.deleted == [retired_name]
+    assert not sup._retired
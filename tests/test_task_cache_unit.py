@@ -0,0 +1,96 @@
+# tests/test_task_cache_unit.py
+import uuid
+
+import pytest
+
+from app.domain.models import Task, TaskState
+from app.domain.services_async import TaskServiceAsync
+from app.infra.db.repo_async import TaskClaim
+from app.infra.redis.task_cache import SET_IF_NEWER, TaskCache
+
+
+class RowRepo:
+    def __init__(self, task):
+        self.task = task
+
+    async def get_task(self, task_id):
+        return self.task
+
+
+def make_cache(redis):
+    cache = TaskCache(redis_url="redis://unused", ttl=30, active_ttl=2)
+    cache._client = redis
+    cache._set_if_newer = redis.register_script(SET_IF_NEWER)
+    return cache
+
+
+def _task(state, version):
+    return Task(id=uuid.UUID(int=1), name="n", payload={}, state=state, version=version)
+
+
+@pytest.mark.asyncio
+async def test_fill_is_version_guarded_and_short_lived_while_active(lua_redis):
+    cache = make_cache(lua_redis)
+    key = cache.key(uuid.UUID(int=1))
+
+    await cache.set(_task(TaskState.PROCESSED, 3))
+    assert await lua_redis.ttl(key) == 30
+
+    # a reader that loaded the row before the transition writes late: ignored
+    await cache.set(_task(TaskState.RUNNING, 2))
+    assert (await cache.get(uuid.UUID(int=1))).state == TaskState.PROCESSED
+
+    await cache.invalidate([uuid.UUID(int=1)])
+    await cache.set(_task(TaskState.RUNNING, 2))
+    assert await lua_redis.ttl(key) == 2
+    assert (await cache.get(uuid.UUID(int=1))).state == TaskState.RUNNING
+
+
+@pytest.mark.asyncio
+async def test_read_through_serves_the_cached_snapshot(lua_redis):
+    cache = make_cache(lua_redis)
+    service = TaskServiceAsync(RowRepo(_task(TaskState.PENDING, 0)), cache=cache)
+
+    first = await service.get_task(uuid.UUID(int=1))
+    service.repo = None  # a second read must not hit the database
+    assert await service.get_task(uuid.UUID(int=1)) == first
+
+
+@pytest.mark.asyncio
+async def test_claim_and_failure_invalidate_the_snapshot(monkeypatch):
+    from app.infra.event_bus.retry import RetryEngine, RetryPolicy
+    from app.workers import consumer_entrypoint as worker
+
+    class Recorder:
+        def __init__(self):
+            self.invalidated = []
+
+        async def invalidate(self, ids):
+            self.invalidated.extend(ids)
+
+    class Repo:
+        async def claim_task(self, task_id, stale_after):
+            return TaskClaim(1, TaskState.RUNNING)
+
+        async def record_task_failure(self, task_id, error, max_attempts):
+            return 1, TaskState.FAILED
+
+    class Batcher:
+        async def submit(self, *args, **kwargs):
+            pass
+
+    cache = Recorder()
+    monkeypatch.setattr(worker, "task_repo", Repo())
+    monkeypatch.setattr(worker, "task_cache", cache)
+    monkeypatch.setattr(worker, "state_batcher", Batcher())
+    monkeypatch.setattr(worker.asyncio, "sleep", _no_sleep)
+    await worker.handle("task.created", "t1", {}, None)
+
+    engine = RetryEngine(Repo(), policy=RetryPolicy(max_attempts=1), cache=cache)
+    await engine.on_failure(None, "s", "task.created", "t2", {}, RuntimeError("x"))
+
+    assert cache.invalidated == ["t1", "t2"]
+
+
+async def _no_sleep(_):
+    pass
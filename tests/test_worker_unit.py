@@ -0,0 +1,82 @@
+import pytest
+from pydantic import ValidationError
+
+from app.domain.models import TaskState
+from app.infra.db.repo_async import TaskClaim
+from app.infra.event_bus.consumer import LeavePending
+from app.settings import Settings
+from app.workers import consumer_entrypoint as worker
+
+
+class ClaimRepo:
+    def __init__(self, claim):
+        self.claim = claim
+
+    async def claim_task(self, task_id, stale_after):
+        return self.claim
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "claim", [TaskClaim(None, TaskState.PROCESSED), TaskClaim(None, None)]
+)
+async def test_finished_or_unknown_task_is_acked_without_running(monkeypatch, claim):
+    monkeypatch.setattr(worker, "task_repo", ClaimRepo(claim))
+    # returns normally: the consumer acks the message
+    await worker.handle(
+        "task.created", "00000000-0000-0000-0000-000000000001", {}, None
+    )
+
+
+@pytest.mark.asyncio
+async def test_task_running_elsewhere_stays_pending(monkeypatch):
+    claim = TaskClaim(None, TaskState.RUNNING)
+    monkeypatch.setattr(worker, "task_repo", ClaimRepo(claim))
+    with pytest.raises(LeavePending):
+        await worker.handle(
+            "task.created", "00000000-0000-0000-0000-000000000001", {}, None
+        )
+
+
+def test_run_timeout_must_be_below_reclaim_idle():
+    with pytest.raises(ValidationError):
+        Settings(task_run_timeout=60, consumer_reclaim_idle_ms=60000)
+    assert Settings(task_run_timeout=30, consumer_reclaim_idle_ms=60000)
+
+
+@pytest.mark.asyncio
+async def test_maintenance_runs_each_singleton_loop_and_stops_them(monkeypatch):
+    import asyncio
+    from app.workers import maintenance_entrypoint as maintenance
+
+    started, stopped = [], []
+
+    def fake_loop(name):
+        async def loop():
+            started.append(name)
+            try:
+                await asyncio.Event().wait()
+            finally:
+                stopped.append(name)
+
+        return loop
+
+    monkeypatch.setattr(maintenance, "start_http_server", lambda port: None)
+    monkeypatch.setattr(
+        maintenance, "LOOPS", {n: fake_loop(n) for n in maintenance.LOOPS}
+    )
+    task = asyncio.create_task(maintenance.run())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    await task
+
+    assert sorted(started) == sorted(stopped) == sorted(maintenance.LOOPS)
+    assert {"metrics", "scheduler", "archiver", "retention"} <= set(maintenance.LOOPS)
+
+
+def test_singleton_loops_are_off_in_the_api_by_default():
+    fields = Settings.model_fields
+    assert fields["api_scheduler"].default is False
+    assert fields["api_archiver"].default is False
+    assert fields["api_stream_trimmer"].default is False
+    assert fields["api_metrics_collector"].default is False